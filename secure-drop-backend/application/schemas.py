@@ -45,6 +45,29 @@ class TokenUpdate(TokenBase):
     """
     pass
 
+class TokenBulkCreate(BaseModel):
+    """
+    批量创建令牌的请求体：所有令牌使用同一个策略模板。
+    """
+    count: int = Field(..., ge=1, le=100000, description="创建数量")
+    policy: TokenCreate
+
+class TokenFilter(BaseModel):
+    """
+    令牌筛选条件，与令牌列表接口的查询参数一致。
+    """
+    status: Optional[List[str]] = Field(None, description="令牌状态")
+    expires_after: Optional[datetime] = Field(None, description="过期时间不早于")
+    expires_before: Optional[datetime] = Field(None, description="过期时间早于")
+    q: Optional[str] = Field(None, max_length=200, description="按备注搜索或按令牌字符串精确匹配")
+
+class TokenBulkSelection(BaseModel):
+    """
+    批量撤销/删除的选择条件：令牌 ID 列表或筛选条件，二者选其一。
+    """
+    ids: Optional[List[int]] = Field(None, max_length=10000, description="令牌 ID 列表")
+    filter: Optional[TokenFilter] = Field(None, description="筛选条件（未提供 ids 时使用）")
+
 class TokenInDB(TokenBase):
     """
     从数据库读取的完整令牌模型。
@@ -54,6 +77,9 @@ class TokenInDB(TokenBase):
     status: str
     created_at: datetime
     current_usage_count: int
+    last_used_at: Optional[datetime] = None
+    uploaded_bytes: int = 0
+    policy_version: int = 1
 
     class Config:
         from_attributes = True # Pydantic v2, was orm_mode
@@ -125,9 +151,71 @@ class PaginatedResponse(BaseModel):
     """
     total: int
     items: List[TokenPublic]
+    next_cursor: Optional[str] = Field(None, description="下一页的游标，没有更多数据时为 null")
+
+class BulkOperationResponse(BaseModel):
+    """
+    批量操作的结果。
+    """
+    affected: int = Field(..., description="受影响的令牌数量")
 
 class MessageResponse(BaseModel):
     """
     简单的消息响应模型。
     """
     message: str
+    filename: Optional[str] = None
+
+# ================== File Listing Schemas ==================
+
+class FileEntry(BaseModel):
+    """
+    可下载文件的元数据。
+    """
+    name: str
+    size: int = Field(..., description="文件大小 (字节)")
+    modified_at: datetime = Field(..., description="最后修改时间 (UTC)")
+
+class FileListResponse(BaseModel):
+    """
+    分页的文件列表响应。
+    """
+    total: int
+    items: List[FileEntry]
+    next_cursor: Optional[str] = Field(None, description="下一页的游标，没有更多数据时为 null")
+
+class DownloadLinkRequest(BaseModel):
+    """
+    申请签名下载链接的请求体。
+    """
+    filenames: List[str] = Field(..., min_length=1, max_length=1000, description="要下载的文件名")
+
+class DownloadLink(BaseModel):
+    """
+    一个文件的签名下载链接。
+    """
+    filename: str
+    url: str = Field(..., description="无需认证头部即可访问的下载地址")
+    expires_at: datetime = Field(..., description="链接的过期时间 (UTC)")
+
+class DownloadLinksResponse(BaseModel):
+    links: List[DownloadLink]
+
+# ================== Upload Session Schemas ==================
+
+class UploadSessionCreate(BaseModel):
+    """
+    创建分块上传会话的请求体。
+    """
+    filename: str = Field(..., description="文件名")
+    size: int = Field(..., ge=0, description="文件总大小 (字节)")
+
+class UploadSessionStatus(BaseModel):
+    """
+    分块上传会话的状态。
+    """
+    upload_id: str
+    filename: str
+    size: int
+    offset: int = Field(..., description="从文件开头连续接收的字节数")
+    received_ranges: List[List[int]] = Field(..., description="已接收的字节区间 [start, end)")
@@ -0,0 +1,180 @@
+"""
+访问日志服务模块
+
+把访客的每一次操作记录到 `access_logs` 表。
+
+请求路径只把日志条目放进内存队列，不等待数据库；后台任务在累积到
+`ACCESS_LOG_BATCH_SIZE` 条或距第一条未写入的条目超过
+`ACCESS_LOG_FLUSH_INTERVAL_SECONDS` 秒时，用一条多行 INSERT 语句批量写入。
+
+队列已满时丢弃新的日志条目（而不是阻塞请求或占用更多内存），
+丢弃的数量会被计数并定期输出警告。应用关闭时会先写入队列中剩余的条目。
+"""
+import asyncio
+import datetime
+import time
+from typing import List, Optional
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from domain.models import AccessLog
+from domain.write_queue import write_queue
+from utils.config import settings
+from utils.logger import log
+from utils.metrics import registry
+
+# 访客操作类型
+LOGIN = "login"
+LOGIN_FAILED = "login_failed"
+LIST_FILES = "list_files"
+UPLOAD = "upload"
+UPLOAD_SESSION_CREATE = "upload_session_create"
+UPLOAD_SESSION_COMPLETE = "upload_session_complete"
+UPLOAD_SESSION_ABORT = "upload_session_abort"
+DOWNLOAD = "download"
+DOWNLOAD_ARCHIVE = "download_archive"
+
+# 丢弃日志时输出警告的最小间隔（秒）
+DROP_WARNING_INTERVAL = 60
+
+
+class AccessLogService:
+    """
+    批量、非阻塞的访问日志写入器。
+    """
+
+    def __init__(self, queue_size: int, batch_size: int, flush_interval: float):
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # 统计信息
+        self.written = 0
+        self.dropped = 0
+        self._last_drop_warning = 0.0
+
+    def start(self):
+        """
+        在当前事件循环中启动后台写入任务（已在运行时忽略）。
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._queue = asyncio.Queue(maxsize=self.queue_size)
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """
+        写入队列中剩余的日志后停止后台任务。
+        """
+        if self._task is None or self._task.done():
+            return
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    def record(
+        self,
+        action: str,
+        token_id: Optional[int] = None,
+        ip_address: Optional[str] = None,
+        details: Optional[str] = None,
+    ):
+        """
+        记录一次访客操作。立即返回，不等待写入数据库。
+
+        可以在事件循环中调用，也可以在同步端点所在的线程池线程中调用。
+        """
+        entry = {
+            "token_id": token_id,
+            "ip_address": ip_address,
+            "timestamp": datetime.datetime.utcnow(),
+            "action": action,
+            "details": details,
+        }
+        try:
+            running_loop = asyncio.get_running_loop()
+        except RuntimeError:
+            running_loop = None
+
+        if running_loop is not None:
+            self.start()
+            self._enqueue(entry)
+        elif self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._enqueue, entry)
+        else:
+            self._drop()
+
+    def _enqueue(self, entry: dict):
+        try:
+            self._queue.put_nowait(entry)
+        except asyncio.QueueFull:
+            self._drop()
+
+    def _drop(self, count: int = 1):
+        self.dropped += count
+        now = time.monotonic()
+        if now - self._last_drop_warning >= DROP_WARNING_INTERVAL:
+            self._last_drop_warning = now
+            log.warning("访问日志队列已满或写入失败，累计已丢弃 %s 条访问日志。", self.dropped)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batch: List[dict] = []
+            deadline = None
+            while len(batch) < self.batch_size:
+                timeout = None if deadline is None else deadline - loop.time()
+                if timeout is not None and timeout <= 0:
+                    break
+                try:
+                    entry = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if entry is None:
+                    stopping = True
+                    break
+                batch.append(entry)
+                if deadline is None:
+                    deadline = loop.time() + self.flush_interval
+
+            if stopping:
+                # 停止前写入队列中剩余的所有条目
+                while not self._queue.empty():
+                    entry = self._queue.get_nowait()
+                    if entry is not None:
+                        batch.append(entry)
+            for start in range(0, len(batch), self.batch_size):
+                await self._flush(batch[start:start + self.batch_size])
+
+    async def _flush(self, batch: List[dict]):
+        if not batch:
+            return
+
+        async def job(db: AsyncSession):
+            await db.execute(insert(AccessLog).values(batch))
+
+        try:
+            await write_queue.submit(job)
+            self.written += len(batch)
+        except Exception as e:
+            log.error("写入 %s 条访问日志失败: %s", len(batch), e)
+            self._drop(len(batch))
+
+# 创建一个服务实例
+access_log_service = AccessLogService(
+    queue_size=settings.ACCESS_LOG_QUEUE_SIZE,
+    batch_size=settings.ACCESS_LOG_BATCH_SIZE,
+    flush_interval=settings.ACCESS_LOG_FLUSH_INTERVAL_SECONDS,
+)
+
+registry.callback(
+    "securedrop_access_log_written_total", "已写入数据库的访问日志条数。", "counter",
+    lambda: access_log_service.written,
+)
+registry.callback(
+    "securedrop_access_log_dropped_total", "因队列已满或写入失败而丢弃的访问日志条数。", "counter",
+    lambda: access_log_service.dropped,
+)
@@ -0,0 +1,96 @@
+"""
+带宽整形服务模块
+
+根据令牌策略中的 `upload_bandwidth_limit_kbps` 和 `download_bandwidth_limit_kbps`
+对上传和下载进行限速。同一令牌的所有并发连接共享同一个令牌桶，
+因此并行开启多个连接也无法绕过限制；另外可以配置全局的下载带宽上限。
+"""
+import weakref
+from typing import AsyncIterable, AsyncIterator, List, Optional
+from domain.models import Token
+from utils.config import settings
+from utils.metrics import TransferMeter
+from utils.rate_limit import TokenBucket, consume_all
+
+UPLOAD = "upload"
+DOWNLOAD = "download"
+
+
+class Throttle:
+    """
+    一个连接使用的限速器，同时消耗其关联的所有令牌桶（令牌自身的桶和全局桶）。
+    """
+
+    def __init__(self, buckets: List[TokenBucket]):
+        # 持有桶的强引用，保证连接存续期间共享桶不会被回收
+        self.buckets = buckets
+
+    async def consume(self, amount: int):
+        await consume_all(self.buckets, amount)
+
+
+class BandwidthService:
+    """
+    管理按令牌共享的令牌桶。
+
+    桶保存在弱引用字典中：只要还有连接在使用，同一令牌的连接就共享同一个桶；
+    所有连接结束后桶会被自动回收，不需要额外的清理逻辑。
+    """
+
+    def __init__(self):
+        self._buckets: "weakref.WeakValueDictionary" = weakref.WeakValueDictionary()
+        self._global_download: Optional[TokenBucket] = None
+        if settings.GLOBAL_DOWNLOAD_BANDWIDTH_LIMIT_KBPS > 0:
+            self._global_download = TokenBucket(settings.GLOBAL_DOWNLOAD_BANDWIDTH_LIMIT_KBPS * 1024)
+
+    def _token_bucket(self, token_id: int, direction: str, limit_kbps: int) -> TokenBucket:
+        key = (token_id, direction)
+        rate = limit_kbps * 1024
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(rate)
+            self._buckets[key] = bucket
+        elif bucket.rate != rate:
+            bucket.set_rate(rate)
+        return bucket
+
+    def throttle(self, policy: Token, direction: str) -> Optional[Throttle]:
+        """
+        获取某个令牌在指定方向上的限速器。
+
+        Args:
+            policy: 令牌策略。
+            direction: `UPLOAD` 或 `DOWNLOAD`。
+
+        Returns:
+            Optional[Throttle]: 不需要限速时返回 None，调用方可以完全跳过限速逻辑。
+        """
+        if direction == UPLOAD:
+            limit_kbps = policy.upload_bandwidth_limit_kbps or 0
+        else:
+            limit_kbps = policy.download_bandwidth_limit_kbps or 0
+
+        buckets = []
+        if limit_kbps > 0:
+            buckets.append(self._token_bucket(policy.id, direction, limit_kbps))
+        if direction == DOWNLOAD and self._global_download is not None:
+            buckets.append(self._global_download)
+        return Throttle(buckets) if buckets else None
+
+    async def shape(
+        self, chunks: AsyncIterable[bytes], policy: Token, direction: str
+    ) -> AsyncIterator[bytes]:
+        """
+        按令牌策略对一个分块流限速。上传时限制读取请求体的速度，
+        依靠 TCP 背压让客户端放慢发送。同时统计令牌的传输字节数。
+        """
+        throttle = self.throttle(policy, direction)
+        with TransferMeter(policy.id, direction) as meter:
+            async for chunk in chunks:
+                if throttle is not None:
+                    await throttle.consume(len(chunk))
+                meter.add(len(chunk))
+                yield chunk
+
+# 创建一个服务实例
+bandwidth_service = BandwidthService()
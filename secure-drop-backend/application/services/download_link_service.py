@@ -0,0 +1,127 @@
+"""
+签名下载链接服务模块
+
+为访客签发短时有效的下载链接（单个文件，或把整个下载目录打包成 ZIP）。
+链接中包含令牌 ID、文件或目录的相对路径、过期时间、
+令牌的策略版本以及下载所需的策略（是否允许断点续传、下载限速），
+并用 HMAC-SHA256 签名。验证时不需要解析会话令牌，
+因此浏览器可以直接用普通链接下载（原生的流式保存和断点续传），
+前端的缓存或代理也可以按 URL 缓存响应。
+
+修改或撤销令牌都会递增数据库中的 `policy_version`，删除令牌会使其策略不复存在。
+验证链接时将其中签名的策略版本与令牌当前的策略快照比较，版本不一致、令牌已不可用
+或已被删除时拒绝，不依赖进程内的作废记录：重启后依然有效，多进程部署时其他进程
+最多在策略缓存的 TTL（`TOKEN_CACHE_TTL_SECONDS`）之后拒绝旧链接。
+"""
+import base64
+import hashlib
+import hmac
+import math
+import time
+from datetime import datetime, timezone
+from typing import Iterable, NamedTuple, Optional, Tuple
+from urllib.parse import quote, urlencode
+from fastapi import HTTPException, status
+from application import schemas
+from utils.config import settings
+
+# 签名链接的路由前缀：单个文件和目录打包下载。前缀参与签名，两种链接不能互换
+LINK_PREFIX = "/api/guest/dl"
+ARCHIVE_LINK_PREFIX = "/api/guest/dl-archive"
+# 过期时间向上取整到这个粒度（秒），同一时间窗口内签发的链接完全相同，便于缓存命中
+EXPIRY_GRANULARITY = 60
+
+
+class DownloadGrant(NamedTuple):
+    """
+    从签名链接中恢复的下载授权。字段名与令牌策略一致，可以直接用于限速。
+    """
+    id: int
+    path: str
+    allow_resumable_download: bool
+    download_bandwidth_limit_kbps: int
+    expires: int
+    policy_version: int
+
+
+class DownloadLinkService:
+    """
+    签发和验证签名下载链接。
+    """
+
+    def __init__(self, secret_key: str, ttl: int):
+        # 从 JWT 密钥派生独立的签名密钥，两种签名不能互相替代
+        self._key = hmac.new(secret_key.encode(), b"secure-drop download link", hashlib.sha256).digest()
+        self.ttl = ttl
+
+    def _signature(
+        self, prefix: str, token_id: int, path: str, expires: int, version: int, resumable: int, limit: int
+    ) -> str:
+        message = f"{prefix}\n{token_id}\n{path}\n{expires}\n{version}\n{resumable}\n{limit}".encode()
+        digest = hmac.new(self._key, message, hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+
+    def sign(self, token: schemas.TokenInDB, path: str, prefix: str = LINK_PREFIX) -> Tuple[str, datetime]:
+        """
+        为令牌下载目录中的一个文件（或以 `ARCHIVE_LINK_PREFIX` 为整个下载目录）签发链接。
+
+        Args:
+            token: 令牌策略。
+            path: 文件或目录相对于存储根目录的路径。
+            prefix: 链接的路由前缀。
+
+        Returns:
+            Tuple[str, datetime]: 下载地址和过期时间（UTC）。链接不会晚于令牌本身过期。
+        """
+        expires = math.ceil((time.time() + self.ttl) / EXPIRY_GRANULARITY) * EXPIRY_GRANULARITY
+        if token.expires_at is not None:
+            token_expires = token.expires_at
+            if token_expires.tzinfo is None:
+                token_expires = token_expires.replace(tzinfo=timezone.utc)
+            expires = min(expires, int(token_expires.timestamp()))
+        version = token.policy_version or 1
+        resumable = 1 if token.allow_resumable_download else 0
+        limit = token.download_bandwidth_limit_kbps or 0
+        query = urlencode({
+            "e": expires,
+            "v": version,
+            "r": resumable,
+            "l": limit,
+            "s": self._signature(prefix, token.id, path, expires, version, resumable, limit),
+        })
+        url = f"{prefix}/{token.id}/{quote(path)}?{query}"
+        return url, datetime.fromtimestamp(expires, tz=timezone.utc)
+
+    def verify(
+        self, token_id: int, path: str, expires: int, version: int, resumable: int, limit: int, signature: str,
+        prefix: str = LINK_PREFIX,
+    ) -> DownloadGrant:
+        """
+        验证签名链接，返回其中的下载授权。签名无效或已过期时抛出 403。
+
+        链接是否仍然符合令牌当前的策略需要再用 `ensure_current` 检查。
+        """
+        expected = self._signature(prefix, token_id, path, expires, version, resumable, limit)
+        if not hmac.compare_digest(expected, signature):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="下载链接无效")
+        if expires <= time.time():
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="下载链接已过期")
+        return DownloadGrant(token_id, path, bool(resumable), limit, expires, version)
+
+    def ensure_current(
+        self, grant: DownloadGrant, token: Optional[schemas.TokenInDB], allowed_statuses: Iterable[str]
+    ):
+        """
+        检查链接是否由令牌当前版本的策略签发：令牌已被删除、状态不在 `allowed_statuses` 中、
+        不再允许下载或策略版本已变化时抛出 403。
+        """
+        if (
+            token is None
+            or token.status not in allowed_statuses
+            or not token.allow_download
+            or (token.policy_version or 1) != grant.policy_version
+        ):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="下载链接已失效")
+
+# 创建一个服务实例
+download_link_service = DownloadLinkService(settings.SECRET_KEY, settings.SIGNED_URL_TTL_SECONDS)
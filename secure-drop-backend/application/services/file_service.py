@@ -3,11 +3,72 @@
 
 处理文件上传、下载、带宽限制等相关的业务逻辑。
 """
+import bisect
+import hashlib
 import os
-from fastapi import UploadFile, HTTPException, status
+import time
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, NamedTuple, Optional
+import anyio
+from fastapi import HTTPException, status
+from application.services.bandwidth_service import bandwidth_service, UPLOAD
+from application.services.quota_service import quota_service
 from domain.storage import storage_service
 from domain.models import Token
+from utils.multipart_stream import MultipartFileStream
+from utils.zip_stream import ZipEntry
+from utils.cache import TTLCache
+from utils.cursor import encode_cursor, decode_cursor
+from utils.config import settings
 from utils.logger import log
+from utils.metrics import registry
+
+# multipart 请求体中除文件内容外的额外开销（边界、部分头部、其他小字段）
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+# 文件列表支持的排序字段
+SORT_FIELDS = ("name", "size", "mtime")
+
+
+class FileEntry(NamedTuple):
+    name: str
+    size: int
+    mtime_ns: int
+
+
+class DirectoryListing:
+    """
+    一个目录的缓存快照：目录的修改时间、文件条目，以及按需生成的排序视图。
+    """
+
+    def __init__(self, dir_mtime_ns: int, entries: List[FileEntry]):
+        self.dir_mtime_ns = dir_mtime_ns
+        self.entries = entries
+        self._views: dict = {}
+
+    def sorted_view(self, sort: str):
+        """
+        返回按 (排序字段, 文件名) 升序排列的条目及其排序键，结果会被缓存。
+        """
+        view = self._views.get(sort)
+        if view is None:
+            ordered = sorted(self.entries, key=lambda e: _sort_key(e, sort))
+            view = (ordered, [_sort_key(e, sort) for e in ordered])
+            self._views[sort] = view
+        return view
+
+
+def _sort_key(entry: FileEntry, sort: str) -> tuple:
+    if sort == "size":
+        return (entry.size, entry.name)
+    if sort == "mtime":
+        return (entry.mtime_ns, entry.name)
+    return (entry.name, entry.name)
+
+
+# 目录列表缓存，以目录的物理路径为键；目录修改时间变化时自动失效
+_listing_cache = TTLCache(max_size=256, ttl=settings.FILE_LIST_CACHE_TTL_SECONDS)
+registry.register_cache("file_listing", _listing_cache)
 
 class FileService:
     """
@@ -24,11 +85,11 @@ class FileService:
             return destination_path
 
         if strategy == 'overwrite':
-            log.warning(f"文件名冲突，将覆盖文件: {destination_path}")
+            log.warning("文件名冲突，将覆盖文件: %s", destination_path)
             return destination_path
         
         if strategy == 'reject':
-            log.error(f"文件名冲突，拒绝上传: {destination_path}")
+            log.error("文件名冲突，拒绝上传: %s", destination_path)
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
                 detail=f"文件 '{os.path.basename(destination_path)}' 已存在。"
@@ -41,47 +102,265 @@ class FileService:
         while storage_service.file_exists(new_path):
             counter += 1
             new_path = f"{base}_{counter}{ext}"
-        log.info(f"文件名冲突，重命名为: {new_path}")
+        log.info("文件名冲突，重命名为: %s", new_path)
         return new_path
 
-    def _validate_file(self, file: UploadFile, policy: Token):
+    def _validate_file_size(self, size: int, policy: Token):
         """
-        根据令牌策略验证文件。
+        根据令牌策略验证文件大小。
         """
-        # 验证文件大小
         if policy.max_file_size_mb is not None:
             max_size_bytes = policy.max_file_size_mb * 1024 * 1024
-            if file.size > max_size_bytes:
+            if size > max_size_bytes:
                 raise HTTPException(
                     status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
                     detail=f"文件大小超过限制 ({policy.max_file_size_mb} MB)。"
                 )
-        
-        # 验证文件类型
+
+    def _validate_file_type(self, filename: str, policy: Token):
+        """
+        根据令牌策略验证文件类型。
+        """
         if policy.allowed_file_types:
             allowed_types = [t.strip() for t in policy.allowed_file_types.split(',')]
-            file_ext = os.path.splitext(file.filename)[1]
+            file_ext = os.path.splitext(filename)[1]
             if file_ext.lower() not in [t.lower() for t in allowed_types]:
                 raise HTTPException(
                     status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
                     detail=f"不支持的文件类型。允许的类型: {policy.allowed_file_types}"
                 )
 
-    def upload_file(self, file: UploadFile, policy: Token) -> str:
+    def admit_upload(
+        self,
+        policy: Token,
+        content_length: Optional[int],
+        filename: Optional[str],
+        file_size: Optional[int] = None,
+    ):
         """
-        处理文件上传的完整流程。
+        准入检查：在读取请求体之前，仅凭请求头拒绝明显不合规的上传。
+
+        Args:
+            policy: 令牌策略。
+            content_length: 请求的 Content-Length，未知时为 None。
+            filename: 客户端预先声明的文件名，未知时为 None。
+            file_size: 客户端声明的精确文件大小（如分块上传会话），未知时为 None。
         """
-        self._validate_file(file, policy)
+        if file_size is not None:
+            self._validate_file_size(file_size, policy)
+        if policy.max_file_size_mb is not None and content_length is not None:
+            max_size_bytes = policy.max_file_size_mb * 1024 * 1024
+            if content_length > max_size_bytes + MULTIPART_OVERHEAD_BYTES:
+                log.warning("上传请求体过大，已在读取前拒绝: %s 字节", content_length, extra={"dedup": True})
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail=f"文件大小超过限制 ({policy.max_file_size_mb} MB)。"
+                )
+        if filename:
+            self._validate_file_type(filename, policy)
 
+    def resolve_destination(self, filename: str, policy: Token) -> str:
+        """
+        根据令牌的上传路径和冲突策略，确定文件最终保存的相对路径。
+        """
         upload_rel_path = policy.upload_path or ""
-        destination_path = os.path.join(upload_rel_path, file.filename)
-
-        final_path = self._handle_filename_conflict(
+        destination_path = os.path.join(upload_rel_path, filename)
+        return self._handle_filename_conflict(
             destination_path, policy.filename_conflict_strategy
         )
 
-        saved_path = storage_service.save_file(file, final_path)
+    async def _count_bytes(
+        self, upload: MultipartFileStream, policy: Token, progress: dict
+    ) -> AsyncIterator[bytes]:
+        """
+        转发上传分块并统计字节数（写入 `progress["received"]`），
+        一旦超过大小限制或预留的配额立即中止上传。
+        上传持续时间较长时定期为配额预留续约。
+        """
+        reserved = progress.get("reserved")
+        reservation_id = progress.get("reservation_id")
+        renew_interval = settings.QUOTA_RESERVATION_LEASE_SECONDS / 3
+        renew_at = time.monotonic() + renew_interval
+        received = 0
+        async for chunk in upload:
+            received += len(chunk)
+            progress["received"] = received
+            self._validate_file_size(received, policy)
+            if reserved and received > reserved:
+                raise HTTPException(
+                    status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                    detail="上传的数据超出了请求声明的大小。"
+                )
+            if reservation_id is not None and time.monotonic() >= renew_at:
+                await quota_service.renew(reservation_id)
+                renew_at = time.monotonic() + renew_interval
+            yield chunk
+
+    async def upload_stream(
+        self,
+        upload: MultipartFileStream,
+        policy: Token,
+        content_length: Optional[int],
+    ) -> str:
+        """
+        以流式方式处理文件上传：边解析请求体边写入最终位置。
+
+        读取请求体之前先按 Content-Length 预留上传配额，完成后按实际字节数结算。
+        """
+        if quota_service.quota_bytes(policy) is not None and content_length is None:
+            raise HTTPException(
+                status_code=status.HTTP_411_LENGTH_REQUIRED,
+                detail="此令牌设置了总上传配额，请求必须包含 Content-Length。"
+            )
+        reservation_id = await quota_service.reserve(policy, content_length or 0)
+        progress = {
+            "reserved": content_length if reservation_id is not None else None,
+            "reservation_id": reservation_id,
+            "received": 0,
+        }
+        try:
+            await upload.open()
+            log.info("令牌 '%s' 正在上传文件: %s", policy.token_string, upload.filename)
+            self._validate_file_type(upload.filename, policy)
+            final_path = self.resolve_destination(upload.filename, policy)
+
+            chunks = bandwidth_service.shape(self._count_bytes(upload, policy, progress), policy, UPLOAD)
+            saved_path = await storage_service.save_stream(chunks, final_path)
+        except BaseException:
+            # 客户端断开时请求会被取消，释放配额的操作不能随之中断
+            with anyio.CancelScope(shield=True):
+                await quota_service.release(policy.id, reservation_id)
+            raise
+        await quota_service.settle(policy.id, reservation_id, progress["received"])
         return os.path.basename(saved_path)
 
+    def _scan_directory(self, dir_path: str) -> Optional[DirectoryListing]:
+        """
+        获取目录的文件条目，目录未变化时直接使用缓存。
+
+        验证缓存只需要对目录本身执行一次 stat；只有目录的修改时间变化
+        （文件被创建、删除或重命名）或缓存过期时才重新扫描。
+        """
+        try:
+            dir_mtime_ns = os.stat(dir_path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        listing = _listing_cache.get(dir_path)
+        if listing is not None and listing.dir_mtime_ns == dir_mtime_ns:
+            return listing
+
+        entries = []
+        with os.scandir(dir_path) as it:
+            for entry in it:
+                # 以点开头的是内部文件（如正在写入的临时文件），不对外展示
+                if entry.name.startswith(".") or not entry.is_file():
+                    continue
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append(FileEntry(entry.name, st.st_size, st.st_mtime_ns))
+        listing = DirectoryListing(dir_mtime_ns, entries)
+        _listing_cache.set(dir_path, listing)
+        return listing
+
+    def list_files(
+        self,
+        dir_rel_path: str,
+        sort: str = "name",
+        order: str = "asc",
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Optional[dict]:
+        """
+        分页列出目录中的文件。
+
+        Args:
+            dir_rel_path: 目录的相对路径。
+            sort: 排序字段，`name`、`size` 或 `mtime`。
+            order: `asc` 或 `desc`。
+            cursor: 上一页返回的游标，首页为 None。
+            limit: 每页条目数。
+
+        Returns:
+            Optional[dict]: 包含 `items`、`total`、`next_cursor` 和 `etag` 的字典；
+            目录不存在时返回 None。
+        """
+        dir_path = storage_service.get_file_path(dir_rel_path)
+        if not os.path.isdir(dir_path):
+            return None
+        listing = self._scan_directory(dir_path)
+        if listing is None:
+            return None
+
+        ordered, keys = listing.sorted_view(sort)
+        cursor_key = decode_cursor(cursor) if cursor else None
+        # 游标记录上一页最后一个条目的排序键，用二分查找定位，
+        # 翻页期间目录内容发生变化也不会跳过或重复条目
+        try:
+            if order == "desc":
+                end = bisect.bisect_left(keys, cursor_key) if cursor_key else len(ordered)
+                start = max(end - limit, 0)
+                page = ordered[start:end][::-1]
+                has_more = start > 0
+            else:
+                start = bisect.bisect_right(keys, cursor_key) if cursor_key else 0
+                page = ordered[start:start + limit]
+                has_more = start + limit < len(ordered)
+        except TypeError:
+            # 游标与当前排序字段的类型不匹配
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+
+        etag_source = f"{dir_path}|{listing.dir_mtime_ns}|{len(ordered)}|{sort}|{order}|{cursor}|{limit}"
+        return {
+            "total": len(ordered),
+            "items": [
+                {
+                    "name": e.name,
+                    "size": e.size,
+                    "modified_at": datetime.fromtimestamp(e.mtime_ns / 1e9, tz=timezone.utc),
+                }
+                for e in page
+            ],
+            "next_cursor": encode_cursor(_sort_key(page[-1], sort)) if has_more and page else None,
+            "etag": f'W/"{hashlib.sha1(etag_source.encode()).hexdigest()}"',
+        }
+
+    def archive_entries(
+        self, dir_rel_path: str, names: Optional[List[str]] = None
+    ) -> Optional[List[ZipEntry]]:
+        """
+        确定打包下载的文件：目录中的全部文件，或其中指定的一部分。
+
+        只有出现在文件列表中的文件可以被选中，因此不会打包子目录、
+        隐藏文件或目录之外的路径。
+
+        Args:
+            dir_rel_path: 目录的相对路径。
+            names: 要打包的文件名，None 表示目录中的全部文件。
+
+        Returns:
+            Optional[List[ZipEntry]]: 按文件名排序的条目；目录不存在时返回 None。
+        """
+        dir_path = storage_service.get_file_path(dir_rel_path)
+        if not os.path.isdir(dir_path):
+            return None
+        listing = self._scan_directory(dir_path)
+        if listing is None:
+            return None
+
+        available = {e.name for e in listing.entries}
+        if names is None:
+            selected = sorted(available)
+        else:
+            missing = [name for name in names if name not in available]
+            if missing:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"文件未找到: {', '.join(missing[:10])}"
+                )
+            selected = sorted(set(names))
+        return [ZipEntry(name, os.path.join(dir_path, name)) for name in selected]
+
 # 创建一个服务实例
 file_service = FileService()
@@ -0,0 +1,211 @@
+"""
+上传配额服务模块
+
+以增量计数的方式实施 `max_total_upload_gb`：令牌表中的 `uploaded_bytes`
+记录已完成上传的字节数，`reserved_bytes` 记录进行中上传预留的字节数。
+所有更新都是单条条件 UPDATE 语句，并发上传不会共同超出配额，
+检查的代价也与令牌已上传的文件数量无关。
+
+每笔预留同时在 `quota_reservations` 表中记录为一个有过期时间的租约。
+上传结束时删除租约并结算；处理上传的进程中途退出时，租约过期后由后台任务
+回收并从 `reserved_bytes` 中扣除。回收只涉及已过期的租约，多个进程同时运行或
+滚动重启时也不会影响其他进程正在进行的上传。
+
+这些更新在每次上传时都会发生，因此通过写队列批量提交。
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from fastapi import HTTPException, status
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from domain.models import QuotaReservation, Token
+from domain.write_queue import write_queue
+from utils.config import settings
+from utils.logger import log
+
+
+class QuotaService:
+    """
+    封装上传配额的预留、续约、结算与释放。
+    """
+
+    def quota_bytes(self, policy: Token) -> Optional[int]:
+        """
+        令牌的总上传配额（字节），未设置时返回 None。
+        """
+        if policy.max_total_upload_gb is None:
+            return None
+        return policy.max_total_upload_gb * 1024 * 1024 * 1024
+
+    async def reserve(self, policy: Token, nbytes: int, lease_seconds: Optional[float] = None) -> Optional[int]:
+        """
+        为一次上传预留配额。
+
+        Args:
+            policy: 令牌策略。
+            nbytes: 上传声明的字节数。
+            lease_seconds: 租约时长，默认为 `QUOTA_RESERVATION_LEASE_SECONDS`。
+                上传持续更久时需要调用 `renew` 续约。
+
+        Returns:
+            Optional[int]: 预留的编号，用于续约、结算和释放；令牌未设置配额时不做预留，返回 None。
+
+        Raises:
+            HTTPException: 剩余配额不足时返回 413。
+        """
+        quota = self.quota_bytes(policy)
+        if quota is None:
+            return None
+        expires_at = datetime.utcnow() + timedelta(
+            seconds=lease_seconds if lease_seconds is not None else settings.QUOTA_RESERVATION_LEASE_SECONDS
+        )
+
+        async def job(db: AsyncSession) -> Optional[int]:
+            result = await db.execute(
+                update(Token)
+                .where(
+                    Token.id == policy.id,
+                    Token.uploaded_bytes + Token.reserved_bytes + nbytes <= quota,
+                )
+                .values(reserved_bytes=Token.reserved_bytes + nbytes)
+            )
+            if result.rowcount != 1:
+                return None
+            reservation = QuotaReservation(token_id=policy.id, nbytes=nbytes, expires_at=expires_at)
+            db.add(reservation)
+            await db.flush()
+            return reservation.id
+
+        reservation_id = await write_queue.submit(job)
+        if reservation_id is None:
+            log.warning(
+                "令牌 ID %s 的上传配额不足，拒绝 %s 字节的上传。", policy.id, nbytes, extra={"dedup": True}
+            )
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"超出令牌的总上传配额 ({policy.max_total_upload_gb} GB)。"
+            )
+        return reservation_id
+
+    async def renew(self, reservation_id: Optional[int], lease_seconds: Optional[float] = None):
+        """
+        延长预留的租约。租约已经过期被回收时什么也不做。
+        """
+        if reservation_id is None:
+            return
+        expires_at = datetime.utcnow() + timedelta(
+            seconds=lease_seconds if lease_seconds is not None else settings.QUOTA_RESERVATION_LEASE_SECONDS
+        )
+        await write_queue.submit(
+            lambda db: db.execute(
+                update(QuotaReservation)
+                .where(QuotaReservation.id == reservation_id)
+                .values(expires_at=expires_at)
+            )
+        )
+
+    @staticmethod
+    async def _drop_reservation(db: AsyncSession, reservation_id: Optional[int]) -> int:
+        """
+        删除一笔预留，返回其字节数；已被回收（或不存在）时返回 0。
+        """
+        if reservation_id is None:
+            return 0
+        nbytes = await db.scalar(
+            delete(QuotaReservation)
+            .where(QuotaReservation.id == reservation_id)
+            .returning(QuotaReservation.nbytes)
+        )
+        return nbytes or 0
+
+    async def settle(self, token_id: int, reservation_id: Optional[int], actual: int):
+        """
+        上传完成：释放预留并累加实际上传的字节数。
+        """
+        async def job(db: AsyncSession):
+            reserved = await self._drop_reservation(db, reservation_id)
+            await db.execute(
+                update(Token)
+                .where(Token.id == token_id)
+                .values(
+                    uploaded_bytes=Token.uploaded_bytes + actual,
+                    reserved_bytes=Token.reserved_bytes - reserved,
+                )
+            )
+
+        await write_queue.submit(job)
+
+    async def release(self, token_id: int, reservation_id: Optional[int]):
+        """
+        上传失败或被取消：只释放预留。
+        """
+        if reservation_id is None:
+            return
+
+        async def job(db: AsyncSession):
+            reserved = await self._drop_reservation(db, reservation_id)
+            if reserved:
+                await db.execute(
+                    update(Token)
+                    .where(Token.id == token_id)
+                    .values(reserved_bytes=Token.reserved_bytes - reserved)
+                )
+
+        await write_queue.submit(job)
+
+    async def expire_reservations(self, limit: int) -> int:
+        """
+        回收已过期的租约（处理上传的进程中途退出时遗留的预留），每次最多处理 `limit` 个。
+
+        Returns:
+            int: 本次回收的预留数量。
+        """
+        due = (
+            select(QuotaReservation.id)
+            .where(QuotaReservation.expires_at <= datetime.utcnow())
+            .limit(limit)
+        )
+
+        async def job(db: AsyncSession) -> int:
+            rows = (await db.execute(
+                delete(QuotaReservation)
+                .where(QuotaReservation.id.in_(due.scalar_subquery()))
+                .returning(QuotaReservation.token_id, QuotaReservation.nbytes)
+                .execution_options(synchronize_session=False)
+            )).all()
+            per_token: Dict[int, int] = {}
+            for token_id, nbytes in rows:
+                per_token[token_id] = per_token.get(token_id, 0) + nbytes
+            for token_id, nbytes in per_token.items():
+                await db.execute(
+                    update(Token)
+                    .where(Token.id == token_id)
+                    .values(reserved_bytes=Token.reserved_bytes - nbytes)
+                )
+            return len(rows)
+
+        expired = await write_queue.submit(job)
+        if expired:
+            log.info("已回收 %s 个过期的上传配额预留。", expired)
+        return expired
+
+    async def recompute_reserved(self):
+        """
+        按现有的租约重新计算所有令牌的 `reserved_bytes`。
+
+        用于启动时修正没有租约记录的旧版本遗留的预留。重新计算是一条 UPDATE 语句，
+        与其他进程的预留和结算互斥执行，不会丢失正在进行的上传的预留。
+        """
+        total = (
+            select(func.coalesce(func.sum(QuotaReservation.nbytes), 0))
+            .where(QuotaReservation.token_id == Token.id)
+            .scalar_subquery()
+        )
+        result = await write_queue.submit(
+            lambda db: db.execute(update(Token).where(Token.reserved_bytes != total).values(reserved_bytes=total))
+        )
+        if result.rowcount:
+            log.info("已修正 %s 个令牌的上传配额预留量。", result.rowcount)
+
+# 创建一个服务实例
+quota_service = QuotaService()
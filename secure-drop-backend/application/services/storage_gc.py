@@ -0,0 +1,52 @@
+"""
+存储垃圾回收任务模块
+
+后台定期调用存储实例的 `collect_garbage`，回收去重存储中已没有文件引用的内容。
+回收需要遍历存储目录，在线程中执行，不阻塞事件循环。
+"""
+import asyncio
+from typing import Optional
+import anyio
+from domain.storage import storage_service
+from utils.config import settings
+from utils.logger import log
+
+
+class StorageGarbageCollector:
+    """
+    定期回收无引用存储内容的后台任务。
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """
+        启动后台任务，启动时立即执行一次回收。
+        """
+        if self.interval <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await anyio.to_thread.run_sync(storage_service.collect_garbage)
+            except Exception as e:
+                log.error("回收存储空间时出错: %s", e)
+            await asyncio.sleep(self.interval)
+
+# 创建一个全局实例
+storage_gc = StorageGarbageCollector(interval=settings.STORAGE_GC_INTERVAL_SECONDS)
@@ -3,12 +3,81 @@
 
 处理令牌的创建、验证、使用等核心逻辑。
 """
-import uuid
-from typing import List, Optional
-from sqlalchemy.orm import Session
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import and_, case, delete, func, insert, or_, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
 from domain import models
+from domain.write_queue import write_queue
 from application import schemas
+from utils.cache import TTLCache
+from utils.config import settings
+from utils.cursor import decode_cursor, encode_cursor
 from utils.logger import log
+from utils.metrics import registry
+
+# 访客请求使用的令牌策略快照缓存，以 token_string 为键。
+# 本进程内的修改、撤销和删除会立即失效对应条目；
+# 多进程部署时，其他进程最多在 TTL 之后看到变化。
+token_policy_cache = TTLCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS,
+)
+
+# 令牌 ID -> 令牌字符串，供签名下载链接按 ID 查找策略快照。
+# 删除令牌时作废对应条目（令牌表的编号不会复用，残留的条目也只会指向已删除的令牌）
+token_id_cache = TTLCache(
+    max_size=settings.TOKEN_CACHE_MAX_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS,
+)
+
+# 管理后台令牌列表的总数缓存，以筛选条件为键；创建和删除令牌时清空
+token_count_cache = TTLCache(max_size=256, ttl=settings.TOKEN_COUNT_CACHE_TTL_SECONDS)
+registry.register_cache("token_policy", token_policy_cache)
+registry.register_cache("token_count", token_count_cache)
+registry.register_cache("token_id", token_id_cache)
+
+# 令牌列表查询的列，只包含 `TokenPublic` 需要的字段
+TOKEN_LIST_COLUMNS = [getattr(models.Token, name) for name in schemas.TokenPublic.model_fields]
+
+# 批量创建时，因令牌字符串冲突而重新生成的最大轮数
+BULK_CREATE_MAX_ATTEMPTS = 5
+
+# 可以登录（消耗使用次数）的令牌状态
+USABLE_STATUSES = ("unused", "active")
+# 已登录的会话仍然有效的令牌状态：令牌用尽后，最后一次登录得到的会话在过期前依然可用
+SESSION_STATUSES = ("unused", "active", "exhausted")
+
+
+def to_utc_naive(value: datetime) -> datetime:
+    """
+    转换为不带时区的 UTC 时间，数据库中的时间均以这种形式保存。
+    """
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def is_expired(expires_at: Optional[datetime], now: Optional[datetime] = None) -> bool:
+    """
+    判断令牌是否已过期。
+    """
+    if expires_at is None:
+        return False
+    return to_utc_naive(expires_at) <= (now or datetime.utcnow())
+
+
+def normalize_policy(data: dict) -> dict:
+    """
+    将写入数据库的策略字段转换为存储格式：带时区的 `expires_at` 转换为不带时区的 UTC 时间。
+    """
+    if data.get("expires_at") is not None:
+        data["expires_at"] = to_utc_naive(data["expires_at"])
+    return data
+
 
 class TokenService:
     """
@@ -18,95 +87,525 @@ class TokenService:
     def _generate_token_string(self) -> str:
         """
         生成一个格式化的唯一令牌字符串。
-        格式: XXXX-XXXX-XXXX-XXXX
+        格式: 16 位大写十六进制字符（64 位随机数，来自操作系统的安全随机源）
         """
-        return str(uuid.uuid4()).upper().replace('-', '')[:16]
+        return secrets.token_hex(8).upper()
+
+    def _insert_ignoring_duplicates(self, db: AsyncSession):
+        """
+        构造遇到重复令牌字符串时跳过该行的 INSERT 语句。
+        """
+        table = models.Token.__table__
+        dialect = db.bind.dialect.name
+        if dialect == "sqlite":
+            return sqlite.insert(table).on_conflict_do_nothing(index_elements=["token_string"])
+        if dialect == "postgresql":
+            return postgresql.insert(table).on_conflict_do_nothing(index_elements=["token_string"])
+        return insert(table)
+
+    async def bulk_create_tokens(
+        self, token_in: schemas.TokenCreate, count: int
+    ) -> List[Tuple[int, str]]:
+        """
+        按同一个策略模板批量创建令牌，所有令牌在同一个事务中插入。
+
+        令牌字符串有 64 位随机性，即使生成上百万个令牌，发生冲突的概率也极低；
+        即便如此，与已有令牌冲突的行会被数据库跳过，并为其重新生成令牌字符串，
+        保证最终恰好创建 `count` 个令牌。
+
+        Returns:
+            List[Tuple[int, str]]: 创建的令牌 ID 和令牌字符串。
+        """
+        template = normalize_policy(token_in.model_dump())
+        template["status"] = "unused"
+        template["current_usage_count"] = 0
+        template["created_at"] = datetime.utcnow()
+
+        async def job(db: AsyncSession) -> List[Tuple[int, str]]:
+            created: List[Tuple[int, str]] = []
+            for _ in range(BULK_CREATE_MAX_ATTEMPTS):
+                remaining = count - len(created)
+                if remaining <= 0:
+                    break
+                # 用集合去除本轮生成的重复值
+                strings = {self._generate_token_string() for _ in range(remaining)}
+                rows = [{**template, "token_string": token_string} for token_string in strings]
+                # executemany 加 RETURNING 时，SQLAlchemy 会把参数分批合并成多行 INSERT 语句
+                stmt = self._insert_ignoring_duplicates(db).returning(
+                    models.Token.__table__.c.id, models.Token.__table__.c.token_string
+                )
+                result = await db.execute(stmt, rows)
+                created.extend((row.id, row.token_string) for row in result)
+            if len(created) != count:
+                raise RuntimeError("无法生成足够数量的唯一令牌字符串。")
+            return created
+
+        created = await write_queue.submit(job)
+        token_count_cache.clear()
+        log.info("批量创建了 %s 个令牌。", len(created))
+        return created
 
-    def create_token(self, db: Session, token_in: schemas.TokenCreate) -> models.Token:
+    def _selection(self, ids: Optional[List[int]], token_filter: Optional[schemas.TokenFilter]) -> list:
+        """
+        将批量操作的选择条件转换为 WHERE 子句。
+        """
+        if ids:
+            return [models.Token.id.in_(ids)]
+        if token_filter is not None:
+            filters = self._list_filters(
+                token_filter.status, token_filter.expires_after, token_filter.expires_before, token_filter.q
+            )
+            if filters:
+                return filters
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="必须指定令牌 ID 列表或至少一个筛选条件。"
+        )
+
+    async def bulk_revoke_tokens(
+        self, ids: Optional[List[int]] = None, token_filter: Optional[schemas.TokenFilter] = None
+    ) -> int:
+        """
+        在一个事务中撤销所有选中的令牌。
+
+        Returns:
+            int: 被撤销的令牌数量（已撤销的令牌不计入）。
+        """
+        Token = models.Token
+        stmt = (
+            update(Token)
+            .where(*self._selection(ids, token_filter), Token.status != "revoked")
+            .values(status="revoked", policy_version=Token.policy_version + 1)
+            .returning(Token.id, Token.token_string)
+            .execution_options(synchronize_session=False)
+        )
+        revoked = await self._run_bulk(stmt)
+        log.info("批量撤销了 %s 个令牌。", len(revoked))
+        return len(revoked)
+
+    async def bulk_delete_tokens(
+        self, ids: Optional[List[int]] = None, token_filter: Optional[schemas.TokenFilter] = None
+    ) -> int:
+        """
+        在一个事务中删除所有选中的令牌。
+
+        Returns:
+            int: 被删除的令牌数量。
+        """
+        Token = models.Token
+        stmt = (
+            delete(Token)
+            .where(*self._selection(ids, token_filter))
+            .returning(Token.id, Token.token_string)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = await self._run_bulk(stmt)
+        log.info("批量删除了 %s 个令牌。", len(deleted))
+        return len(deleted)
+
+    async def _run_bulk(self, stmt) -> List[str]:
+        """
+        通过写队列执行返回 `(id, token_string)` 的批量语句，并使受影响令牌的缓存失效。
+
+        Returns:
+            List[str]: 受影响令牌的令牌字符串。
+        """
+        async def job(db: AsyncSession) -> list:
+            return (await db.execute(stmt)).all()
+
+        rows = await write_queue.submit(job)
+        token_strings = [row.token_string for row in rows]
+        for row in rows:
+            token_policy_cache.invalidate(row.token_string)
+            token_id_cache.invalidate(row.id)
+        if token_strings:
+            token_count_cache.clear()
+        return token_strings
+
+    async def create_token(self, token_in: schemas.TokenCreate) -> schemas.TokenInDB:
         """
         创建一个新的访问令牌。
 
+        与其他写操作一样通过写队列执行，不占用读连接池中的会话。
+
         Args:
-            db: 数据库会话。
             token_in: 包含令牌策略的 Pydantic 模型。
 
         Returns:
-            models.Token: 创建的 Token 模型实例。
+            schemas.TokenInDB: 创建的令牌。
         """
         token_string = self._generate_token_string()
-        db_token = models.Token(
-            **token_in.model_dump(),
-            token_string=token_string
-        )
-        db.add(db_token)
-        db.commit()
-        db.refresh(db_token)
-        log.info(f"成功创建新令牌: {token_string}")
-        return db_token
+        data = normalize_policy(token_in.model_dump())
+
+        async def job(db: AsyncSession) -> schemas.TokenInDB:
+            db_token = models.Token(**data, token_string=token_string)
+            db.add(db_token)
+            await db.flush()
+            await db.refresh(db_token)
+            return schemas.TokenInDB.model_validate(db_token)
 
-    def get_token_by_id(self, db: Session, token_id: int) -> Optional[models.Token]:
+        snapshot = await write_queue.submit(job)
+        token_count_cache.clear()
+        log.info("成功创建新令牌: %s", token_string)
+        return snapshot
+
+    async def get_token_by_id(self, db: AsyncSession, token_id: int) -> Optional[models.Token]:
         """
         根据 ID 获取令牌。
         """
-        return db.query(models.Token).filter(models.Token.id == token_id).first()
+        return await db.get(models.Token, token_id)
+
+    async def get_token_policy(
+        self, db: AsyncSession, token_string: str
+    ) -> Optional[schemas.TokenInDB]:
+        """
+        获取令牌策略的只读快照，优先从缓存读取。
 
-    def get_all_tokens(self, db: Session, skip: int = 0, limit: int = 100) -> List[models.Token]:
+        查询期间令牌被更新或撤销（缓存条目被作废）时，不把查询到的快照写入缓存，
+        以免覆盖掉作废操作。
+
+        Returns:
+            Optional[schemas.TokenInDB]: 令牌不存在时返回 None。
+        """
+        snapshot = token_policy_cache.get(token_string)
+        if snapshot is not None:
+            return snapshot
+        generation = token_policy_cache.generation
+        result = await db.execute(
+            select(models.Token).where(models.Token.token_string == token_string)
+        )
+        db_token = result.scalars().first()
+        if db_token is None:
+            return None
+        snapshot = schemas.TokenInDB.model_validate(db_token)
+        token_policy_cache.set(token_string, snapshot, generation)
+        return snapshot
+
+    async def get_token_policy_by_id(
+        self, db: AsyncSession, token_id: int
+    ) -> Optional[schemas.TokenInDB]:
+        """
+        按令牌 ID 获取策略快照，与 `get_token_policy` 共用同一份缓存。
+
+        Returns:
+            Optional[schemas.TokenInDB]: 令牌不存在时返回 None。
+        """
+        token_string = token_id_cache.get(token_id)
+        if token_string is None:
+            generation = token_id_cache.generation
+            token_string = await db.scalar(
+                select(models.Token.token_string).where(models.Token.id == token_id)
+            )
+            if token_string is None:
+                return None
+            token_id_cache.set(token_id, token_string, generation)
+        return await self.get_token_policy(db, token_string)
+
+    async def consume_token(self, token_string: str) -> Optional[schemas.TokenInDB]:
+        """
+        消耗令牌的一次使用次数（访客登录）。
+
+        检查和更新在同一条条件 UPDATE 语句中完成，数据库保证其原子性，
+        大量访客同时使用同一个令牌登录时也不会超出 `max_usage_count`。
+        同一条语句还负责状态转换：首次使用时 `unused` -> `active`，
+        用完最后一次时 -> `exhausted`。
+
+        Returns:
+            Optional[schemas.TokenInDB]: 更新后的令牌策略快照；令牌不存在、
+            状态不可用、已过期或次数已用尽时返回 None，同时使该令牌的缓存失效，
+            以便调用方读取到最新的状态。
         """
-        获取所有令牌的列表，支持分页。
+        Token = models.Token
+        now = datetime.utcnow()
+        max_usage = func.coalesce(Token.max_usage_count, 0)
+        new_count = Token.current_usage_count + 1
+        stmt = (
+            update(Token)
+            .where(
+                Token.token_string == token_string,
+                Token.status.in_(USABLE_STATUSES),
+                or_(Token.expires_at.is_(None), Token.expires_at > now),
+                or_(max_usage <= 0, Token.current_usage_count < max_usage),
+            )
+            .values(
+                current_usage_count=new_count,
+                status=case((and_(max_usage > 0, new_count >= max_usage), "exhausted"), else_="active"),
+                last_used_at=now,
+            )
+            .returning(Token)
+            .execution_options(synchronize_session=False)
+        )
+
+        async def job(db: AsyncSession) -> Optional[schemas.TokenInDB]:
+            db_token = (await db.execute(stmt)).scalars().first()
+            return schemas.TokenInDB.model_validate(db_token) if db_token is not None else None
+
+        generation = token_policy_cache.generation
+        snapshot = await write_queue.submit(job)
+        if snapshot is None:
+            token_policy_cache.invalidate(token_string)
+            return None
+        token_policy_cache.set(token_string, snapshot, generation)
+        if snapshot.status == "exhausted":
+            log.info("令牌 ID %s 的使用次数已用尽。", snapshot.id)
+        return snapshot
+
+    async def mark_expired(self, token_string: str):
+        """
+        将已过期但状态仍为可用的令牌标记为 `expired`。
         """
-        return db.query(models.Token).offset(skip).limit(limit).all()
+        Token = models.Token
+        await write_queue.submit(
+            lambda db: db.execute(
+                update(Token)
+                .where(
+                    Token.token_string == token_string,
+                    Token.status.in_(USABLE_STATUSES),
+                    Token.expires_at <= datetime.utcnow(),
+                )
+                .values(status="expired")
+            )
+        )
+        token_policy_cache.invalidate(token_string)
 
-    def get_tokens_count(self, db: Session) -> int:
+    async def expire_due(self, limit: int) -> int:
         """
-        获取令牌总数。
+        将已过期但状态仍为可用的令牌标记为 `expired`，每次最多处理 `limit` 个。
+
+        借助 `(status, expires_at)` 索引直接定位到期的令牌，不需要扫描全表。
+
+        Returns:
+            int: 本次标记的令牌数量。
         """
-        return db.query(models.Token).count()
+        Token = models.Token
+        due = (
+            select(Token.id)
+            .where(Token.status.in_(USABLE_STATUSES), Token.expires_at <= datetime.utcnow())
+            .limit(limit)
+        )
+        stmt = (
+            update(Token)
+            .where(Token.id.in_(due.scalar_subquery()))
+            .values(status="expired")
+            .returning(Token.id, Token.token_string)
+            .execution_options(synchronize_session=False)
+        )
+        expired = await self._run_bulk(stmt)
+        if expired:
+            log.info("已将 %s 个到期的令牌标记为过期。", len(expired))
+        return len(expired)
 
-    def update_token(
-        self, db: Session, token_id: int, token_in: schemas.TokenUpdate
-    ) -> Optional[models.Token]:
+    async def purge_exhausted(self, limit: int) -> int:
         """
-        更新一个令牌的策略。
+        删除设置了 `delete_on_exhaust` 且已用尽的令牌，每次最多处理 `limit` 个。
+
+        删除推迟到最后一次登录的会话过期之后，避免最后一位访客的会话被立即中止。
+
+        Returns:
+            int: 本次删除的令牌数量。
         """
-        db_token = self.get_token_by_id(db, token_id)
-        if not db_token:
+        Token = models.Token
+        cutoff = datetime.utcnow() - timedelta(minutes=settings.GUEST_SESSION_EXPIRE_MINUTES)
+        due = (
+            select(Token.id)
+            .where(
+                # 令牌只会在登录时变为 exhausted，此时 last_used_at 一定已被设置
+                Token.status == "exhausted",
+                Token.last_used_at <= cutoff,
+                Token.delete_on_exhaust.is_(True),
+            )
+            .limit(limit)
+        )
+        stmt = (
+            delete(Token)
+            .where(Token.id.in_(due.scalar_subquery()))
+            .returning(Token.id, Token.token_string)
+            .execution_options(synchronize_session=False)
+        )
+        deleted = await self._run_bulk(stmt)
+        if deleted:
+            log.info("已删除 %s 个用尽后自动删除的令牌。", len(deleted))
+        return len(deleted)
+
+    def _list_filters(
+        self,
+        statuses: Optional[List[str]] = None,
+        expires_after: Optional[datetime] = None,
+        expires_before: Optional[datetime] = None,
+        search: Optional[str] = None,
+    ) -> list:
+        Token = models.Token
+        filters = []
+        if statuses:
+            filters.append(Token.status.in_(statuses))
+        if expires_after is not None:
+            filters.append(Token.expires_at >= to_utc_naive(expires_after))
+        if expires_before is not None:
+            filters.append(Token.expires_at < to_utc_naive(expires_before))
+        if search:
+            escaped = search.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            filters.append(or_(
+                Token.description.ilike(f"%{escaped}%", escape="\\"),
+                Token.token_string == search.strip().upper(),
+            ))
+        return filters
+
+    async def count_tokens(self, db: AsyncSession, filters: list, cache_key: tuple) -> int:
+        """
+        获取符合筛选条件的令牌总数，结果会被缓存。
+        """
+        total = token_count_cache.get(cache_key)
+        if total is None:
+            generation = token_count_cache.generation
+            total = await db.scalar(select(func.count()).select_from(models.Token).where(*filters))
+            token_count_cache.set(cache_key, total, generation)
+        return total
+
+    async def list_tokens(
+        self,
+        db: AsyncSession,
+        limit: int = 20,
+        cursor: Optional[str] = None,
+        page: int = 1,
+        sort: str = "id",
+        order: str = "desc",
+        statuses: Optional[List[str]] = None,
+        expires_after: Optional[datetime] = None,
+        expires_before: Optional[datetime] = None,
+        search: Optional[str] = None,
+    ) -> dict:
+        """
+        分页获取令牌列表，只查询 `TokenPublic` 需要的列。
+
+        提供 `cursor` 时使用键集分页：按 `(排序列, id)` 从上一页的最后一条记录
+        之后继续读取，借助索引直接定位，代价与页码无关。
+        未提供游标时按 `page` 偏移分页（兼容旧客户端，页码很大时较慢）。
+
+        Args:
+            db: 数据库会话。
+            limit: 每页数量。
+            cursor: 上一页返回的游标。
+            page: 页码，仅在没有游标时使用。
+            sort: 排序列，`id` 或 `created_at`。
+            order: `asc` 或 `desc`。
+            statuses: 只返回这些状态的令牌。
+            expires_after: 只返回过期时间不早于此时间的令牌。
+            expires_before: 只返回过期时间早于此时间的令牌。
+            search: 按备注模糊搜索，或按令牌字符串精确匹配。
+
+        Returns:
+            dict: 包含 `total`、`items` 和 `next_cursor` 的字典。
+        """
+        Token = models.Token
+        filters = self._list_filters(statuses, expires_after, expires_before, search)
+        cache_key = (tuple(sorted(statuses or ())), expires_after, expires_before, search)
+        total = await self.count_tokens(db, filters, cache_key)
+
+        sort_column = Token.created_at if sort == "created_at" else Token.id
+        descending = order == "desc"
+        stmt = select(*TOKEN_LIST_COLUMNS).where(*filters)
+        if cursor:
+            value, last_id = decode_cursor(cursor)
+            if sort == "created_at":
+                try:
+                    value = datetime.fromisoformat(value)
+                except (TypeError, ValueError):
+                    raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
+            if descending:
+                stmt = stmt.where(or_(sort_column < value, and_(sort_column == value, Token.id < last_id)))
+            else:
+                stmt = stmt.where(or_(sort_column > value, and_(sort_column == value, Token.id > last_id)))
+        elif page > 1:
+            stmt = stmt.offset((page - 1) * limit)
+
+        if descending:
+            stmt = stmt.order_by(sort_column.desc(), Token.id.desc())
+        else:
+            stmt = stmt.order_by(sort_column.asc(), Token.id.asc())
+        # 多取一条，用于判断是否还有下一页
+        rows = (await db.execute(stmt.limit(limit + 1))).mappings().all()
+
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = None
+        if len(rows) > limit:
+            last = items[-1]
+            value = last["created_at"].isoformat() if sort == "created_at" else last["id"]
+            next_cursor = encode_cursor((value, last["id"]))
+        return {"total": total, "items": items, "next_cursor": next_cursor}
+
+    async def update_token(
+        self, token_id: int, token_in: schemas.TokenUpdate
+    ) -> Optional[schemas.TokenInDB]:
+        """
+        更新一个令牌的策略。读取、修改和提交都在写队列中完成。
+        """
+        update_data = normalize_policy(token_in.model_dump(exclude_unset=True))
+
+        async def job(db: AsyncSession) -> Optional[schemas.TokenInDB]:
+            db_token = await db.get(models.Token, token_id)
+            if not db_token:
+                return None
+            for key, value in update_data.items():
+                setattr(db_token, key, value)
+
+            # 放宽了次数限制或有效期时，令牌重新变为可用
+            max_usage = db_token.max_usage_count or 0
+            if db_token.status == "exhausted" and (max_usage <= 0 or db_token.current_usage_count < max_usage):
+                db_token.status = "active"
+            elif db_token.status == "expired" and not is_expired(db_token.expires_at):
+                db_token.status = "active" if db_token.current_usage_count else "unused"
+            db_token.policy_version = (db_token.policy_version or 1) + 1
+            await db.flush()
+            await db.refresh(db_token)
+            return schemas.TokenInDB.model_validate(db_token)
+
+        snapshot = await write_queue.submit(job)
+        if snapshot is None:
             return None
-        
-        update_data = token_in.model_dump(exclude_unset=True)
-        for key, value in update_data.items():
-            setattr(db_token, key, value)
-        
-        db.commit()
-        db.refresh(db_token)
-        log.info(f"令牌 ID {token_id} 已更新。")
-        return db_token
-
-    def delete_token(self, db: Session, token_id: int) -> bool:
+        token_policy_cache.invalidate(snapshot.token_string)
+        token_count_cache.clear()
+        log.info("令牌 ID %s 已更新。", token_id)
+        return snapshot
+
+    async def delete_token(self, token_id: int) -> bool:
         """
         删除一个令牌。
         """
-        db_token = self.get_token_by_id(db, token_id)
-        if not db_token:
+        Token = models.Token
+        token_string = await write_queue.submit(
+            lambda db: db.scalar(delete(Token).where(Token.id == token_id).returning(Token.token_string))
+        )
+        if token_string is None:
             return False
-        
-        db.delete(db_token)
-        db.commit()
-        log.info(f"令牌 ID {token_id} 已删除。")
+        token_policy_cache.invalidate(token_string)
+        token_id_cache.invalidate(token_id)
+        token_count_cache.clear()
+        log.info("令牌 ID %s 已删除。", token_id)
         return True
 
-    def revoke_token(self, db: Session, token_id: int) -> Optional[models.Token]:
+    async def revoke_token(self, token_id: int) -> Optional[str]:
         """
         手动撤销一个令牌。
+
+        Returns:
+            Optional[str]: 被撤销令牌的令牌字符串；令牌不存在时返回 None。
         """
-        db_token = self.get_token_by_id(db, token_id)
-        if not db_token:
+        Token = models.Token
+        token_string = await write_queue.submit(
+            lambda db: db.scalar(
+                update(Token)
+                .where(Token.id == token_id)
+                .values(status="revoked", policy_version=Token.policy_version + 1)
+                .returning(Token.token_string)
+                .execution_options(synchronize_session=False)
+            )
+        )
+        if token_string is None:
             return None
-        
-        db_token.status = "revoked"
-        db.commit()
-        db.refresh(db_token)
-        log.info(f"令牌 ID {token_id} 已被撤销。")
-        return db_token
+        token_policy_cache.invalidate(token_string)
+        token_count_cache.clear()
+        log.info("令牌 ID %s 已被撤销。", token_id)
+        return token_string
 
 # 创建一个服务实例
 token_service = TokenService()
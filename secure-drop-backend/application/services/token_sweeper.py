@@ -0,0 +1,83 @@
+"""
+令牌清理任务模块
+
+后台定期执行：把到期的令牌标记为 `expired`，并删除设置了 `delete_on_exhaust`
+且已用尽的令牌，同时使它们的缓存失效；另外回收租约已过期的上传配额预留
+和超过有效期的分块上传会话。
+
+每批最多处理 `TOKEN_SWEEP_BATCH_SIZE` 个令牌，各批分别提交，
+单个事务不会长时间占用写连接；一批处理满时立即继续下一批，直到没有剩余。
+"""
+import asyncio
+from typing import Optional
+from application.services.quota_service import quota_service
+from application.services.token_service import token_service
+from application.services.upload_session_service import upload_session_service
+from utils.config import settings
+from utils.logger import log
+
+
+class TokenSweeper:
+    """
+    定期清理到期和用尽令牌的后台任务。
+    """
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """
+        启动后台任务，启动时立即执行一次清理。
+        """
+        if self.interval <= 0:
+            return
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def sweep(self) -> int:
+        """
+        执行一轮清理。
+
+        Returns:
+            int: 本轮过期和删除的令牌、清理的上传会话以及回收的配额预留总数。
+        """
+        total = 0
+        steps = (
+            token_service.expire_due,
+            token_service.purge_exhausted,
+            upload_session_service.purge_expired,
+            quota_service.expire_reservations,
+        )
+        for step in steps:
+            while True:
+                count = await step(self.batch_size)
+                total += count
+                if count < self.batch_size:
+                    break
+        return total
+
+    async def _run(self):
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                log.error("清理到期令牌时出错: %s", e)
+            await asyncio.sleep(self.interval)
+
+# 创建一个全局实例
+token_sweeper = TokenSweeper(
+    interval=settings.TOKEN_SWEEP_INTERVAL_SECONDS,
+    batch_size=settings.TOKEN_SWEEP_BATCH_SIZE,
+)
@@ -0,0 +1,474 @@
+"""
+分块上传会话服务模块
+
+实现类似 tus 的可续传上传协议：创建会话、按偏移量写入任意字节区间、
+查询进度、最终提交。分块可以并行上传，数据直接写入预分配的暂存文件，
+提交时只做一次重命名，不需要重新读取整个文件。
+
+会话的元数据和已接收的区间保存在数据库中（写操作通过写队列提交），
+暂存文件的读写都在线程中进行，事件循环上没有同步的文件操作。
+过期会话由后台清理任务定期回收，创建会话时不扫描暂存目录。
+
+会话记录中登记了正在写入的请求数：提交会话时先在同一条 UPDATE 中确认没有正在写入的请求
+并将会话标记为提交中，之后新的写入请求会被拒绝，提交不会与写入交错而得到不完整的文件。
+"""
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional
+import anyio
+from fastapi import HTTPException, status
+from sqlalchemy import case, delete, insert, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from application.services.file_service import file_service
+from application.services.quota_service import quota_service
+from domain import models
+from domain.storage import storage_service
+from domain.models import Token
+from domain.write_queue import write_queue
+from utils.config import settings
+from utils.logger import log
+from utils.multipart_stream import sanitize_filename
+
+# 暂存目录（相对于存储根目录），以点开头以便在目录列表中隐藏
+STAGING_DIR = ".staging"
+
+# 写入请求在进行期间定期刷新会话的心跳时间（秒）；
+# 超过 WRITER_STALE_SECONDS 没有心跳，说明登记的写入请求所在的进程已经退出，登记的写入数不再计入
+WRITER_HEARTBEAT_SECONDS = 30
+WRITER_STALE_SECONDS = 120
+
+
+class UploadSession:
+    """
+    一个分块上传会话的元数据。
+
+    `ranges` 保存已接收的字节区间，格式为已排序、互不重叠的 [start, end) 列表；
+    `reservation_id` 是创建会话时预留的上传配额的编号（令牌未设置配额时为 None），
+    预留的租约与会话同时到期。
+    """
+
+    def __init__(
+        self,
+        upload_id: str,
+        token_id: int,
+        filename: str,
+        size: int,
+        created_at: float,
+        ranges: Optional[List[List[int]]] = None,
+        reservation_id: Optional[int] = None,
+    ):
+        self.upload_id = upload_id
+        self.token_id = token_id
+        self.filename = filename
+        self.size = size
+        self.created_at = created_at
+        self.ranges = []
+        self.reservation_id = reservation_id
+        for start, end in ranges or ():
+            self.add_range(start, end)
+
+    @property
+    def offset(self) -> int:
+        """
+        从文件开头开始连续接收的字节数，供串行续传的客户端使用。
+        """
+        if self.ranges and self.ranges[0][0] == 0:
+            return self.ranges[0][1]
+        return 0
+
+    @property
+    def is_complete(self) -> bool:
+        return self.offset == self.size
+
+    def add_range(self, start: int, end: int):
+        """
+        记录一个新接收的区间，并与已有区间合并。
+        """
+        if end <= start:
+            return
+        merged = []
+        for r_start, r_end in sorted(self.ranges + [[start, end]]):
+            if merged and r_start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], r_end)
+            else:
+                merged.append([r_start, r_end])
+        self.ranges = merged
+
+
+class UploadSessionService:
+    """
+    管理分块上传会话的生命周期。
+
+    每个会话在暂存目录中对应一个预分配大小的数据文件 `<id>.part`，
+    元数据保存在 `upload_sessions` 表中，已接收的区间保存在 `upload_ranges` 表中。
+    """
+
+    @property
+    def staging_path(self) -> str:
+        return storage_service.get_file_path(STAGING_DIR)
+
+    def _data_path(self, upload_id: str) -> str:
+        return os.path.join(self.staging_path, f"{upload_id}.part")
+
+    def _remove_data(self, upload_id: str):
+        try:
+            os.remove(self._data_path(upload_id))
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    async def _load(db: AsyncSession, upload_id: str, token_id: int) -> Optional[UploadSession]:
+        Session = models.UploadSession
+        row = (await db.execute(
+            select(Session.id, Session.token_id, Session.filename, Session.size,
+                   Session.created_at, Session.reservation_id)
+            .where(Session.id == upload_id, Session.token_id == token_id)
+        )).first()
+        if row is None:
+            return None
+        ranges = (await db.execute(
+            select(models.UploadRange.start, models.UploadRange.end)
+            .where(models.UploadRange.upload_id == upload_id)
+        )).all()
+        return UploadSession(
+            upload_id=row.id,
+            token_id=row.token_id,
+            filename=row.filename,
+            size=row.size,
+            created_at=row.created_at.replace(tzinfo=timezone.utc).timestamp(),
+            ranges=[list(r) for r in ranges],
+            reservation_id=row.reservation_id,
+        )
+
+    async def get_session(self, db: AsyncSession, upload_id: str, policy: Token) -> UploadSession:
+        """
+        获取属于当前令牌的会话，不存在或不属于该令牌时返回 404。
+        """
+        session = None
+        if self._valid_id(upload_id):
+            session = await self._load(db, upload_id, policy.id)
+        if session is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="上传会话不存在")
+        return session
+
+    @staticmethod
+    def _valid_id(upload_id: str) -> bool:
+        # upload_id 只允许十六进制字符，防止拼接出暂存目录以外的路径
+        return all(c in "0123456789abcdef" for c in upload_id)
+
+    @staticmethod
+    async def _conflict(db: AsyncSession, upload_id: str, token_id: int) -> HTTPException:
+        """
+        会话状态不允许当前操作时，返回对应的错误：会话不存在为 404，正在提交或仍有写入为 409。
+
+        在写队列的写操作中调用，由调用方在事务提交后抛出，出错不会使同批的其他写操作回滚。
+        """
+        Session = models.UploadSession
+        row = (await db.execute(
+            select(Session.completing).where(Session.id == upload_id, Session.token_id == token_id)
+        )).first()
+        if row is None:
+            return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="上传会话不存在")
+        if row.completing:
+            return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="上传会话正在提交。")
+        return HTTPException(status_code=status.HTTP_409_CONFLICT, detail="仍有分块正在写入，请稍后再提交。")
+
+    def _remove_stale_files(self, deadline: float) -> int:
+        """
+        删除修改时间早于 `deadline` 的暂存文件（同步执行，应在线程中调用）。
+
+        会话的数据文件在创建会话时生成，之后每次写入都会更新修改时间，
+        修改时间早于有效期的文件一定属于已过期的会话，或是没有对应会话记录的遗留文件。
+        """
+        removed = 0
+        try:
+            it = os.scandir(self.staging_path)
+        except FileNotFoundError:
+            return 0
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_file() and entry.stat().st_mtime < deadline:
+                        os.remove(entry.path)
+                        removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    async def purge_expired(self, limit: int) -> int:
+        """
+        清理超过有效期的会话及其暂存数据，并释放它们预留的配额，每次最多处理 `limit` 个会话。
+
+        由后台清理任务定期调用。
+
+        Returns:
+            int: 被清理的会话数量。
+        """
+        ttl = settings.UPLOAD_SESSION_TTL_HOURS * 3600
+        cutoff = datetime.utcnow() - timedelta(seconds=ttl)
+        Session = models.UploadSession
+        due = select(Session.id).where(Session.created_at < cutoff).limit(limit)
+
+        async def job(db: AsyncSession) -> list:
+            rows = (await db.execute(
+                delete(Session)
+                .where(Session.id.in_(due.scalar_subquery()))
+                .returning(Session.id, Session.token_id, Session.reservation_id)
+                .execution_options(synchronize_session=False)
+            )).all()
+            if rows:
+                await db.execute(
+                    delete(models.UploadRange).where(models.UploadRange.upload_id.in_([r[0] for r in rows]))
+                )
+            return rows
+
+        rows = await write_queue.submit(job)
+        for upload_id, token_id, reservation_id in rows:
+            await quota_service.release(token_id, reservation_id)
+        # 已删除会话的数据文件，以及没有会话记录的遗留文件
+        await anyio.to_thread.run_sync(self._remove_stale_files, time.time() - ttl)
+        if rows:
+            log.info("已清理 %s 个过期的上传会话。", len(rows))
+        return len(rows)
+
+    def _preallocate(self, session: UploadSession):
+        os.makedirs(self.staging_path, exist_ok=True)
+        # truncate 在大多数文件系统上会生成稀疏文件，不会真正写入 size 个字节
+        with open(self._data_path(session.upload_id), "wb") as f:
+            f.truncate(session.size)
+
+    async def create_session(
+        self, filename: str, size: int, policy: Token
+    ) -> UploadSession:
+        """
+        创建上传会话，按声明的大小预留上传配额并预分配暂存文件。
+        """
+        filename = sanitize_filename(filename)
+        file_service.admit_upload(policy, content_length=None, filename=filename, file_size=size)
+
+        reservation_id = await quota_service.reserve(
+            policy, size, lease_seconds=settings.UPLOAD_SESSION_TTL_HOURS * 3600
+        )
+        now = datetime.utcnow()
+        session = UploadSession(
+            upload_id=uuid.uuid4().hex,
+            token_id=policy.id,
+            filename=filename,
+            size=size,
+            created_at=now.replace(tzinfo=timezone.utc).timestamp(),
+            reservation_id=reservation_id,
+        )
+        try:
+            await anyio.to_thread.run_sync(self._preallocate, session)
+            await write_queue.submit(lambda db: db.execute(
+                insert(models.UploadSession).values(
+                    id=session.upload_id,
+                    token_id=policy.id,
+                    filename=filename,
+                    size=size,
+                    created_at=now,
+                    reservation_id=reservation_id,
+                )
+            ))
+        except Exception:
+            await quota_service.release(policy.id, reservation_id)
+            await anyio.to_thread.run_sync(self._remove_data, session.upload_id)
+            raise
+        log.info("令牌 ID %s 创建了上传会话 %s: %s (%s 字节)", policy.id, session.upload_id, filename, size)
+        return session
+
+    async def _begin_write(self, upload_id: str, token_id: int) -> UploadSession:
+        """
+        登记一个写入请求。会话正在提交时拒绝写入（409）。
+        """
+        Session = models.UploadSession
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=WRITER_STALE_SECONDS)
+
+        async def job(db: AsyncSession):
+            result = await db.execute(
+                update(Session)
+                .where(Session.id == upload_id, Session.token_id == token_id, Session.completing.is_(False))
+                .values(
+                    # 心跳已经过期的登记来自已退出的进程，重新计数
+                    writers=case((Session.writers_seen_at < stale, 1), else_=Session.writers + 1),
+                    writers_seen_at=now,
+                )
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                return await self._conflict(db, upload_id, token_id)
+            return await self._load(db, upload_id, token_id)
+
+        result = await write_queue.submit(job)
+        if isinstance(result, HTTPException):
+            raise result
+        return result
+
+    async def _end_write(self, upload_id: str, start: int, end: int) -> Optional[UploadSession]:
+        """
+        注销一个写入请求并记录它写入的区间，返回更新后的会话（会话已不存在时返回 None）。
+        """
+        Session = models.UploadSession
+
+        async def job(db: AsyncSession) -> Optional[UploadSession]:
+            token_id = (await db.execute(
+                update(Session)
+                .where(Session.id == upload_id)
+                .values(writers=case((Session.writers > 0, Session.writers - 1), else_=0))
+                .returning(Session.token_id)
+                .execution_options(synchronize_session=False)
+            )).scalar()
+            if token_id is None:
+                return None
+            if end > start:
+                await db.execute(insert(models.UploadRange).values(upload_id=upload_id, start=start, end=end))
+            return await self._load(db, upload_id, token_id)
+
+        return await write_queue.submit(job)
+
+    async def _heartbeat(self, upload_id: str):
+        Session = models.UploadSession
+        while True:
+            await asyncio.sleep(WRITER_HEARTBEAT_SECONDS)
+            await write_queue.submit(lambda db: db.execute(
+                update(Session).where(Session.id == upload_id).values(writers_seen_at=datetime.utcnow())
+            ))
+
+    async def write_chunk(
+        self, upload_id: str, offset: int, chunks: AsyncIterator[bytes], policy: Token
+    ) -> UploadSession:
+        """
+        将请求体写入会话数据文件的指定偏移量。
+
+        写入期间会话登记为有写入进行中，此时不能提交；会话开始提交后拒绝新的写入。
+        即使连接中途断开，已经写入磁盘的部分也会被记录，客户端可以从断点继续。
+        """
+        if not self._valid_id(upload_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="上传会话不存在")
+        session = await self._begin_write(upload_id, policy.id)
+        position = offset
+        heartbeat = asyncio.get_running_loop().create_task(self._heartbeat(upload_id))
+        try:
+            if offset < 0 or offset > session.size:
+                raise HTTPException(
+                    status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                    detail=f"偏移量超出文件范围 (0-{session.size})。"
+                )
+            async with await anyio.open_file(self._data_path(upload_id), "r+b") as f:
+                await f.seek(offset)
+                async for chunk in chunks:
+                    if position + len(chunk) > session.size:
+                        raise HTTPException(
+                            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                            detail="写入的数据超出了会话声明的文件大小。"
+                        )
+                    await f.write(chunk)
+                    position += len(chunk)
+        except FileNotFoundError:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="上传会话不存在")
+        finally:
+            heartbeat.cancel()
+            # 数据文件已关闭，之后再注销写入请求；submit 在调用方被取消时也会等待写操作完成
+            latest = await self._end_write(upload_id, offset, position)
+            if latest is not None:
+                session = latest
+        return session
+
+    async def _set_completing(self, upload_id: str, value: bool):
+        Session = models.UploadSession
+        await write_queue.submit(lambda db: db.execute(
+            update(Session).where(Session.id == upload_id).values(completing=value)
+        ))
+
+    async def complete_session(self, upload_id: str, policy: Token) -> str:
+        """
+        提交上传：校验数据完整后，按令牌的冲突策略移动到最终位置。
+
+        仍有分块正在写入或会话已在提交时返回 409。
+
+        Returns:
+            str: 最终保存的文件名。
+        """
+        if not self._valid_id(upload_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="上传会话不存在")
+        Session = models.UploadSession
+        stale = datetime.utcnow() - timedelta(seconds=WRITER_STALE_SECONDS)
+
+        async def job(db: AsyncSession):
+            result = await db.execute(
+                update(Session)
+                .where(
+                    Session.id == upload_id,
+                    Session.token_id == policy.id,
+                    Session.completing.is_(False),
+                    or_(Session.writers == 0, Session.writers_seen_at < stale),
+                )
+                .values(completing=True)
+                .execution_options(synchronize_session=False)
+            )
+            if result.rowcount == 0:
+                return await self._conflict(db, upload_id, policy.id)
+            return await self._load(db, upload_id, policy.id)
+
+        session = await write_queue.submit(job)
+        if isinstance(session, HTTPException):
+            raise session
+        try:
+            if not session.is_complete:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"文件尚未上传完整 ({session.offset}/{session.size} 字节)。"
+                )
+            final_path = file_service.resolve_destination(session.filename, policy)
+            saved_path = await anyio.to_thread.run_sync(
+                storage_service.commit_file, self._data_path(upload_id), final_path
+            )
+        except BaseException:
+            await self._set_completing(upload_id, False)
+            raise
+        await self._delete_session(upload_id)
+        await quota_service.settle(policy.id, session.reservation_id, session.size)
+        log.info("上传会话 %s 已完成: %s", upload_id, saved_path)
+        return os.path.basename(saved_path)
+
+    async def _delete_session(self, upload_id: str):
+        async def job(db: AsyncSession):
+            await db.execute(delete(models.UploadSession).where(models.UploadSession.id == upload_id))
+            await db.execute(delete(models.UploadRange).where(models.UploadRange.upload_id == upload_id))
+
+        await write_queue.submit(job)
+
+    async def abort_session(self, upload_id: str, policy: Token):
+        """
+        放弃一个上传会话，删除其暂存数据并释放预留的配额。正在提交的会话不能取消（409）。
+        """
+        if not self._valid_id(upload_id):
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="上传会话不存在")
+        Session = models.UploadSession
+
+        async def job(db: AsyncSession):
+            row = (await db.execute(
+                delete(Session)
+                .where(Session.id == upload_id, Session.token_id == policy.id, Session.completing.is_(False))
+                .returning(Session.reservation_id)
+                .execution_options(synchronize_session=False)
+            )).first()
+            if row is None:
+                return await self._conflict(db, upload_id, policy.id)
+            await db.execute(delete(models.UploadRange).where(models.UploadRange.upload_id == upload_id))
+            return row
+
+        row = await write_queue.submit(job)
+        if isinstance(row, HTTPException):
+            raise row
+        reservation_id = row.reservation_id
+        await anyio.to_thread.run_sync(self._remove_data, upload_id)
+        await quota_service.release(policy.id, reservation_id)
+        log.info("上传会话 %s 已被取消。", upload_id)
+
+# 创建一个服务实例
+upload_session_service = UploadSessionService()
@@ -2,12 +2,17 @@
 用户服务模块
 
 处理与管理员账户相关的业务逻辑。
+
+同步方法供 `create_admin.py` 等命令行脚本使用，API 请求使用异步方法。
 """
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional
 from domain import models
 from application import schemas
-from utils.security import get_password_hash
+from utils.security import get_password_hash, verify_password
 
 class UserService:
     """
@@ -27,6 +32,31 @@ class UserService:
         """
         return db.query(models.Admin).filter(models.Admin.username == username).first()
 
+    async def authenticate(
+        self, db: AsyncSession, username: str, password: str
+    ) -> Optional[models.Admin]:
+        """
+        验证管理员的用户名和密码。
+
+        bcrypt 校验是刻意设计得很慢的 CPU 密集操作，因此放到线程池中执行，
+        避免阻塞事件循环。
+
+        Args:
+            db: 异步数据库会话。
+            username: 管理员用户名。
+            password: 明文密码。
+
+        Returns:
+            Optional[models.Admin]: 验证成功时返回 Admin 模型实例，否则返回 None。
+        """
+        result = await db.execute(select(models.Admin).where(models.Admin.username == username))
+        user = result.scalars().first()
+        if user is None:
+            return None
+        if not await run_in_threadpool(verify_password, password, user.hashed_password):
+            return None
+        return user
+
     def create_admin_user(self, db: Session, user: schemas.AdminCreate) -> models.Admin:
         """
         创建一个新的管理员用户。
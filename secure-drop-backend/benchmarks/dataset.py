@@ -0,0 +1,317 @@
+"""
+合成测试数据生成器
+
+向 `tokens` 和 `access_logs` 表批量写入大量数据，并在 `STORAGE_PATH` 下生成目录树，
+用于观察各项操作随数据规模的变化。数据由固定的随机种子生成，同样的参数得到同样的数据。
+
+令牌的策略按接近实际使用的比例分布：大部分是一次性令牌，少量不限次数；
+状态、有效期、使用次数彼此一致（例如 `exhausted` 的令牌使用次数等于上限）。
+访问日志集中在少数热门令牌上（近似 Zipf 分布），时间按顺序递增。
+
+重复运行时追加数据（令牌字符串不会与已有的数据冲突）。数据库和存储目录来自当前配置
+（`.env` 或环境变量），请不要在生产环境中运行。
+
+在 secure-drop-backend 目录下运行：
+
+    python -m benchmarks.dataset --tokens 1000000 --access-logs 5000000
+    python -m benchmarks.dataset --files 100000 --depth 3 --fanout 8 --tree-name bench-tree
+"""
+import argparse
+import math
+import os
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List, Sequence, Tuple
+
+from sqlalchemy import create_engine, func, select
+
+from domain.database import Base
+from domain.models import AccessLog, Token
+from utils.config import settings
+
+# 每个事务写入的行数
+BATCH_SIZE = 20000
+SEED = 20240101
+
+# 生成的数据时间跨度（天），以当前时间为终点
+TIME_SPAN_DAYS = 365
+
+def _distribution(weights: Sequence[Tuple[object, int]]) -> Tuple[list, list]:
+    """
+    把 [(取值, 权重)] 转换为 `random.choices` 使用的 (取值列表, 累计权重列表)。
+    """
+    values, cumulative, total = [], [], 0
+    for value, weight in weights:
+        total += weight
+        values.append(value)
+        cumulative.append(total)
+    return values, cumulative
+
+
+def _pick(rng: random.Random, distribution: Tuple[list, list]):
+    values, cumulative = distribution
+    return rng.choices(values, cum_weights=cumulative)[0]
+
+
+STATUSES = _distribution([("unused", 35), ("active", 30), ("exhausted", 20), ("expired", 10), ("revoked", 5)])
+# 0 表示不限次数
+MAX_USAGE_COUNTS = _distribution([(1, 50), (5, 20), (10, 10), (0, 20)])
+FILE_TYPES = _distribution([(None, 40), (".pdf,.docx", 25), (".jpg,.png", 20), (".zip", 15)])
+FILE_SIZES_MB = _distribution([(None, 30), (10, 30), (100, 25), (1024, 15)])
+CONFLICT_STRATEGIES = _distribution([("rename", 80), ("overwrite", 10), ("reject", 10)])
+BANDWIDTH_LIMITS_KBPS = _distribution([(0, 85), (1024, 10), (10240, 5)])
+ACTIONS = _distribution([
+    ("login", 30), ("list_files", 30), ("download", 20), ("upload", 12),
+    ("login_failed", 5), ("download_archive", 3),
+])
+# 访问日志中热门令牌的集中程度（帕累托分布的形状参数），越小越集中
+ACCESS_LOG_SKEW = 1.2
+# 帕累托分布到令牌排名的缩放系数，越大排名第一的令牌占比越小（100 时约为 1%）
+ACCESS_LOG_RANK_SCALE = 100
+# 访问日志使用的客户端 IP 数
+IP_POOL_SIZE = 5000
+
+# 令牌字符串 = 序号乘以一个奇数后取低 64 位：结果互不相同，看起来又是随机的
+TOKEN_MULTIPLIER = 0x9E3779B97F4A7C15
+TOKEN_MASK = (1 << 64) - 1
+
+
+def token_string_for(index: int) -> str:
+    """
+    第 `index` 个生成的令牌的令牌字符串（与 `TokenService` 生成的格式相同）。
+    """
+    return f"{(index * TOKEN_MULTIPLIER) & TOKEN_MASK:016X}"
+
+
+def make_token_row(index: int, rng: random.Random, created_at: datetime, now: datetime) -> dict:
+    """
+    生成一行令牌数据，各字段的取值互相一致。
+    """
+    status = _pick(rng, STATUSES)
+    max_usage = _pick(rng, MAX_USAGE_COUNTS)
+    if status == "exhausted" and max_usage == 0:
+        max_usage = 1
+    elif status == "active" and max_usage == 1:
+        # 只能使用一次的令牌登录后即为 exhausted，不会处于 active 状态
+        max_usage = 5
+
+    if status == "expired":
+        expires_at = created_at + (now - created_at) * rng.random()
+    elif rng.random() < 0.2:
+        expires_at = None
+    else:
+        expires_at = now + timedelta(days=rng.uniform(1, 90))
+
+    if status == "unused":
+        usage = 0
+    elif status == "exhausted":
+        usage = max_usage
+    elif max_usage == 0:
+        usage = rng.randint(1, 50)
+    elif status == "active":
+        usage = rng.randint(1, max_usage - 1)
+    else:
+        usage = rng.randint(0, max_usage)
+    last_used_at = created_at + (now - created_at) * rng.random() if usage else None
+
+    allow_upload = rng.random() < 0.6
+    allow_download = rng.random() < 0.7
+    group = rng.randrange(100)
+    uploaded = rng.randrange(0, 512 * 1024 * 1024) if allow_upload and usage else 0
+    return {
+        "token_string": token_string_for(index),
+        "description": f"合成数据 #{index} (分组 {group})",
+        "status": status,
+        "created_at": created_at,
+        "expires_at": expires_at,
+        "max_usage_count": max_usage,
+        "current_usage_count": usage,
+        "last_used_at": last_used_at,
+        "delete_on_exhaust": rng.random() < 0.05,
+        "allow_upload": allow_upload,
+        "upload_path": f"uploads/group-{group:02d}" if allow_upload else None,
+        "allowed_file_types": _pick(rng, FILE_TYPES) if allow_upload else None,
+        "max_file_size_mb": _pick(rng, FILE_SIZES_MB) if allow_upload else None,
+        "max_total_upload_gb": rng.choice((None, None, 1, 10)) if allow_upload else None,
+        "uploaded_bytes": uploaded,
+        "reserved_bytes": 0,
+        "upload_bandwidth_limit_kbps": _pick(rng, BANDWIDTH_LIMITS_KBPS),
+        "filename_conflict_strategy": _pick(rng, CONFLICT_STRATEGIES),
+        "allow_download": allow_download,
+        "downloadable_path": f"shared/group-{group:02d}" if allow_download else None,
+        "download_bandwidth_limit_kbps": _pick(rng, BANDWIDTH_LIMITS_KBPS),
+        "allow_resumable_download": rng.random() < 0.9,
+        "policy_version": 2 if rng.random() < 0.1 else 1,
+    }
+
+
+def generate_tokens(engine, count: int, seed: int = SEED, progress=None) -> Tuple[int, int]:
+    """
+    追加 `count` 个令牌，创建时间在最近 `TIME_SPAN_DAYS` 天内按 ID 递增。
+
+    Returns:
+        Tuple[int, int]: 新令牌的起始序号和数量（序号可用于 `token_string_for`）。
+    """
+    with engine.connect() as conn:
+        start = conn.scalar(select(func.coalesce(func.max(Token.id), 0)))
+    rng = random.Random(seed + start)
+    now = datetime.utcnow()
+    first = now - timedelta(days=TIME_SPAN_DAYS)
+    step = timedelta(days=TIME_SPAN_DAYS) / max(count, 1)
+    for offset in range(0, count, BATCH_SIZE):
+        rows = [
+            make_token_row(start + i, rng, first + step * i, now)
+            for i in range(offset, min(offset + BATCH_SIZE, count))
+        ]
+        with engine.begin() as conn:
+            conn.execute(Token.__table__.insert(), rows)
+        if progress is not None:
+            progress(offset + len(rows), count)
+    return start, count
+
+
+def generate_access_logs(engine, count: int, seed: int = SEED, progress=None) -> int:
+    """
+    追加 `count` 条访问日志，分布在已有的令牌上（热门令牌占多数）。
+
+    Returns:
+        int: 写入的条数；没有令牌时不写入。
+    """
+    with engine.connect() as conn:
+        min_id, max_id = conn.execute(select(func.min(Token.id), func.max(Token.id))).one()
+        existing = conn.scalar(select(func.count()).select_from(AccessLog))
+    if min_id is None:
+        return 0
+    rng = random.Random(seed + existing)
+    span = max_id - min_id + 1
+    ips = [f"10.{rng.randrange(256)}.{rng.randrange(256)}.{rng.randrange(1, 255)}" for _ in range(IP_POOL_SIZE)]
+    now = datetime.utcnow()
+    first = now - timedelta(days=TIME_SPAN_DAYS)
+    step = timedelta(days=TIME_SPAN_DAYS) / max(count, 1)
+    for offset in range(0, count, BATCH_SIZE):
+        rows = []
+        for i in range(offset, min(offset + BATCH_SIZE, count)):
+            # 按幂律分布选取令牌的排名，再打散到 ID 范围内，热门令牌不全是最早创建的
+            rank = min(int((rng.paretovariate(ACCESS_LOG_SKEW) - 1) * ACCESS_LOG_RANK_SCALE), span - 1)
+            token_id = min_id + (rank * TOKEN_MULTIPLIER) % span
+            action = _pick(rng, ACTIONS)
+            rows.append({
+                "token_id": None if action == "login_failed" else token_id,
+                "ip_address": ips[rng.randrange(IP_POOL_SIZE)],
+                "timestamp": first + step * i,
+                "action": action,
+                "details": f"file-{rng.randrange(100000):05d}.bin" if action in ("download", "upload") else None,
+            })
+        with engine.begin() as conn:
+            conn.execute(AccessLog.__table__.insert(), rows)
+        if progress is not None:
+            progress(offset + len(rows), count)
+    return count
+
+
+def generate_storage_tree(
+    root: str,
+    files: int,
+    depth: int = 0,
+    fanout: int = 8,
+    min_size: int = 0,
+    max_size: int = 1024 * 1024,
+    fill: bool = False,
+    seed: int = SEED,
+) -> List[str]:
+    """
+    在 `root` 下生成一棵目录树：`depth` 层、每层 `fanout` 个子目录，
+    文件均匀分布在所有目录中，大小在 [min_size, max_size] 之间按对数均匀分布。
+
+    默认生成稀疏文件（只设置大小，不占用磁盘空间），`fill=True` 时写入实际数据。
+
+    Returns:
+        List[str]: 生成的所有目录（含 `root`）。
+    """
+    rng = random.Random(seed)
+    directories = [root]
+    level = [root]
+    for d in range(depth):
+        level = [os.path.join(parent, f"dir-{d}-{i:03d}") for parent in level for i in range(fanout)]
+        directories.extend(level)
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+
+    block = rng.randbytes(1024 * 1024) if fill else b""
+    log_min = math.log(max(min_size, 1))
+    log_max = math.log(max(max_size, min_size, 1))
+    for i in range(files):
+        directory = directories[i % len(directories)]
+        size = int(math.exp(rng.uniform(log_min, log_max))) if max_size > 0 else 0
+        size = max(min(size, max_size), min_size)
+        path = os.path.join(directory, f"file-{i:07d}.bin")
+        with open(path, "wb") as f:
+            if fill:
+                remaining = size
+                while remaining > 0:
+                    f.write(block[:remaining])
+                    remaining -= len(block)
+            else:
+                f.truncate(size)
+    return directories
+
+
+def _parse_size(value: str) -> int:
+    units = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    value = value.strip().upper()
+    if value and value[-1] in units:
+        return int(float(value[:-1]) * units[value[-1]])
+    return int(value)
+
+
+def _progress(label: str):
+    started = time.perf_counter()
+
+    def report(done: int, total: int):
+        elapsed = time.perf_counter() - started
+        print(f"\r{label}: {done}/{total} ({done / elapsed if elapsed else 0:,.0f} 行/秒)", end="", flush=True)
+        if done >= total:
+            print()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成大规模的合成令牌、访问日志和存储目录树。")
+    parser.add_argument("--database-url", default=None, help="目标数据库 (默认为: 配置中的 DATABASE_URL)")
+    parser.add_argument("--tokens", type=int, default=0, help="追加的令牌数 (默认为: 0)")
+    parser.add_argument("--access-logs", type=int, default=0, help="追加的访问日志条数 (默认为: 0)")
+    parser.add_argument("--files", type=int, default=0, help="目录树中的文件数 (默认为: 0)")
+    parser.add_argument("--tree-name", default="dataset", help="目录树在 STORAGE_PATH 下的名称 (默认为: dataset)")
+    parser.add_argument("--depth", type=int, default=0, help="目录树的层数 (默认为: 0，即所有文件在同一目录)")
+    parser.add_argument("--fanout", type=int, default=8, help="每层的子目录数 (默认为: 8)")
+    parser.add_argument("--min-size", type=_parse_size, default=0, help="文件的最小大小，可使用 K/M/G (默认为: 0)")
+    parser.add_argument("--max-size", type=_parse_size, default=1024 * 1024, help="文件的最大大小 (默认为: 1M)")
+    parser.add_argument("--fill", action="store_true", help="写入实际数据而不是生成稀疏文件")
+    parser.add_argument("--seed", type=int, default=SEED, help=f"随机种子 (默认为: {SEED})")
+    args = parser.parse_args()
+
+    if args.tokens or args.access_logs:
+        engine = create_engine(args.database_url or settings.DATABASE_URL)
+        Base.metadata.create_all(bind=engine)
+        if args.tokens:
+            generate_tokens(engine, args.tokens, args.seed, _progress("令牌"))
+        if args.access_logs:
+            if not generate_access_logs(engine, args.access_logs, args.seed, _progress("访问日志")):
+                print("数据库中没有令牌，请先使用 --tokens 生成令牌。")
+        engine.dispose()
+
+    if args.files:
+        root = os.path.join(os.path.abspath(settings.STORAGE_PATH), args.tree_name)
+        started = time.perf_counter()
+        directories = generate_storage_tree(
+            root, args.files, args.depth, args.fanout, args.min_size, args.max_size, args.fill, args.seed
+        )
+        print(
+            f"已在 {root} 下生成 {args.files} 个文件、{len(directories)} 个目录 "
+            f"({time.perf_counter() - started:.1f} 秒)"
+        )
+
+
+if __name__ == "__main__":
+    main()
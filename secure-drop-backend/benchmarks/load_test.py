@@ -0,0 +1,561 @@
+"""
+负载测试：访客与管理员 API
+
+在独立的子进程中用 uvicorn 启动应用（临时的 SQLite 数据库和 `STORAGE_PATH`），
+然后按固定的并发级别依次运行以下场景，每个级别运行固定的时长：
+
+- login_storm：所有连接反复用同一个令牌登录。
+- list_large_dir：列出包含大量文件的下载目录（轮流使用三种排序）。
+- small_uploads：大量小文件上传。
+- huge_uploads：少量超大文件上传（每个连接上传一个文件，并发数最多为 4）。
+- range_downloads：对同一个大文件并行发送随机的 Range 请求。
+- admin_paging：管理员按游标翻页浏览大量令牌（默认 100 万个）。
+
+统计每个场景在每个并发级别下的吞吐量、p50/p99 延迟和服务进程的峰值内存（RSS），
+结果以 JSON 输出。指定 `--baseline` 时与之前保存的结果比较，吞吐量下降或 p99 延迟上升
+超过 `--tolerance` 时视为性能回退，退出码为 1。数据和请求序列由固定的随机种子生成，
+同一台机器上的多次运行可以直接比较。
+
+在 secure-drop-backend 目录下运行：
+
+    python -m benchmarks.load_test --output bench.json
+    python -m benchmarks.load_test --quick --baseline bench.json
+
+需要 httpx（FastAPI 的测试客户端同样依赖它）。峰值内存从 /proc 读取，仅在 Linux 上可用。
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+# 脚本可以在没有 .env 的环境中直接运行；服务进程使用脚本创建的临时数据库和存储目录
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("STORAGE_PATH", tempfile.gettempdir())
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import httpx
+from sqlalchemy import create_engine
+
+from domain.database import Base
+from domain.models import Token
+from utils.config import settings
+from utils.security import create_access_token
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 场景使用的目录（相对于 STORAGE_PATH）
+DOWNLOAD_DIR = "bench-dl"
+UPLOAD_DIR = "bench-up"
+# 大文件下载场景使用的文件名
+RANGE_FILE = "big.bin"
+# 小文件上传的大小（字节）
+SMALL_UPLOAD_SIZE = 4096
+# Range 请求的区间大小（字节）
+RANGE_SIZE = 1024 * 1024
+# 超大文件上传的最大并发数
+HUGE_UPLOAD_MAX_CONCURRENCY = 4
+# 管理员翻页的每页条数
+ADMIN_PAGE_SIZE = 100
+# 生成测试数据时重复写入的随机数据块大小
+FILL_BLOCK_SIZE = 1024 * 1024
+# 批量写入令牌时每个事务的行数
+SEED_BATCH_SIZE = 20000
+
+SEED = 20240101
+
+# --quick 使用的参数
+QUICK_PRESET = {
+    "admin_tokens": 20000,
+    "list_files": 2000,
+    "range_file_mb": 32,
+    "huge_upload_mb": 32,
+    "seconds": 3.0,
+    "warmup": 0.5,
+}
+
+
+class Harness:
+    """
+    一次负载测试运行的共享状态：服务地址、认证头部、测试数据的位置。
+    """
+
+    def __init__(self, base_url: str, storage_path: str, args):
+        self.base_url = base_url
+        self.storage_path = storage_path
+        self.args = args
+        self.admin_headers = {"Authorization": "Bearer " + create_access_token({"sub": "benchmark"})}
+        self.guest_token = ""
+        self.guest_headers: Dict[str, str] = {}
+        self.huge_file = os.path.join(storage_path, "..", "huge-upload.bin")
+        self.range_file_size = args.range_file_mb * 1024 * 1024
+        # 每个连接自己的状态（管理员翻页的游标等）
+        self.worker_state: Dict[int, dict] = {}
+        self.server_pid = 0
+
+
+# 一次请求：返回传输的文件数据字节数（用于计算带宽），失败时抛出异常
+RequestFn = Callable[[Harness, httpx.AsyncClient, int, random.Random], Awaitable[int]]
+
+
+class Scenario(NamedTuple):
+    name: str
+    request: RequestFn
+    # 并发数上限（None 表示不限制）
+    max_concurrency: Optional[int] = None
+    # 每个连接最多发送的请求数（None 表示运行到时间结束）
+    requests_per_worker: Optional[int] = None
+    # 每个并发级别结束后的清理工作
+    cleanup: Optional[Callable[[Harness], None]] = None
+
+
+def _check(response: httpx.Response):
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:200]}")
+
+
+async def login_storm(h: Harness, client: httpx.AsyncClient, worker: int, rng: random.Random) -> int:
+    response = await client.post("/api/guest/login", json={"token_string": h.guest_token})
+    _check(response)
+    return 0
+
+
+async def list_large_dir(h: Harness, client: httpx.AsyncClient, worker: int, rng: random.Random) -> int:
+    sort = ("name", "size", "mtime")[rng.randrange(3)]
+    response = await client.get("/api/guest/files", params={"sort": sort, "limit": 100}, headers=h.guest_headers)
+    _check(response)
+    return 0
+
+
+async def small_uploads(h: Harness, client: httpx.AsyncClient, worker: int, rng: random.Random) -> int:
+    state = h.worker_state.setdefault(worker, {"count": 0})
+    state["count"] += 1
+    name = f"small-{worker}-{state['count']}-{rng.getrandbits(32):08x}.bin"
+    response = await client.post(
+        "/api/guest/upload",
+        headers={**h.guest_headers, "X-File-Name": name},
+        files={"file": (name, b"x" * SMALL_UPLOAD_SIZE, "application/octet-stream")},
+    )
+    _check(response)
+    return SMALL_UPLOAD_SIZE
+
+
+async def huge_uploads(h: Harness, client: httpx.AsyncClient, worker: int, rng: random.Random) -> int:
+    name = f"huge-{worker}-{rng.getrandbits(32):08x}.bin"
+    with open(h.huge_file, "rb") as f:
+        response = await client.post(
+            "/api/guest/upload",
+            headers={**h.guest_headers, "X-File-Name": name},
+            files={"file": (name, f, "application/octet-stream")},
+        )
+    _check(response)
+    return os.path.getsize(h.huge_file)
+
+
+def _remove_uploads(h: Harness):
+    shutil.rmtree(os.path.join(h.storage_path, UPLOAD_DIR), ignore_errors=True)
+
+
+async def range_downloads(h: Harness, client: httpx.AsyncClient, worker: int, rng: random.Random) -> int:
+    start = rng.randrange(0, max(h.range_file_size - RANGE_SIZE, 1))
+    end = min(start + RANGE_SIZE, h.range_file_size) - 1
+    received = 0
+    async with client.stream(
+        "GET", f"/api/guest/download/{RANGE_FILE}",
+        headers={**h.guest_headers, "Range": f"bytes={start}-{end}", "Accept-Encoding": "identity"},
+    ) as response:
+        _check(response)
+        async for chunk in response.aiter_raw():
+            received += len(chunk)
+    return received
+
+
+async def admin_paging(h: Harness, client: httpx.AsyncClient, worker: int, rng: random.Random) -> int:
+    state = h.worker_state.setdefault(worker, {"cursor": None})
+    params = {"limit": ADMIN_PAGE_SIZE}
+    if state["cursor"]:
+        params["cursor"] = state["cursor"]
+    response = await client.get("/api/admin/tokens", params=params, headers=h.admin_headers)
+    _check(response)
+    # 翻到最后一页后从头开始
+    state["cursor"] = response.json().get("next_cursor")
+    return 0
+
+
+SCENARIOS = [
+    Scenario("login_storm", login_storm),
+    Scenario("list_large_dir", list_large_dir),
+    Scenario("small_uploads", small_uploads, cleanup=_remove_uploads),
+    Scenario(
+        "huge_uploads", huge_uploads,
+        max_concurrency=HUGE_UPLOAD_MAX_CONCURRENCY, requests_per_worker=1, cleanup=_remove_uploads,
+    ),
+    Scenario("range_downloads", range_downloads),
+    Scenario("admin_paging", admin_paging),
+]
+
+
+# ---------- 测试数据 ----------
+
+def _fill_file(path: str, size: int, rng: random.Random):
+    block = rng.randbytes(FILL_BLOCK_SIZE)
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+def prepare_data(db_path: str, storage_path: str, h: Harness, args):
+    """
+    创建数据库表、批量写入管理员翻页用的令牌，并生成下载目录和上传用的大文件。
+    """
+    rng = random.Random(SEED)
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        for offset in range(0, args.admin_tokens, SEED_BATCH_SIZE):
+            count = min(SEED_BATCH_SIZE, args.admin_tokens - offset)
+            conn.execute(
+                Token.__table__.insert(),
+                [
+                    {"token_string": f"seed-{offset + i:08d}", "status": "unused", "description": f"seed {offset + i}"}
+                    for i in range(count)
+                ],
+            )
+    engine.dispose()
+    log_progress(f"已写入 {args.admin_tokens} 个令牌 ({time.perf_counter() - started:.1f} 秒)")
+
+    download_dir = os.path.join(storage_path, DOWNLOAD_DIR)
+    os.makedirs(download_dir, exist_ok=True)
+    for i in range(args.list_files):
+        with open(os.path.join(download_dir, f"file-{i:07d}.txt"), "wb") as f:
+            f.write(b"x" * rng.randrange(0, 4096))
+    _fill_file(os.path.join(download_dir, RANGE_FILE), h.range_file_size, rng)
+    _fill_file(h.huge_file, args.huge_upload_mb * 1024 * 1024, rng)
+    log_progress(f"已生成 {args.list_files} 个文件和测试用的大文件")
+
+
+async def create_guest_token(h: Harness):
+    """
+    通过管理员接口创建测试用的访客令牌并登录。
+    """
+    policy = {
+        "max_usage_count": 0,
+        "allow_upload": True,
+        "upload_path": UPLOAD_DIR,
+        "allowed_file_types": ".bin",
+        "max_file_size_mb": max(h.args.huge_upload_mb * 2, 16),
+        "allow_download": True,
+        "downloadable_path": DOWNLOAD_DIR,
+        "allow_resumable_download": True,
+    }
+    async with httpx.AsyncClient(base_url=h.base_url) as client:
+        response = await client.post("/api/admin/tokens", json=policy, headers=h.admin_headers)
+        _check(response)
+        h.guest_token = response.json()["token_string"]
+        response = await client.post("/api/guest/login", json={"token_string": h.guest_token})
+        _check(response)
+        h.guest_headers = {"Authorization": "Bearer " + response.json()["session_token"]}
+
+
+# ---------- 服务进程 ----------
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(db_path: str, storage_path: str, port: int) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "STORAGE_PATH": storage_path,
+        "SECRET_KEY": settings.SECRET_KEY,
+        "ALGORITHM": settings.ALGORITHM,
+        "LOG_LEVEL": "WARNING",
+    })
+    return subprocess.Popen(
+        [
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log",
+        ],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+
+
+async def wait_until_ready(base_url: str, process: subprocess.Popen, timeout: float = 60.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"服务进程已退出，退出码 {process.returncode}")
+            try:
+                await client.get("/api/guest/files")
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError("等待服务启动超时")
+
+
+def read_peak_rss(pid: int) -> Optional[int]:
+    """
+    读取进程的峰值常驻内存（字节）；不是 Linux 时返回 None。
+    """
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        return None
+    return None
+
+
+def reset_peak_rss(pid: int):
+    """
+    重置峰值内存的统计，使每个并发级别单独统计（需要 Linux 4.0 以上）。
+    """
+    try:
+        with open(f"/proc/{pid}/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+# ---------- 运行和统计 ----------
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    最近秩法计算百分位数。
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+async def run_level(h: Harness, scenario: Scenario, concurrency: int, seconds: float, warmup: float) -> dict:
+    """
+    以给定并发数运行一个场景：先预热 `warmup` 秒（不计入结果），再运行 `seconds` 秒。
+    """
+    latencies: List[float] = []
+    counters = {"errors": 0, "bytes": 0}
+    error_samples: List[str] = []
+    h.worker_state.clear()
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    timeout = httpx.Timeout(None)
+
+    async with httpx.AsyncClient(base_url=h.base_url, limits=limits, timeout=timeout) as client:
+        async def worker(index: int, deadline: float, record: bool, max_requests: Optional[int]):
+            rng = random.Random(SEED * 1000 + index)
+            done = 0
+            while time.perf_counter() < deadline or (max_requests is not None and done < max_requests):
+                if max_requests is not None and done >= max_requests:
+                    break
+                started = time.perf_counter()
+                try:
+                    transferred = await scenario.request(h, client, index, rng)
+                except Exception as e:
+                    if record:
+                        counters["errors"] += 1
+                        if len(error_samples) < 3:
+                            error_samples.append(str(e))
+                else:
+                    if record:
+                        latencies.append(time.perf_counter() - started)
+                        counters["bytes"] += transferred
+                done += 1
+
+        if warmup > 0 and scenario.requests_per_worker is None:
+            deadline = time.perf_counter() + warmup
+            await asyncio.gather(*(worker(i, deadline, False, None) for i in range(concurrency)))
+
+        reset_peak_rss(h.server_pid)
+        started = time.perf_counter()
+        deadline = started + seconds
+        await asyncio.gather(
+            *(worker(i, deadline, True, scenario.requests_per_worker) for i in range(concurrency))
+        )
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    peak_rss = read_peak_rss(h.server_pid)
+    result = {
+        "requests": len(latencies),
+        "errors": counters["errors"],
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "throughput_mib_s": round(counters["bytes"] / elapsed / (1024 * 1024), 2),
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 3),
+            "p99": round(percentile(latencies, 99) * 1000, 3),
+            "max": round((latencies[-1] if latencies else 0.0) * 1000, 3),
+        },
+        "peak_rss_mib": round(peak_rss / (1024 * 1024), 1) if peak_rss is not None else None,
+    }
+    if error_samples:
+        result["error_samples"] = error_samples
+    return result
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    与基线比较，返回性能回退的描述列表。只比较两次运行中都存在的场景和并发级别。
+    """
+    regressions = []
+    for name, levels in current["results"].items():
+        for level, result in levels.items():
+            base = baseline.get("results", {}).get(name, {}).get(level)
+            if base is None:
+                continue
+            if base["throughput_rps"] > 0 and result["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+                regressions.append(
+                    f"{name} c={level}: 吞吐量 {result['throughput_rps']} < 基线 {base['throughput_rps']} req/s"
+                )
+            base_p99 = base["latency_ms"]["p99"]
+            if base_p99 > 0 and result["latency_ms"]["p99"] > base_p99 * (1 + tolerance):
+                regressions.append(
+                    f"{name} c={level}: p99 延迟 {result['latency_ms']['p99']} > 基线 {base_p99} ms"
+                )
+            if result["errors"] > base.get("errors", 0):
+                regressions.append(f"{name} c={level}: 错误数 {result['errors']} > 基线 {base.get('errors', 0)}")
+    return regressions
+
+
+def log_progress(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(args, workdir: str) -> dict:
+    db_path = os.path.join(workdir, "bench.db")
+    storage_path = os.path.join(workdir, "storage")
+    os.makedirs(storage_path)
+    port = _free_port()
+    h = Harness(f"http://127.0.0.1:{port}", storage_path, args)
+    prepare_data(db_path, storage_path, h, args)
+
+    process = start_server(db_path, storage_path, port)
+    h.server_pid = process.pid
+    try:
+        await wait_until_ready(h.base_url, process)
+        await create_guest_token(h)
+        results: Dict[str, Dict[str, dict]] = {}
+        selected = [s for s in SCENARIOS if not args.scenarios or s.name in args.scenarios]
+        log_progress(f"{'场景':<18}{'并发':>6}{'请求/秒':>12}{'MiB/秒':>10}{'p50 ms':>10}{'p99 ms':>10}{'错误':>7}{'RSS MiB':>9}")
+        for scenario in selected:
+            results[scenario.name] = {}
+            levels = sorted({
+                min(c, scenario.max_concurrency) if scenario.max_concurrency else c for c in args.concurrency
+            })
+            for concurrency in levels:
+                result = await run_level(h, scenario, concurrency, args.seconds, args.warmup)
+                results[scenario.name][str(concurrency)] = result
+                if scenario.cleanup is not None:
+                    scenario.cleanup(h)
+                log_progress(
+                    f"{scenario.name:<18}{concurrency:>6}{result['throughput_rps']:>12.1f}"
+                    f"{result['throughput_mib_s']:>10.1f}{result['latency_ms']['p50']:>10.2f}"
+                    f"{result['latency_ms']['p99']:>10.2f}{result['errors']:>7}"
+                    f"{result['peak_rss_mib'] if result['peak_rss_mib'] is not None else '-':>9}"
+                )
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().astimezone().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": {k: v for k, v in vars(args).items() if k not in ("output", "baseline")},
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="对访客和管理员 API 进行负载测试，输出 JSON 结果并与基线比较。")
+    parser.add_argument(
+        "--concurrency", type=lambda v: [int(x) for x in v.split(",")], default=[1, 8, 32],
+        help="逗号分隔的并发级别 (默认为: 1,8,32)",
+    )
+    parser.add_argument("--seconds", type=float, default=10.0, help="每个并发级别的运行时长 (默认为: 10)")
+    parser.add_argument("--warmup", type=float, default=1.0, help="每个并发级别的预热时长 (默认为: 1)")
+    parser.add_argument("--scenarios", nargs="*", choices=[s.name for s in SCENARIOS], help="只运行指定的场景")
+    parser.add_argument("--admin-tokens", type=int, default=1_000_000, help="管理员翻页场景的令牌数 (默认为: 1000000)")
+    parser.add_argument("--list-files", type=int, default=20000, help="下载目录中的文件数 (默认为: 20000)")
+    parser.add_argument("--range-file-mb", type=int, default=256, help="Range 下载场景的文件大小 (默认为: 256)")
+    parser.add_argument("--huge-upload-mb", type=int, default=256, help="超大文件上传的文件大小 (默认为: 256)")
+    parser.add_argument(
+        "--quick", action="store_true",
+        help="使用小规模的数据和较短的时长快速检查 (2 万令牌、2000 个文件、32 MB 文件、每级 3 秒)",
+    )
+    parser.add_argument("--output", help="结果 JSON 的保存路径 (默认输出到标准输出)")
+    parser.add_argument("--baseline", help="用于比较的基线结果 JSON")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的性能波动比例 (默认为: 0.2)")
+    args = parser.parse_args()
+    if args.quick:
+        # 只替换没有在命令行中显式指定的参数
+        for name, value in QUICK_PRESET.items():
+            if getattr(args, name) == parser.get_default(name):
+                setattr(args, name, value)
+
+    workdir = tempfile.mkdtemp(prefix="securedrop-load-")
+    try:
+        report = asyncio.run(run(args, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            log_progress("与基线相比出现性能回退:")
+            for line in regressions:
+                log_progress(f"  {line}")
+            sys.exit(1)
+        log_progress("与基线相比没有性能回退。")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+"""
+微基准测试：服务层
+
+不经过 HTTP，直接调用令牌服务、文件服务和访客端点函数，观察它们的耗时
+如何随数据规模（令牌数、目录中的文件数、同名文件数）变化，并与负载测试
+（`benchmarks.load_test`）的结果对照，区分框架开销和我们自己代码的开销。
+
+- 令牌：`TokenService.get_token_policy`、`validate_token_string`（缓存命中和未命中）、
+  `TokenService.consume_token`、`TokenService.list_tokens`（首页、游标翻到末页、偏移翻到末页）
+  和 `TokenService.count_tokens`（未缓存）。令牌数依次增加到 `--scales` 中的每个规模。
+- 文件列表：`get_downloadable_files`（目录缓存命中和未命中），目录中的文件数为 `--dir-sizes`。
+- 文件名冲突：`FileService._handle_filename_conflict` 的 rename 策略，同名文件数为 `--conflicts`。
+
+数据由 `benchmarks.dataset` 生成，数据库和存储目录都在临时目录中，运行结束后删除。
+
+在 secure-drop-backend 目录下运行：
+
+    python -m benchmarks.services --scales 10000,100000,1000000 --output services.json
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from typing import Callable, List
+
+# 应用模块导入时即按配置创建数据库引擎和存储目录，必须先指向临时目录
+WORKDIR = tempfile.mkdtemp(prefix="securedrop-micro-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(WORKDIR, 'bench.db')}"
+os.environ["STORAGE_PATH"] = os.path.join(WORKDIR, "storage")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from fastapi import HTTPException
+from starlette.requests import Request
+from starlette.responses import Response
+
+from application.services.access_log_service import access_log_service
+from application.services.file_service import _listing_cache, file_service
+from application.services.token_service import token_count_cache, token_policy_cache, token_service
+from benchmarks.dataset import generate_storage_tree, generate_tokens, token_string_for
+from domain.database import AsyncSessionLocal, Base, async_engine, async_write_engine, engine
+from domain.storage import storage_service
+from domain.write_queue import write_queue
+from interface.guest import get_downloadable_files, validate_token_string
+from utils.cursor import encode_cursor
+
+SEED = 20240101
+# 缓存命中场景预热的令牌数
+WARM_TOKENS = 1000
+# 令牌列表每页条数（与管理后台的默认值相同）
+PAGE_SIZE = 20
+# 文件列表每页条数（与访客端点的默认值相同）
+LIST_PAGE_SIZE = 100
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    """
+    最近秩法计算百分位数。
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(p / 100 * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+async def measure(operation: Callable, seconds: float, max_iterations: int) -> dict:
+    """
+    反复执行 `operation`（同步函数或协程函数），直到运行满 `seconds` 秒或达到 `max_iterations` 次。
+    """
+    timings = []
+    deadline = time.perf_counter() + seconds
+    while len(timings) < max_iterations and (time.perf_counter() < deadline or len(timings) < 3):
+        started = time.perf_counter()
+        result = operation()
+        if inspect.isawaitable(result):
+            await result
+        timings.append(time.perf_counter() - started)
+    total = sum(timings)
+    timings.sort()
+    return {
+        "iterations": len(timings),
+        "ops_per_sec": round(len(timings) / total, 1) if total else None,
+        "mean_us": round(total / len(timings) * 1e6, 1),
+        "p50_us": round(percentile(timings, 50) * 1e6, 1),
+        "p99_us": round(percentile(timings, 99) * 1e6, 1),
+    }
+
+
+def _fake_request() -> Request:
+    return Request({
+        "type": "http", "method": "GET", "path": "/api/guest/files", "headers": [],
+        "query_string": b"", "client": ("127.0.0.1", 0),
+    })
+
+
+async def _validate(token_string: str):
+    async with AsyncSessionLocal() as db:
+        try:
+            await validate_token_string(db, token_string)
+        except HTTPException:
+            # 已过期、已撤销的令牌同样完成了一次完整的验证
+            pass
+
+
+async def _get_policy(token_string: str):
+    async with AsyncSessionLocal() as db:
+        await token_service.get_token_policy(db, token_string)
+
+
+async def _list_tokens(**kwargs):
+    async with AsyncSessionLocal() as db:
+        await token_service.list_tokens(db, limit=PAGE_SIZE, **kwargs)
+
+
+async def _count_tokens():
+    token_count_cache.clear()
+    async with AsyncSessionLocal() as db:
+        filters = token_service._list_filters(statuses=["active"])
+        await token_service.count_tokens(db, filters, ("active",))
+
+
+def token_operations(scale: int, rng: random.Random) -> List[tuple]:
+    """
+    令牌数为 `scale` 时的各项操作：[(名称, 可调用对象, 运行前需要预热缓存的令牌)]。
+    """
+    def random_token() -> str:
+        return token_string_for(rng.randrange(scale))
+
+    warm = [token_string_for(rng.randrange(scale)) for _ in range(min(WARM_TOKENS, scale))]
+
+    def cold(call):
+        def operation():
+            token_string = random_token()
+            token_policy_cache.invalidate(token_string)
+            return call(token_string)
+        return operation
+
+    # ID 从 1 开始连续分配，按 ID 降序时末页的游标为 (PAGE_SIZE + 1, PAGE_SIZE + 1)
+    last_page_cursor = encode_cursor((PAGE_SIZE + 1, PAGE_SIZE + 1))
+    return [
+        ("TokenService.get_token_policy (缓存命中)", lambda: _get_policy(rng.choice(warm)), warm),
+        ("TokenService.get_token_policy (未命中)", cold(_get_policy), None),
+        ("validate_token_string (缓存命中)", lambda: _validate(rng.choice(warm)), warm),
+        ("validate_token_string (未命中)", cold(_validate), None),
+        ("TokenService.consume_token", lambda: token_service.consume_token(random_token()), None),
+        ("TokenService.list_tokens (首页)", lambda: _list_tokens(), None),
+        ("TokenService.list_tokens (末页, 游标)", lambda: _list_tokens(cursor=last_page_cursor), None),
+        ("TokenService.list_tokens (末页, 偏移)", lambda: _list_tokens(page=max(scale // PAGE_SIZE, 1)), None),
+        ("TokenService.count_tokens (未缓存)", _count_tokens, None),
+    ]
+
+
+def listing_operations(dir_rel_path: str, token) -> List[tuple]:
+    listing_token = token.model_copy(update={"allow_download": True, "downloadable_path": dir_rel_path})
+
+    def list_files():
+        # 直接调用时 FastAPI 不会填充参数的默认值，需要全部显式传入
+        get_downloadable_files(
+            _fake_request(), Response(), sort="name", order="asc", cursor=None, limit=LIST_PAGE_SIZE,
+            token=listing_token,
+        )
+
+    def list_files_cold():
+        _listing_cache.clear()
+        list_files()
+
+    return [
+        ("get_downloadable_files (缓存命中)", list_files),
+        ("get_downloadable_files (未命中)", list_files_cold),
+    ]
+
+
+def prepare_conflicts(count: int) -> str:
+    """
+    创建 `name.bin` 以及 `name_1.bin` ... `name_{count - 1}.bin`，返回 `name.bin` 的物理路径。
+    """
+    directory = storage_service.get_file_path(f"conflicts-{count}")
+    os.makedirs(directory, exist_ok=True)
+    for i in range(count):
+        name = "name.bin" if i == 0 else f"name_{i}.bin"
+        open(os.path.join(directory, name), "wb").close()
+    return os.path.join(directory, "name.bin")
+
+
+def log_progress(message: str):
+    print(message, file=sys.stderr, flush=True)
+
+
+def _print_row(name: str, size: int, result: dict):
+    log_progress(
+        f"{name:<42}{size:>10}{result['ops_per_sec'] or 0:>12.1f}"
+        f"{result['mean_us']:>11.1f}{result['p50_us']:>11.1f}{result['p99_us']:>11.1f}"
+    )
+
+
+async def run(args) -> dict:
+    rng = random.Random(SEED)
+    results = {"tokens": {}, "listing": {}, "conflicts": {}}
+    write_queue.start()
+    Base.metadata.create_all(bind=engine)
+    log_progress(f"{'操作':<40}{'规模':>8}{'次数/秒':>10}{'平均 µs':>10}{'p50 µs':>11}{'p99 µs':>11}")
+    try:
+        generated = 0
+        for scale in sorted(args.scales):
+            generate_tokens(engine, scale - generated, SEED)
+            generated = scale
+            token_count_cache.clear()
+            for name, operation, warm in token_operations(scale, rng):
+                token_policy_cache.clear()
+                for token_string in warm or ():
+                    await _get_policy(token_string)
+                result = await measure(operation, args.seconds, args.max_iterations)
+                results["tokens"].setdefault(name, {})[str(scale)] = result
+                _print_row(name, scale, result)
+
+        async with AsyncSessionLocal() as db:
+            token = await token_service.get_token_policy(db, token_string_for(0))
+        for size in sorted(args.dir_sizes):
+            dir_rel_path = f"listing-{size}"
+            generate_storage_tree(storage_service.get_file_path(dir_rel_path), size, seed=SEED)
+            for name, operation in listing_operations(dir_rel_path, token):
+                result = await measure(operation, args.seconds, args.max_iterations)
+                results["listing"].setdefault(name, {})[str(size)] = result
+                _print_row(name, size, result)
+
+        name = "FileService._handle_filename_conflict (rename)"
+        for count in sorted(args.conflicts):
+            path = prepare_conflicts(count)
+            result = await measure(
+                lambda: file_service._handle_filename_conflict(path, "rename"), args.seconds, args.max_iterations
+            )
+            results["conflicts"].setdefault(name, {})[str(count)] = result
+            _print_row(name, count, result)
+    finally:
+        await access_log_service.stop()
+        await write_queue.stop()
+        await async_engine.dispose()
+        await async_write_engine.dispose()
+        engine.dispose()
+    return results
+
+
+def _int_list(value: str) -> List[int]:
+    return [int(x) for x in value.split(",") if x]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="不经过 HTTP 直接测量服务层各项操作随数据规模的耗时变化。")
+    parser.add_argument(
+        "--scales", type=_int_list, default=[10000, 100000, 1000000],
+        help="逗号分隔的令牌数 (默认为: 10000,100000,1000000)",
+    )
+    parser.add_argument(
+        "--dir-sizes", type=_int_list, default=[100, 10000, 100000],
+        help="逗号分隔的目录文件数 (默认为: 100,10000,100000)",
+    )
+    parser.add_argument(
+        "--conflicts", type=_int_list, default=[1, 10, 100, 1000],
+        help="逗号分隔的同名文件数 (默认为: 1,10,100,1000)",
+    )
+    parser.add_argument("--seconds", type=float, default=2.0, help="每项操作的运行时长 (默认为: 2)")
+    parser.add_argument("--max-iterations", type=int, default=100000, help="每项操作的最大执行次数 (默认为: 100000)")
+    parser.add_argument("--output", help="结果 JSON 的保存路径 (默认输出到标准输出)")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    output = json.dumps({"args": {k: v for k, v in vars(args).items() if k != "output"}, "results": results},
+                        ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+基准测试：SQLite 配置档与写队列
+
+在临时数据库上模拟访客请求的典型负载：多个协程按令牌字符串查询令牌（读），
+同时多个协程更新令牌的上传计数（写），分别统计两种模式下的吞吐量：
+
+- baseline：SQLite 默认设置（回滚日志），每个写操作单独提交事务。
+- tuned：`concurrent` 配置档（WAL 等 PRAGMA），写操作经过写队列批量提交。
+
+在 secure-drop-backend 目录下运行：
+
+    python -m benchmarks.sqlite_profile --readers 16 --writers 16 --seconds 5
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+
+# 脚本可以在没有 .env 的环境中直接运行；实际使用的数据库由脚本自行创建
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("ACCESS_TOKEN_EXPIRE_MINUTES", "30")
+os.environ.setdefault("STORAGE_PATH", tempfile.gettempdir())
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from sqlalchemy import create_engine, select, update
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from domain.database import Base, apply_sqlite_profile
+from domain.models import Token
+from domain.write_queue import WriteQueue
+
+TOKEN_COUNT = 1000
+
+
+def prepare_database(path: str):
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            Token.__table__.insert(),
+            [{"token_string": f"bench-{i:06d}", "status": "active"} for i in range(TOKEN_COUNT)],
+        )
+    engine.dispose()
+
+
+async def run_scenario(path: str, profile: str, use_queue: bool, args) -> dict:
+    url = f"sqlite+aiosqlite:///{path}"
+    read_engine = create_async_engine(url, pool_size=args.readers, max_overflow=0)
+    write_engine = create_async_engine(
+        url, pool_size=1 if use_queue else args.writers, max_overflow=0
+    )
+    apply_sqlite_profile(read_engine.sync_engine, profile)
+    apply_sqlite_profile(write_engine.sync_engine, profile)
+    read_sessions = async_sessionmaker(bind=read_engine, expire_on_commit=False)
+    write_sessions = async_sessionmaker(bind=write_engine, expire_on_commit=False)
+    queue = WriteQueue(write_sessions, args.batch_size) if use_queue else None
+
+    counters = {"reads": 0, "writes": 0, "write_errors": 0}
+    deadline = time.perf_counter() + args.seconds
+
+    async def reader(worker: int):
+        i = worker
+        while time.perf_counter() < deadline:
+            async with read_sessions() as db:
+                result = await db.execute(
+                    select(Token).where(Token.token_string == f"bench-{i % TOKEN_COUNT:06d}")
+                )
+                result.scalars().first()
+            counters["reads"] += 1
+            i += args.readers
+
+    async def writer(worker: int):
+        i = worker
+        while time.perf_counter() < deadline:
+            stmt = (
+                update(Token)
+                .where(Token.id == i % TOKEN_COUNT + 1)
+                .values(uploaded_bytes=Token.uploaded_bytes + 1)
+            )
+            try:
+                if queue is not None:
+                    await queue.submit(lambda db: db.execute(stmt))
+                else:
+                    async with write_sessions() as db:
+                        await db.execute(stmt)
+                        await db.commit()
+                counters["writes"] += 1
+            except Exception:
+                counters["write_errors"] += 1
+            i += args.writers
+
+    started = time.perf_counter()
+    await asyncio.gather(
+        *(reader(n) for n in range(args.readers)),
+        *(writer(n) for n in range(args.writers)),
+    )
+    elapsed = time.perf_counter() - started
+    if queue is not None:
+        await queue.stop()
+    await read_engine.dispose()
+    await write_engine.dispose()
+
+    return {
+        "reads_per_sec": counters["reads"] / elapsed,
+        "writes_per_sec": counters["writes"] / elapsed,
+        "write_errors": counters["write_errors"],
+        "avg_batch": (queue.writes / queue.batches) if queue is not None and queue.batches else 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比较 SQLite 默认设置与并发配置档的读写吞吐量。")
+    parser.add_argument("--readers", type=int, default=16, help="并发读协程数 (默认为: 16)")
+    parser.add_argument("--writers", type=int, default=16, help="并发写协程数 (默认为: 16)")
+    parser.add_argument("--seconds", type=float, default=5.0, help="每种模式的运行时长 (默认为: 5)")
+    parser.add_argument("--batch-size", type=int, default=128, help="写队列的最大批量 (默认为: 128)")
+    args = parser.parse_args()
+
+    scenarios = [
+        ("baseline", "default", False),
+        ("tuned", "concurrent", True),
+    ]
+    workdir = tempfile.mkdtemp(prefix="securedrop-bench-")
+    try:
+        print(f"{'模式':<10}{'读/秒':>12}{'写/秒':>12}{'写失败':>10}{'平均批量':>10}")
+        for name, profile, use_queue in scenarios:
+            path = os.path.join(workdir, f"{name}.db")
+            prepare_database(path)
+            result = asyncio.run(run_scenario(path, profile, use_queue, args))
+            print(
+                f"{name:<10}{result['reads_per_sec']:>12.0f}{result['writes_per_sec']:>12.0f}"
+                f"{result['write_errors']:>10}{result['avg_batch']:>10.1f}"
+            )
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -14,17 +14,17 @@ def create_initial_admin(db: Session, username: str, password: str):
     """
     创建或更新管理员用户。
     """
-    log.info(f"正在检查用户 '{username}' 是否存在...")
+    log.info("正在检查用户 '%s' 是否存在...", username)
     existing_user = user_service.get_user_by_username(db, username)
     
     if existing_user:
-        log.warning(f"用户 '{username}' 已存在。此脚本不会更新现有用户的密码。")
+        log.warning("用户 '%s' 已存在。此脚本不会更新现有用户的密码。", username)
         return
 
-    log.info(f"用户 '{username}' 不存在，正在创建新用户...")
+    log.info("用户 '%s' 不存在，正在创建新用户...", username)
     admin_in = AdminCreate(username=username, password=password)
     user_service.create_admin_user(db, user=admin_in)
-    log.info(f"管理员用户 '{username}' 创建成功。")
+    log.info("管理员用户 '%s' 创建成功。", username)
 
 def main():
     """
@@ -2,12 +2,119 @@
 数据库会话管理模块
 
 负责创建数据库引擎和会话。
+
+同时提供两套会话：
+- 同步会话 (`SessionLocal` / `get_db`)：用于建表和 `create_admin.py` 等命令行脚本。
+- 异步会话 (`AsyncSessionLocal` / `get_async_db`)：用于 API 请求，
+  数据库 I/O 不会阻塞事件循环，也不会占用线程池。
+
+使用 SQLite 时，请求会话使用一组池化的读连接；高频写操作通过
+`domain.write_queue` 在一个独立的写连接上串行、批量提交
+（`AsyncWriteSessionLocal`）。`SQLITE_PROFILE=concurrent` 时所有连接启用
+WAL 等 PRAGMA，读操作不会被写操作阻塞。
 """
-from sqlalchemy import create_engine
+import time
+from sqlalchemy import MetaData, create_engine, event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from utils.config import settings
 from utils.logger import log
+from utils.metrics import db_query_duration
+from utils.tracing import PHASE_DB, add_phase
+
+def sqlite_pragmas(profile: str) -> list:
+    """
+    返回指定 SQLite 配置档对应的 PRAGMA 语句。
+
+    - `default`：保持 SQLite 的默认设置（回滚日志，写操作会阻塞读操作）。
+    - `concurrent`：WAL 日志，读写互不阻塞；`synchronous=NORMAL` 在 WAL 下
+      只在检查点时同步磁盘，断电最多丢失最近的事务而不会损坏数据库；
+      另外设置忙等待超时、页缓存和内存映射的大小。
+    """
+    if profile == "default":
+        return []
+    if profile != "concurrent":
+        raise ValueError(f"未知的 SQLite 配置档: {profile}")
+    return [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT_MS}",
+        # 负数表示以 KiB 为单位
+        f"PRAGMA cache_size=-{settings.SQLITE_CACHE_SIZE_KB}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE_MB * 1024 * 1024}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+
+def apply_sqlite_profile(sync_engine, profile: str):
+    """
+    在引擎每次建立新连接时执行配置档的 PRAGMA。非 SQLite 引擎不做处理。
+
+    Args:
+        sync_engine: 同步引擎；异步引擎请传入 `async_engine.sync_engine`。
+        profile: 配置档名称。
+    """
+    if sync_engine.dialect.name != "sqlite":
+        return
+    pragmas = sqlite_pragmas(profile)
+    if not pragmas:
+        return
+
+    @event.listens_for(sync_engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+# 按语句的第一个关键字分类统计查询耗时
+STATEMENT_KINDS = {"SELECT": "select", "INSERT": "insert", "UPDATE": "update", "DELETE": "delete"}
+
+def instrument_engine(sync_engine, name: str):
+    """
+    通过引擎事件统计每条语句的执行次数和耗时（`securedrop_db_query_duration_seconds`），
+    并计入当前请求的 `db` 阶段。
+
+    Args:
+        sync_engine: 同步引擎；异步引擎请传入 `async_engine.sync_engine`。
+        name: 指标中的 `engine` 标签。
+    """
+    children = {
+        kind: db_query_duration.labels(name, kind)
+        for kind in list(STATEMENT_KINDS.values()) + ["other"]
+    }
+    other = children["other"]
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_start"].pop()
+        kind = STATEMENT_KINDS.get(statement.lstrip()[:6].upper())
+        (children[kind] if kind is not None else other).observe(elapsed)
+        add_phase(PHASE_DB, elapsed)
+
+    @event.listens_for(sync_engine, "handle_error")
+    def _on_error(exception_context):
+        # 执行失败时不会触发 after_cursor_execute，丢弃对应的开始时间
+        if exception_context.connection is not None:
+            starts = exception_context.connection.info.get("query_start")
+            if starts:
+                starts.pop()
+
+def _pool_options(database_url: str, pool_size: int) -> dict:
+    """
+    连接池参数。内存数据库使用单连接的连接池，不接受这些参数。
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        return {}
+    return {"pool_size": pool_size, "max_overflow": 0}
 
 # 创建数据库引擎
 # connect_args 是 SQLite 特有的，用于允许多线程访问
@@ -15,10 +122,53 @@ engine = create_engine(
     settings.DATABASE_URL, 
     connect_args={"check_same_thread": False}
 )
+apply_sqlite_profile(engine, settings.SQLITE_PROFILE)
+instrument_engine(engine, "sync")
 
 # 创建一个 SessionLocal 类，用于创建数据库会话实例
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 同步驱动对应的异步驱动
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql",
+}
+
+def _async_database_url(database_url: str):
+    """
+    将同步数据库 URL 转换为对应异步驱动的 URL（如 sqlite:// -> sqlite+aiosqlite://）。
+    已经指定驱动的 URL 保持不变。
+    """
+    url = make_url(database_url)
+    if "+" in url.drivername:
+        return url
+    return url.set(drivername=ASYNC_DRIVERS.get(url.drivername, url.drivername))
+
+# 创建异步数据库引擎（请求会话使用的读连接池）
+async_engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
+    **_pool_options(settings.DATABASE_URL, settings.DB_READER_POOL_SIZE),
+)
+apply_sqlite_profile(async_engine.sync_engine, settings.SQLITE_PROFILE)
+instrument_engine(async_engine.sync_engine, "reader")
+
+# 写队列专用的引擎，只持有一个连接，所有经过写队列的写操作都在它上面串行执行
+async_write_engine = create_async_engine(
+    _async_database_url(settings.DATABASE_URL),
+    **_pool_options(settings.DATABASE_URL, 1),
+)
+apply_sqlite_profile(async_write_engine.sync_engine, settings.SQLITE_PROFILE)
+instrument_engine(async_write_engine.sync_engine, "writer")
+
+# 异步会话工厂。提交后不使对象过期，以便在会话关闭后继续读取属性
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False
+)
+AsyncWriteSessionLocal = async_sessionmaker(
+    bind=async_write_engine, autoflush=False, expire_on_commit=False
+)
+
 # 创建一个 Base 类，我们的 ORM 模型将继承这个类
 Base = declarative_base()
 
@@ -39,6 +189,82 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """
+    FastAPI 依赖项，用于获取异步数据库会话。
+
+    Yields:
+        AsyncSession: SQLAlchemy 异步数据库会话实例。
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def _add_missing_columns():
+    """
+    为已存在的表补充模型中新增的列。
+
+    `create_all` 只会创建不存在的表，不会修改已有的表；
+    这里对缺失的列执行 `ALTER TABLE ... ADD COLUMN`，并使用列的默认值填充已有行。
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                ddl = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+                default = column.default.arg if column.default is not None and column.default.is_scalar else None
+                if default is not None:
+                    ddl += f" NOT NULL DEFAULT {int(default) if isinstance(default, bool) else repr(default)}"
+                conn.execute(text(ddl))
+                log.info("已为表 %s 添加新列: %s", table.name, column.name)
+
+def _add_missing_indexes():
+    """
+    为已存在的表创建模型中新增的索引（`create_all` 只为新建的表创建索引）。
+    """
+    inspector = inspect(engine)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {i["name"] for i in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=engine)
+                log.info("已为表 %s 创建新索引: %s", table.name, index.name)
+
+def _enable_sqlite_autoincrement():
+    """
+    重建模型要求 `AUTOINCREMENT`、但在旧版本中没有按此创建的 SQLite 表。
+
+    没有 `AUTOINCREMENT` 时，SQLite 会复用被删除的最大编号。SQLite 不支持修改已有表的这一属性，
+    这里按模型建一张新表，复制数据后替换旧表；索引随旧表一起删除，之后由 `_add_missing_indexes` 重新创建。
+    """
+    if engine.dialect.name != "sqlite":
+        return
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not table.dialect_options["sqlite"]["autoincrement"] or not inspector.has_table(table.name):
+                continue
+            ddl = conn.scalar(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": table.name}
+            )
+            if "AUTOINCREMENT" in ddl.upper():
+                continue
+            rebuilt = table.to_metadata(MetaData(), name=f"{table.name}__rebuild")
+            rebuilt.indexes.clear()
+            rebuilt.create(bind=conn)
+            columns = ", ".join(column.name for column in table.columns)
+            conn.execute(text(f"INSERT INTO {rebuilt.name} ({columns}) SELECT {columns} FROM {table.name}"))
+            conn.execute(text(f"DROP TABLE {table.name}"))
+            conn.execute(text(f"ALTER TABLE {rebuilt.name} RENAME TO {table.name}"))
+            log.info("已重建表 %s，编号不再复用。", table.name)
+
 def init_db():
     """
     初始化数据库，创建所有在 Base 中定义的表。
@@ -46,7 +272,10 @@ def init_db():
     log.info("正在初始化数据库，创建所有表...")
     try:
         Base.metadata.create_all(bind=engine)
+        _add_missing_columns()
+        _enable_sqlite_autoincrement()
+        _add_missing_indexes()
         log.info("数据库表创建成功。")
     except Exception as e:
-        log.error(f"创建数据库表时发生错误: {e}")
+        log.error("创建数据库表时发生错误: %s", e)
         raise
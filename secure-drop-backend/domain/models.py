@@ -1,11 +1,12 @@
 """
 数据库 ORM 模型定义模块
 
-定义了 `admins`, `tokens`, `access_logs` 三张表对应的 SQLAlchemy 模型。
+定义了 `admins`, `tokens`, `access_logs`、上传配额预留 `quota_reservations`
+以及分块上传会话 `upload_sessions`、`upload_ranges` 等表对应的 SQLAlchemy 模型。
 """
 import datetime
 from sqlalchemy import (
-    Boolean, Column, Integer, String, Text, DateTime, ForeignKey
+    BigInteger, Boolean, Column, Integer, String, Text, DateTime, ForeignKey, Index
 )
 from sqlalchemy.orm import relationship
 from .database import Base
@@ -35,6 +36,7 @@ class Token(Base):
     
     max_usage_count = Column(Integer, default=1)
     current_usage_count = Column(Integer, default=0)
+    last_used_at = Column(DateTime, nullable=True) # 最近一次登录（消耗使用次数）的时间
     
     delete_on_exhaust = Column(Boolean, default=False)
     
@@ -46,6 +48,8 @@ class Token(Base):
     allowed_file_types = Column(Text, nullable=True)
     max_file_size_mb = Column(Integer, nullable=True)
     max_total_upload_gb = Column(Integer, nullable=True)
+    uploaded_bytes = Column(BigInteger, default=0, nullable=False) # 已完成上传的总字节数
+    reserved_bytes = Column(BigInteger, default=0, nullable=False) # 进行中的上传预留的字节数
     upload_bandwidth_limit_kbps = Column(Integer, default=0)
     filename_conflict_strategy = Column(String, default='rename')
     
@@ -54,8 +58,24 @@ class Token(Base):
     download_bandwidth_limit_kbps = Column(Integer, default=0)
     allow_resumable_download = Column(Boolean, default=True)
 
+    # 策略版本，每次修改或撤销令牌时加一；签名下载链接中记录的旧版本随之失效
+    policy_version = Column(Integer, default=1, nullable=False)
+
     access_logs = relationship("AccessLog", back_populates="token")
 
+    __table_args__ = (
+        # 管理后台令牌列表的键集分页和筛选
+        Index("ix_tokens_status_id", "status", "id"),
+        Index("ix_tokens_created_at_id", "created_at", "id"),
+        Index("ix_tokens_expires_at", "expires_at"),
+        # 后台清理任务查找到期和用尽的令牌
+        Index("ix_tokens_status_expires_at", "status", "expires_at"),
+        Index("ix_tokens_status_last_used_at", "status", "last_used_at"),
+        # 编号不能复用：签名下载链接按编号和策略版本校验，
+        # 删除令牌后新建的令牌若复用了编号，旧链接会被当作新令牌的链接
+        {"sqlite_autoincrement": True},
+    )
+
 class AccessLog(Base):
     """
     访问日志模型，记录所有通过令牌进行的操作。
@@ -70,3 +90,55 @@ class AccessLog(Base):
     details = Column(Text, nullable=True)
 
     token = relationship("Token", back_populates="access_logs")
+
+class QuotaReservation(Base):
+    """
+    进行中的上传预留的配额（租约）。
+
+    `tokens.reserved_bytes` 是各令牌所有预留的合计，用于在一条 UPDATE 语句中原子地检查配额；
+    每笔预留另外在这里记录一行，上传结束时删除。进程在上传中途退出时，
+    这一行会在 `expires_at` 之后由后台任务删除，并从合计中扣除，预留不会永久占用配额。
+    """
+    __tablename__ = "quota_reservations"
+
+    id = Column(Integer, primary_key=True)
+    token_id = Column(Integer, nullable=False, index=True)
+    nbytes = Column(BigInteger, nullable=False)
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+    # 编号不能复用：租约过期被回收后，原上传再结算时不能误删其他上传的预留
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class UploadSession(Base):
+    """
+    分块上传会话。数据保存在存储目录下的暂存文件中，元数据保存在数据库里，
+    多个进程处理同一会话的请求时看到的是同一份状态。
+    """
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)
+    token_id = Column(Integer, nullable=False, index=True)
+    filename = Column(Text, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    created_at = Column(DateTime, nullable=False, index=True)
+    # 创建会话时预留的上传配额（令牌未设置配额时为空）
+    reservation_id = Column(Integer, nullable=True)
+    # 正在写入的请求数及其最近一次心跳的时间；提交时要求没有正在写入的请求
+    writers = Column(Integer, default=0, nullable=False)
+    writers_seen_at = Column(DateTime, nullable=True)
+    # 已开始提交，之后拒绝新的写入
+    completing = Column(Boolean, default=False, nullable=False)
+
+class UploadRange(Base):
+    """
+    上传会话已接收的一个字节区间 [start, end)。
+
+    每个写入完成的分块追加一行，不修改已有的行：并行写入的分块无需先读后写，
+    读取时再合并成互不重叠的区间。
+    """
+    __tablename__ = "upload_ranges"
+
+    id = Column(Integer, primary_key=True)
+    upload_id = Column(String, nullable=False, index=True)
+    start = Column(BigInteger, nullable=False)
+    end = Column(BigInteger, nullable=False)
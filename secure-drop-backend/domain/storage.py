@@ -1,26 +1,45 @@
 """
 文件存储抽象接口及实现
 
-定义了文件存储的抽象基类和本地文件存储的具体实现。
+定义了文件存储的抽象基类、本地文件存储和按内容去重存储的具体实现。
 """
+import errno
+import hashlib
 import os
-import shutil
+import time
+import uuid
 from abc import ABC, abstractmethod
-from fastapi import UploadFile
+from typing import AsyncIterable, Optional
+import anyio
 from utils.config import settings
 from utils.logger import log
+from utils.tracing import PHASE_STORAGE, span
 
 class StorageInterface(ABC):
     """
     文件存储的抽象基类 (接口)。
     """
     @abstractmethod
-    def save_file(self, file: UploadFile, destination_path: str) -> str:
+    async def save_stream(self, chunks: AsyncIterable[bytes], destination_path: str) -> str:
         """
-        保存上传的文件。
+        以流的方式保存文件，边接收边写入目标位置。
 
         Args:
-            file: FastAPI 的 UploadFile 对象。
+            chunks: 产出文件内容分块的异步可迭代对象。
+            destination_path: 文件保存的目标相对路径。
+
+        Returns:
+            str: 保存后的完整文件路径。
+        """
+        pass
+
+    @abstractmethod
+    def commit_file(self, source_path: str, destination_path: str) -> str:
+        """
+        将一个已在本地写好的完整文件移入存储。
+
+        Args:
+            source_path: 待提交文件的物理路径（与存储位于同一文件系统）。
             destination_path: 文件保存的目标相对路径。
 
         Returns:
@@ -48,6 +67,15 @@ class StorageInterface(ABC):
         """
         pass
 
+    def collect_garbage(self) -> int:
+        """
+        回收不再被引用的存储空间。不需要回收的实现直接返回 0。
+
+        Returns:
+            int: 回收的对象数。
+        """
+        return 0
+
 class LocalStorage(StorageInterface):
     """
     本地文件存储的实现。
@@ -56,25 +84,51 @@ class LocalStorage(StorageInterface):
         self.base_path = os.path.abspath(base_path)
         if not os.path.exists(self.base_path):
             os.makedirs(self.base_path)
-            log.info(f"本地存储目录已创建: {self.base_path}")
+            log.info("本地存储目录已创建: %s", self.base_path)
 
-    def save_file(self, file: UploadFile, destination_path: str) -> str:
+    async def save_stream(self, chunks: AsyncIterable[bytes], destination_path: str) -> str:
         """
-        将上传的文件保存到本地。
+        将分块数据直接写入目标目录。
+
+        数据先写入同目录下的隐藏临时文件，完成后通过 `os.replace` 原子地
+        重命名到目标位置：每个字节只写一次磁盘，且中途失败不会留下残缺文件。
+        文件写入通过 anyio 在线程中执行，不会阻塞事件循环。
+        只有文件系统操作计入请求的 `storage` 阶段，等待接收数据的时间不计入。
         """
-        # 安全地拼接路径，防止路径遍历攻击
         full_dest_path = os.path.join(self.base_path, destination_path)
-        
-        # 创建目标目录（如果不存在）
-        os.makedirs(os.path.dirname(full_dest_path), exist_ok=True)
-        
+        dest_dir = os.path.dirname(full_dest_path)
+        with span(PHASE_STORAGE):
+            os.makedirs(dest_dir, exist_ok=True)
+        temp_path = os.path.join(
+            dest_dir, f".{os.path.basename(full_dest_path)}.{uuid.uuid4().hex}.part"
+        )
+
         try:
-            with open(full_dest_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-            log.info(f"文件已保存到: {full_dest_path}")
-            return full_dest_path
-        finally:
-            file.file.close()
+            with span(PHASE_STORAGE):
+                buffer = await anyio.open_file(temp_path, "wb")
+            async with buffer:
+                async for chunk in chunks:
+                    with span(PHASE_STORAGE):
+                        await buffer.write(chunk)
+            with span(PHASE_STORAGE):
+                os.replace(temp_path, full_dest_path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        log.info("文件已保存到: %s", full_dest_path)
+        return full_dest_path
+
+    def commit_file(self, source_path: str, destination_path: str) -> str:
+        """
+        通过重命名把文件移动到目标位置，不复制数据。
+        """
+        full_dest_path = os.path.join(self.base_path, destination_path)
+        with span(PHASE_STORAGE):
+            os.makedirs(os.path.dirname(full_dest_path), exist_ok=True)
+            os.replace(source_path, full_dest_path)
+        log.info("文件已保存到: %s", full_dest_path)
+        return full_dest_path
 
     def get_file_path(self, file_path: str) -> str:
         """
@@ -86,7 +140,185 @@ class LocalStorage(StorageInterface):
         """
         检查本地文件是否存在。
         """
-        return os.path.exists(self.get_file_path(file_path))
+        with span(PHASE_STORAGE):
+            return os.path.exists(self.get_file_path(file_path))
+
+# 去重存储的内部目录（位于存储根目录下，以点开头，不会出现在文件列表中）
+BLOB_DIR = ".blobs"
+# 哈希时每次读取的字节数
+HASH_CHUNK_SIZE = 1024 * 1024
+# 超过这个时长（秒）仍未完成的临时文件视为中断的上传遗留，由垃圾回收删除
+STALE_TEMP_SECONDS = 24 * 3600
+
+
+class DedupStorage(LocalStorage):
+    """
+    按内容去重的本地文件存储。
+
+    每份内容按 SHA-256 摘要只在 `.blobs/<前两位>/<摘要>` 保存一次，
+    用户可见的逻辑路径是指向该 blob 的硬链接。因此逻辑路径仍是普通文件，
+    列表、下载和文件名冲突检测无需任何改动；覆盖或删除逻辑路径只会移除
+    一个链接，不会影响其他引用同一内容的文件。
+
+    blob 的引用计数就是其硬链接数：只剩 `.blobs` 中自身一个链接时说明
+    已没有逻辑路径引用它，由 `collect_garbage` 删除。
+
+    同一内容的所有逻辑路径共享一个 inode，修改时间也是共享的，即该内容第一次保存的时间。
+    新的逻辑路径指向已有 blob 时不修改它的时间：否则引用同一内容的所有文件的
+    修改时间、ETag 和 Last-Modified 都会随之改变，客户端缓存和断点续传随之失效。
+    文件系统不支持硬链接时退化为普通的本地存储。
+    """
+    def __init__(self, base_path: str = settings.STORAGE_PATH):
+        super().__init__(base_path)
+        self.blob_path = os.path.join(self.base_path, BLOB_DIR)
+        self.temp_path = os.path.join(self.blob_path, "tmp")
+        os.makedirs(self.temp_path, exist_ok=True)
+        self._links_supported = True
+
+    def _blob_file(self, digest: str) -> str:
+        return os.path.join(self.blob_path, digest[:2], digest)
+
+    def _new_temp_file(self) -> str:
+        return os.path.join(self.temp_path, f"{uuid.uuid4().hex}.part")
+
+    def _link_blob(self, source_path: str, digest: str) -> str:
+        """
+        把内容文件登记为 blob，返回 blob 路径。已存在相同摘要的 blob 时沿用它。
+
+        `os.link` 在目标已存在时失败，这让"检查并创建"成为一个原子操作。
+        """
+        blob = self._blob_file(digest)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        try:
+            os.link(source_path, blob)
+        except FileExistsError:
+            pass
+        return blob
+
+    def _place(self, source_path: str, digest: str, destination_path: str) -> str:
+        """
+        让逻辑路径指向内容对应的 blob，并删除源文件。
+
+        链接先建在目标目录下的隐藏临时名上，再用 `os.replace` 原子地替换到目标位置，
+        覆盖已有文件时读者只会看到旧内容或新内容。
+        """
+        full_dest_path = os.path.join(self.base_path, destination_path)
+        dest_dir = os.path.dirname(full_dest_path)
+        os.makedirs(dest_dir, exist_ok=True)
+
+        if self._links_supported:
+            link_path = os.path.join(
+                dest_dir, f".{os.path.basename(full_dest_path)}.{uuid.uuid4().hex}.link"
+            )
+            try:
+                # blob 可能在登记后、建立链接前恰好被垃圾回收删除，此时用源文件重新登记
+                for _ in range(2):
+                    blob = self._link_blob(source_path, digest)
+                    try:
+                        os.link(blob, link_path)
+                        break
+                    except FileNotFoundError:
+                        continue
+                else:
+                    os.link(source_path, link_path)
+                os.replace(link_path, full_dest_path)
+                os.remove(source_path)
+                return full_dest_path
+            except OSError as e:
+                if os.path.exists(link_path):
+                    os.remove(link_path)
+                if e.errno not in (errno.EPERM, errno.EXDEV, errno.EMLINK, errno.ENOTSUP):
+                    raise
+                self._links_supported = False
+                log.warning("存储目录不支持硬链接，已停用内容去重: %s", e)
+
+        os.replace(source_path, full_dest_path)
+        return full_dest_path
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            while True:
+                data = f.read(HASH_CHUNK_SIZE)
+                if not data:
+                    break
+                digest.update(data)
+        return digest.hexdigest()
+
+    async def save_stream(self, chunks: AsyncIterable[bytes], destination_path: str) -> str:
+        """
+        边写入临时文件边计算摘要，完成后按内容去重保存。
+        """
+        temp_path = self._new_temp_file()
+        digest = hashlib.sha256()
+        try:
+            with span(PHASE_STORAGE):
+                buffer = await anyio.open_file(temp_path, "wb")
+            async with buffer:
+                async for chunk in chunks:
+                    with span(PHASE_STORAGE):
+                        digest.update(chunk)
+                        await buffer.write(chunk)
+            with span(PHASE_STORAGE):
+                full_dest_path = await anyio.to_thread.run_sync(
+                    self._place, temp_path, digest.hexdigest(), destination_path
+                )
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        log.info("文件已保存到: %s", full_dest_path)
+        return full_dest_path
+
+    def commit_file(self, source_path: str, destination_path: str) -> str:
+        """
+        计算已写好文件的摘要后按内容去重保存。需要完整读一遍文件，应在线程中调用。
+        """
+        with span(PHASE_STORAGE):
+            full_dest_path = self._place(source_path, self._hash_file(source_path), destination_path)
+        log.info("文件已保存到: %s", full_dest_path)
+        return full_dest_path
+
+    def collect_garbage(self) -> int:
+        """
+        删除没有逻辑路径引用（硬链接数为 1）的 blob，以及中断的上传遗留的临时文件。
+        """
+        removed = 0
+        stale_before = time.time() - STALE_TEMP_SECONDS
+        with os.scandir(self.temp_path) as it:
+            for entry in it:
+                try:
+                    if entry.stat().st_mtime < stale_before:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+        with os.scandir(self.blob_path) as shards:
+            for shard in shards:
+                if shard.name == "tmp" or not shard.is_dir():
+                    continue
+                with os.scandir(shard.path) as it:
+                    for entry in it:
+                        try:
+                            if entry.stat().st_nlink <= 1:
+                                os.remove(entry.path)
+                                removed += 1
+                        except FileNotFoundError:
+                            pass
+        if removed:
+            log.info("已回收 %s 个不再被引用的存储对象。", removed)
+        return removed
+
+
+def create_storage(backend: Optional[str] = None) -> StorageInterface:
+    """
+    根据配置创建存储实例：`local` 为普通本地存储，`dedup` 为按内容去重的存储。
+    """
+    backend = backend or settings.STORAGE_BACKEND
+    if backend == "dedup":
+        return DedupStorage()
+    if backend != "local":
+        log.warning("未知的存储后端 '%s'，使用本地存储。", backend)
+    return LocalStorage()
 
 # 创建一个全局可用的存储实例
-storage_service = LocalStorage()
+storage_service = create_storage()
@@ -0,0 +1,126 @@
+"""
+数据库写队列模块
+
+SQLite 同一时刻只允许一个写事务。多个请求各自提交写事务时会互相争抢写锁，
+每个事务还要单独同步一次磁盘。写队列把写操作集中到一个后台任务中串行执行，
+并把排队中的多个写操作合并到同一个事务里提交（组提交），
+从而消除写锁争用，并摊薄每次提交的开销。
+"""
+import asyncio
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+import anyio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from domain.database import AsyncWriteSessionLocal
+from utils.config import settings
+from utils.logger import log
+from utils.metrics import registry
+
+T = TypeVar("T")
+
+# 写操作：接收写会话，执行语句并返回结果。不要在其中提交事务
+WriteJob = Callable[[AsyncSession], Awaitable[T]]
+
+
+class WriteQueue:
+    """
+    单写者、批量提交的写队列。
+
+    写操作在调用 `submit` 时入队，后台任务每次取出当前排队的所有写操作
+    （最多 `max_batch` 个），在同一个事务中依次执行后统一提交。
+    事务失败时逐个重试该批次中的写操作，只有出错的写操作会失败。
+    """
+
+    def __init__(self, session_factory: async_sessionmaker, max_batch: int):
+        self._session_factory = session_factory
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        # 统计信息：已提交的事务数和写操作数
+        self.batches = 0
+        self.writes = 0
+
+    def pending(self) -> int:
+        """
+        当前排队等待执行的写操作数。
+        """
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def start(self):
+        """
+        启动后台写任务（已在当前事件循环中运行时忽略）。
+        """
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+
+    async def stop(self):
+        """
+        处理完已入队的所有写操作后停止后台任务。
+        """
+        if self._task is None or self._task.done():
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def submit(self, job: WriteJob) -> T:
+        """
+        提交一个写操作并等待其所在的事务提交。
+
+        写操作一旦入队就一定会执行，因此调用方被取消时也会等待它完成，
+        保证调用方看到的结果与数据库状态一致。
+
+        Returns:
+            写操作的返回值。
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((job, future))
+        with anyio.CancelScope(shield=True):
+            return await future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            if None in batch:
+                # 停止前处理完队列中剩余的写操作
+                stopping = True
+                while not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+            jobs = [item for item in batch if item is not None]
+            for start in range(0, len(jobs), self.max_batch):
+                await self._execute(jobs[start:start + self.max_batch])
+
+    async def _execute(self, jobs: List[Tuple[WriteJob, asyncio.Future]]):
+        try:
+            async with self._session_factory() as session:
+                results = [await job(session) for job, _ in jobs]
+                await session.commit()
+        except Exception as e:
+            if len(jobs) == 1:
+                log.error("数据库写操作失败: %s", e)
+                future = jobs[0][1]
+                if not future.done():
+                    future.set_exception(e)
+                return
+            # 批量事务失败：逐个重试，隔离出错的写操作
+            for item in jobs:
+                await self._execute([item])
+            return
+
+        self.batches += 1
+        self.writes += len(jobs)
+        for (_, future), result in zip(jobs, results):
+            if not future.done():
+                future.set_result(result)
+
+# 创建一个全局写队列实例
+write_queue = WriteQueue(AsyncWriteSessionLocal, settings.DB_WRITE_BATCH_SIZE)
+
+registry.callback("securedrop_db_write_batches_total", "写队列提交的事务数。", "counter", lambda: write_queue.batches)
+registry.callback("securedrop_db_writes_total", "写队列执行的写操作数。", "counter", lambda: write_queue.writes)
+registry.callback("securedrop_db_write_queue_depth", "写队列中排队的写操作数。", "gauge", write_queue.pending)
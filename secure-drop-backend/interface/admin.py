@@ -4,15 +4,18 @@
 提供对访问令牌的增删改查（CRUD）功能。
 所有接口都需要管理员 JWT 认证。
 """
-from typing import List
+import json
+from datetime import datetime
+from typing import List, Literal, Optional
 import os
-from fastapi import APIRouter, Depends, HTTPException, status, Response
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from application import schemas
 from application.services.token_service import token_service
 from domain.storage import storage_service
-from domain.database import get_db
+from domain.database import get_async_db
 from utils.security import decode_access_token
 from fastapi.security import OAuth2PasswordBearer
 from utils.logger import log
@@ -24,6 +27,9 @@ router = APIRouter(
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/api/auth/admin/login")
 
+# 批量创建的响应流每次发送的令牌数
+BULK_STREAM_CHUNK = 1000
+
 async def get_current_admin_user(token: str = Depends(oauth2_scheme)):
     """
     依赖项：验证 JWT 令牌并返回当前登录的管理员用户信息。
@@ -52,95 +58,161 @@ def get_downloadable_dirs(current_user: dict = Depends(get_current_admin_user)):
     """
     try:
         base_path = storage_service.base_path
-        dirs = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d))]
+        # 以点开头的目录是内部使用的（如上传暂存目录），不对外展示
+        dirs = [
+            d for d in os.listdir(base_path)
+            if not d.startswith(".") and os.path.isdir(os.path.join(base_path, d))
+        ]
         return dirs
     except Exception as e:
-        log.error(f"获取可下载目录列表时出错: {e}")
+        log.error("获取可下载目录列表时出错: %s", e)
         raise HTTPException(status_code=500, detail="无法获取目录列表")
 
 @router.post("", response_model=schemas.TokenInDB, status_code=status.HTTP_201_CREATED)
-def create_token(
+async def create_token(
     token_in: schemas.TokenCreate,
-    db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_admin_user)
 ):
     """
     创建一个新的访问令牌。
     """
-    log.info(f"管理员 '{current_user['username']}' 正在创建新令牌。")
-    return token_service.create_token(db=db, token_in=token_in)
+    log.info("管理员 '%s' 正在创建新令牌。", current_user['username'])
+    return await token_service.create_token(token_in)
 
-@router.get("", response_model=schemas.PaginatedResponse)
-def read_tokens(
-    db: Session = Depends(get_db),
-    page: int = 1,
-    limit: int = 20,
+@router.post("/bulk", status_code=status.HTTP_201_CREATED)
+async def bulk_create_tokens(
+    bulk_in: schemas.TokenBulkCreate,
     current_user: dict = Depends(get_current_admin_user)
 ):
     """
-    获取所有令牌列表，支持分页。
+    按同一个策略模板批量创建令牌。
+
+    所有令牌在同一个事务中插入；响应以 NDJSON 流的形式逐行返回
+    `{"id": ..., "token_string": ...}`，不会在内存中构造一个巨大的 JSON 数组。
     """
-    skip = (page - 1) * limit
-    tokens = token_service.get_all_tokens(db, skip=skip, limit=limit)
-    total = token_service.get_tokens_count(db)
-    return {"total": total, "items": tokens}
+    log.info("管理员 '%s' 正在批量创建 %s 个令牌。", current_user['username'], bulk_in.count)
+    created = await token_service.bulk_create_tokens(bulk_in.policy, bulk_in.count)
+
+    async def lines():
+        for start in range(0, len(created), BULK_STREAM_CHUNK):
+            yield "".join(
+                json.dumps({"id": token_id, "token_string": token_string}) + "\n"
+                for token_id, token_string in created[start:start + BULK_STREAM_CHUNK]
+            )
+
+    return StreamingResponse(
+        lines(), status_code=status.HTTP_201_CREATED, media_type="application/x-ndjson"
+    )
+
+@router.post("/bulk/revoke", response_model=schemas.BulkOperationResponse)
+async def bulk_revoke_tokens(
+    selection: schemas.TokenBulkSelection,
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """
+    批量撤销令牌：按 ID 列表或筛选条件选择。
+    """
+    log.info("管理员 '%s' 正在批量撤销令牌。", current_user['username'])
+    affected = await token_service.bulk_revoke_tokens(ids=selection.ids, token_filter=selection.filter)
+    return {"affected": affected}
+
+@router.post("/bulk/delete", response_model=schemas.BulkOperationResponse)
+async def bulk_delete_tokens(
+    selection: schemas.TokenBulkSelection,
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """
+    批量删除令牌：按 ID 列表或筛选条件选择。
+    """
+    log.info("管理员 '%s' 正在批量删除令牌。", current_user['username'])
+    affected = await token_service.bulk_delete_tokens(ids=selection.ids, token_filter=selection.filter)
+    return {"affected": affected}
+
+@router.get("", response_model=schemas.PaginatedResponse)
+async def read_tokens(
+    db: AsyncSession = Depends(get_async_db),
+    page: int = Query(1, ge=1, description="页码（偏移分页，仅在没有游标时使用）"),
+    limit: int = Query(20, ge=1, le=500),
+    cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+    sort: Literal["id", "created_at"] = "id",
+    order: Literal["asc", "desc"] = "desc",
+    token_status: Optional[List[str]] = Query(None, alias="status", description="按状态筛选，可重复"),
+    expires_after: Optional[datetime] = Query(None, description="过期时间不早于"),
+    expires_before: Optional[datetime] = Query(None, description="过期时间早于"),
+    q: Optional[str] = Query(None, max_length=200, description="按备注搜索或按令牌字符串精确匹配"),
+    current_user: dict = Depends(get_current_admin_user)
+):
+    """
+    获取令牌列表，支持筛选和基于游标的分页。
+
+    首页不传 `cursor`，之后每页传入上一页响应中的 `next_cursor`。
+    """
+    return await token_service.list_tokens(
+        db,
+        limit=limit,
+        cursor=cursor,
+        page=page,
+        sort=sort,
+        order=order,
+        statuses=token_status,
+        expires_after=expires_after,
+        expires_before=expires_before,
+        search=q,
+    )
 
 @router.get("/{token_id}", response_model=schemas.TokenInDB)
-def read_token(
+async def read_token(
     token_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: dict = Depends(get_current_admin_user)
 ):
     """
     获取单个令牌的详细信息。
     """
-    db_token = token_service.get_token_by_id(db, token_id=token_id)
+    db_token = await token_service.get_token_by_id(db, token_id=token_id)
     if db_token is None:
         raise HTTPException(status_code=404, detail="令牌未找到")
     return db_token
 
 @router.put("/{token_id}", response_model=schemas.TokenInDB)
-def update_token(
+async def update_token(
     token_id: int,
     token_in: schemas.TokenUpdate,
-    db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_admin_user)
 ):
     """
     更新一个未使用令牌的策略。
     """
-    log.info(f"管理员 '{current_user['username']}' 正在更新令牌 ID: {token_id}。")
-    updated_token = token_service.update_token(db, token_id=token_id, token_in=token_in)
+    log.info("管理员 '%s' 正在更新令牌 ID: %s。", current_user['username'], token_id)
+    updated_token = await token_service.update_token(token_id=token_id, token_in=token_in)
     if updated_token is None:
         raise HTTPException(status_code=404, detail="令牌未找到")
     return updated_token
 
 @router.post("/{token_id}/revoke", response_model=schemas.MessageResponse)
-def revoke_token(
+async def revoke_token(
     token_id: int,
-    db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_admin_user)
 ):
     """
     手动撤销一个令牌。
     """
-    log.info(f"管理员 '{current_user['username']}' 正在撤销令牌 ID: {token_id}。")
-    revoked_token = token_service.revoke_token(db, token_id=token_id)
+    log.info("管理员 '%s' 正在撤销令牌 ID: %s。", current_user['username'], token_id)
+    revoked_token = await token_service.revoke_token(token_id=token_id)
     if revoked_token is None:
         raise HTTPException(status_code=404, detail="令牌未找到")
     return {"message": "令牌已成功撤销"}
 
 @router.delete("/{token_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_token(
+async def delete_token(
     token_id: int,
-    db: Session = Depends(get_db),
     current_user: dict = Depends(get_current_admin_user)
 ):
     """
     删除一个令牌记录。
     """
-    log.info(f"管理员 '{current_user['username']}' 正在删除令牌 ID: {token_id}。")
-    success = token_service.delete_token(db, token_id=token_id)
+    log.info("管理员 '%s' 正在删除令牌 ID: %s。", current_user['username'], token_id)
+    success = await token_service.delete_token(token_id=token_id)
     if not success:
         raise HTTPException(status_code=404, detail="令牌未找到")
     return Response(status_code=status.HTTP_204_NO_CONTENT)
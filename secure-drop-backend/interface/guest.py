@@ -5,18 +5,38 @@
 """
 import json
 from datetime import timedelta
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, Header
-from sqlalchemy.orm import Session
-from typing import Optional, List
+from urllib.parse import unquote
+import os
+import stat
+import time
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, status, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Literal, Optional, List
 
 from application import schemas
-from application.services.token_service import token_service
+from application.services.token_service import (
+    token_service, is_expired, USABLE_STATUSES, SESSION_STATUSES
+)
 from application.services.file_service import file_service
-from domain.database import get_db
-from domain.models import Token
+from application.services.upload_session_service import upload_session_service, UploadSession
+from application.services.bandwidth_service import bandwidth_service, UPLOAD, DOWNLOAD
+from application.services import access_log_service as access_log
+from application.services.access_log_service import access_log_service
+from application.services.download_link_service import ARCHIVE_LINK_PREFIX, download_link_service
+from domain.database import get_async_db
 from utils.security import create_access_token, decode_access_token
-from fastapi.responses import FileResponse
+from utils.multipart_stream import MultipartFileStream
+from utils.file_response import (
+    RangeFileResponse, content_disposition, offload_response, OFFLOAD_MODES, OFFLOAD_X_ACCEL_REDIRECT
+)
+from utils.zip_stream import stream_zip
+from utils.compression import variant_cache
+from utils.metrics import TransferMeter
+from utils.tracing import PHASE_TOKEN, span, tag_token
 from domain.storage import storage_service
+from utils.config import settings
 from utils.logger import log
 
 router = APIRouter(
@@ -24,37 +44,74 @@ router = APIRouter(
     tags=["Guest - File Exchange"],
 )
 
-def validate_token_string(db: Session, token_string: str) -> Token:
+async def validate_token_string(
+    db: AsyncSession, token_string: str, allowed_statuses=SESSION_STATUSES
+) -> schemas.TokenInDB:
     """
-    验证令牌字符串的有效性（存在、状态、有效期、使用次数）。
+    验证令牌字符串的有效性（存在、状态、有效期）。
     这是一个通用的验证函数，可以在多个地方复用。
+
+    令牌策略从进程内缓存读取，缓存未命中时才查询数据库；
+    修改、撤销和删除令牌时缓存会被立即失效。
+    使用次数只在登录时由 `token_service.consume_token` 原子地检查和消耗。
     """
     # 这里可以应用责任链模式来重构
-    token = db.query(Token).filter(Token.token_string == token_string).first()
+    with span(PHASE_TOKEN):
+        token = await token_service.get_token_policy(db, token_string)
     if not token:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="令牌无效")
-    if token.status != 'unused' and token.status != 'active':
+    tag_token(token.id)
+    if token.status not in allowed_statuses:
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=f"令牌状态为 {token.status}")
-    # ... 其他验证逻辑，如有效期、使用次数等
+    if is_expired(token.expires_at):
+        if token.status in USABLE_STATUSES:
+            await token_service.mark_expired(token_string)
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="令牌已过期")
     return token
 
+def _client_ip(request: Request) -> Optional[str]:
+    return request.client.host if request.client else None
+
+def _record(request: Request, action: str, token: Optional[schemas.TokenInDB] = None, details: Optional[str] = None):
+    """
+    记录一条访客操作的访问日志（不等待写入）。
+    """
+    access_log_service.record(
+        action,
+        token_id=token.id if token is not None else None,
+        ip_address=_client_ip(request),
+        details=details,
+    )
+
 @router.post("/login", response_model=schemas.GuestSession)
-def guest_login(
+async def guest_login(
     login_data: schemas.GuestLoginRequest,
-    db: Session = Depends(get_db)
+    request: Request,
+    db: AsyncSession = Depends(get_async_db)
 ):
     """
     访客使用令牌登录，获取一个临时的会话 JWT 和权限策略。
+
+    每次登录消耗令牌的一次使用次数。
     """
-    token = validate_token_string(db, login_data.token_string)
+    token = await token_service.consume_token(login_data.token_string)
+    if token is None:
+        # 登录失败，重新读取令牌以确定失败原因
+        try:
+            await validate_token_string(db, login_data.token_string, allowed_statuses=USABLE_STATUSES)
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="令牌使用次数已用尽")
+        except HTTPException as e:
+            _record(request, access_log.LOGIN_FAILED, details=e.detail)
+            raise
     
     # 创建一个临时的会话 JWT，有效期较短
     session_jwt = create_access_token(
         data={"sub": token.token_string, "type": "session"},
-        expires_delta=timedelta(hours=1) # 例如，会话有效期为1小时
+        expires_delta=timedelta(minutes=settings.GUEST_SESSION_EXPIRE_MINUTES)
     )
     
-    log.info(f"访客使用令牌 '{login_data.token_string}' 成功登录。")
+    log.info("访客使用令牌 '%s' 成功登录。", login_data.token_string)
+    _record(request, access_log.LOGIN, token)
     
     # 返回会话令牌和该令牌的策略
     return {
@@ -63,11 +120,11 @@ def guest_login(
     }
 
 async def get_current_guest_token(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     authorization: Optional[str] = Header(None)
-) -> Token:
+) -> schemas.TokenInDB:
     """
-    依赖项：验证访客的会话 JWT，并返回其对应的数据库令牌对象。
+    依赖项：验证访客的会话 JWT，并返回其对应的令牌策略快照。
     """
     if authorization is None:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="需要认证")
@@ -81,66 +138,452 @@ async def get_current_guest_token(
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的会话令牌")
     
     token_string = payload.get("sub")
-    token = validate_token_string(db, token_string)
+    token = await validate_token_string(db, token_string)
     return token
 
-import os
+EMPTY_FILE_LIST = {"total": 0, "items": [], "next_cursor": None}
 
-@router.get("/files", response_model=List[str])
+@router.get("/files", response_model=schemas.FileListResponse)
 def get_downloadable_files(
-    token: Token = Depends(get_current_guest_token)
+    request: Request,
+    response: Response,
+    sort: Literal["name", "size", "mtime"] = "name",
+    order: Literal["asc", "desc"] = "asc",
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
 ):
     """
-    获取当前令牌策略下可供下载的文件列表。
+    获取当前令牌策略下可供下载的文件列表（含大小和修改时间）。
+
+    支持排序和基于游标的分页；响应带有 ETag，客户端携带 If-None-Match
+    且内容未变化时返回 304。
     """
     if not token.allow_download or not token.downloadable_path:
-        return []
+        return EMPTY_FILE_LIST
     
     try:
-        # 获取文件夹的物理路径
-        dir_path = storage_service.get_file_path(token.downloadable_path)
-        if not os.path.isdir(dir_path):
-            log.warning(f"令牌 {token.token_string} 的下载路径不是一个有效的目录: {dir_path}")
-            return []
-        
-        # 列出目录下的所有文件（非文件夹）
-        files = [f for f in os.listdir(dir_path) if os.path.isfile(os.path.join(dir_path, f))]
-        return files
+        listing = file_service.list_files(
+            token.downloadable_path, sort=sort, order=order, cursor=cursor, limit=limit
+        )
+    except HTTPException:
+        raise
     except Exception as e:
-        log.error(f"获取文件列表时出错: {e}")
-        return []
+        log.error("获取文件列表时出错: %s", e)
+        return EMPTY_FILE_LIST
 
-@router.post("/upload", response_model=schemas.MessageResponse)
+    if listing is None:
+        log.warning(
+            "令牌 %s 的下载路径不是一个有效的目录: %s", token.token_string, token.downloadable_path,
+            extra={"dedup": True},
+        )
+        return EMPTY_FILE_LIST
+
+    _record(request, access_log.LIST_FILES, token, details=token.downloadable_path)
+    etag = listing.pop("etag")
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return listing
+
+def _parse_content_length(request: Request) -> Optional[int]:
+    """
+    解析请求的 Content-Length 头部，缺失或非法时返回 None。
+    """
+    value = request.headers.get("content-length")
+    if value is None or not value.isdigit():
+        return None
+    return int(value)
+
+def _require_upload(token: schemas.TokenInDB):
+    if not token.allow_upload:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="此令牌不允许上传")
+
+# 端点直接读取请求流，不再声明 File 参数，因此手动补充 OpenAPI 中的请求体描述
+UPLOAD_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+@router.post("/upload", response_model=schemas.MessageResponse, openapi_extra=UPLOAD_REQUEST_BODY)
 async def upload_file(
-    file: UploadFile = File(...),
-    token: Token = Depends(get_current_guest_token)
+    request: Request,
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
 ):
     """
     上传文件。
+
+    请求体以流的方式增量解析，文件内容直接写入最终位置，不经过临时文件。
+    客户端可以通过 `filename` 查询参数或 `X-File-Name` 头部预先声明文件名，
+    以便在读取请求体之前完成文件类型检查。
     """
-    if not token.allow_upload:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="此令牌不允许上传")
-    
-    log.info(f"令牌 '{token.token_string}' 正在上传文件: {file.filename}")
-    
-    final_filename = file_service.upload_file(file, token)
+    _require_upload(token)
+
+    # 准入检查必须在读取请求体之前完成：对于携带 `Expect: 100-continue` 的请求，
+    # 服务器只有在应用第一次读取请求体时才会发送 100 Continue，
+    # 因此在这里拒绝可以让客户端根本不发送请求体。
+    declared_name = request.query_params.get("filename")
+    if not declared_name and "x-file-name" in request.headers:
+        declared_name = unquote(request.headers["x-file-name"])
+    content_length = _parse_content_length(request)
+    file_service.admit_upload(token, content_length=content_length, filename=declared_name)
+
+    upload = MultipartFileStream(request.headers, request.stream())
+    final_filename = await file_service.upload_stream(upload, token, content_length)
+    _record(request, access_log.UPLOAD, token, details=final_filename)
     
     return {"message": "文件上传成功", "filename": final_filename}
 
+# ================== 分块上传（可续传） ==================
+
+def _session_status(session: UploadSession, response: Response) -> dict:
+    """
+    构造会话状态响应，同时通过 `Upload-Offset` 头部返回连续偏移量。
+    """
+    response.headers["Upload-Offset"] = str(session.offset)
+    return {
+        "upload_id": session.upload_id,
+        "filename": session.filename,
+        "size": session.size,
+        "offset": session.offset,
+        "received_ranges": session.ranges,
+    }
+
+@router.post("/uploads", response_model=schemas.UploadSessionStatus, status_code=status.HTTP_201_CREATED)
+async def create_upload_session(
+    session_in: schemas.UploadSessionCreate,
+    request: Request,
+    response: Response,
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
+):
+    """
+    创建一个分块上传会话。
+    """
+    _require_upload(token)
+    session = await upload_session_service.create_session(session_in.filename, session_in.size, token)
+    _record(request, access_log.UPLOAD_SESSION_CREATE, token,
+            details=f"{session.upload_id}: {session.filename} ({session.size} 字节)")
+    return _session_status(session, response)
+
+@router.get("/uploads/{upload_id}", response_model=schemas.UploadSessionStatus)
+async def get_upload_session(
+    upload_id: str,
+    response: Response,
+    token: schemas.TokenInDB = Depends(get_current_guest_token),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    查询上传会话的进度，客户端据此决定从哪里续传。
+    """
+    _require_upload(token)
+    session = await upload_session_service.get_session(db, upload_id, token)
+    return _session_status(session, response)
+
+@router.put("/uploads/{upload_id}", response_model=schemas.UploadSessionStatus)
+async def upload_chunk(
+    upload_id: str,
+    request: Request,
+    response: Response,
+    offset: Optional[int] = None,
+    upload_offset: Optional[int] = Header(None),
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
+):
+    """
+    将请求体（原始字节）写入会话文件的指定偏移量。
+
+    偏移量通过 `offset` 查询参数或 `Upload-Offset` 头部指定。
+    不同偏移量的分块可以并行上传。
+    """
+    _require_upload(token)
+    chunk_offset = offset if offset is not None else upload_offset
+    if chunk_offset is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="缺少偏移量")
+    chunks = bandwidth_service.shape(request.stream(), token, UPLOAD)
+    session = await upload_session_service.write_chunk(upload_id, chunk_offset, chunks, token)
+    return _session_status(session, response)
+
+@router.post("/uploads/{upload_id}/complete", response_model=schemas.MessageResponse)
+async def complete_upload_session(
+    upload_id: str,
+    request: Request,
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
+):
+    """
+    提交上传会话，文件按令牌的上传路径和冲突策略保存。
+    """
+    _require_upload(token)
+    final_filename = await upload_session_service.complete_session(upload_id, token)
+    _record(request, access_log.UPLOAD_SESSION_COMPLETE, token, details=f"{upload_id}: {final_filename}")
+    return {"message": "文件上传成功", "filename": final_filename}
+
+@router.delete("/uploads/{upload_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def abort_upload_session(
+    upload_id: str,
+    request: Request,
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
+):
+    """
+    取消上传会话并删除已上传的数据。
+    """
+    _require_upload(token)
+    await upload_session_service.abort_session(upload_id, token)
+    _record(request, access_log.UPLOAD_SESSION_ABORT, token, details=upload_id)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+def _require_download(token: schemas.TokenInDB):
+    if not token.allow_download:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="此令牌不允许下载")
+    if not token.downloadable_path:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="此令牌未配置下载路径")
+
+# 单次打包下载最多可以指定的文件数
+MAX_ARCHIVE_SELECTION = 1000
+
+@router.get("/download-archive")
+async def download_archive(
+    request: Request,
+    files: Optional[List[str]] = Query(None, description="要打包的文件名，可重复；不指定时打包全部文件"),
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
+):
+    """
+    把下载目录中的全部文件（或指定的部分文件）打包成 ZIP 下载。
+
+    归档边读取文件边生成，不使用临时文件；已经压缩过的格式原样存储。
+    令牌的下载限速同样作用于归档数据流。
+    """
+    _require_download(token)
+    if files is not None and len(files) > MAX_ARCHIVE_SELECTION:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"一次最多打包 {MAX_ARCHIVE_SELECTION} 个文件"
+        )
+
+    log.info("令牌 '%s' 正在打包下载", token.token_string)
+    return await _archive_response(request, token.downloadable_path, files, token)
+
+@router.post("/download-archive-link", response_model=schemas.DownloadLink)
+async def create_download_archive_link(
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
+):
+    """
+    为整个下载目录的 ZIP 打包下载签发短时有效的链接。
+
+    与单个文件的签名链接一样，浏览器可以直接用 `<a href>` 访问，
+    归档边生成边由浏览器保存到磁盘，不需要先读进内存。
+    """
+    _require_download(token)
+    path = os.path.normpath(token.downloadable_path).replace(os.sep, "/")
+    url, expires_at = download_link_service.sign(token, path, prefix=ARCHIVE_LINK_PREFIX)
+    return schemas.DownloadLink(filename=_archive_name(path), url=url, expires_at=expires_at)
+
+@router.get("/dl-archive/{token_id}/{dir_path:path}")
+async def download_archive_signed(
+    token_id: int,
+    dir_path: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    expires: int = Query(..., alias="e"),
+    version: int = Query(..., alias="v"),
+    resumable: int = Query(..., alias="r"),
+    limit_kbps: int = Query(..., alias="l"),
+    signature: str = Query(..., alias="s"),
+):
+    """
+    通过签名链接打包下载整个下载目录。验证方式与单个文件的签名链接相同。
+    """
+    grant = download_link_service.verify(
+        token_id, dir_path, expires, version, resumable, limit_kbps, signature, prefix=ARCHIVE_LINK_PREFIX
+    )
+    token = await token_service.get_token_policy_by_id(db, token_id)
+    download_link_service.ensure_current(grant, token, SESSION_STATUSES)
+    tag_token(grant.id)
+    full_path = storage_service.get_file_path(dir_path)
+    if not os.path.abspath(full_path).startswith(storage_service.base_path + os.sep):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="禁止访问")
+    return await _archive_response(request, dir_path, None, grant)
+
+def _archive_name(dir_path: str) -> str:
+    return (os.path.basename(os.path.normpath(dir_path)) or "files") + ".zip"
+
+async def _archive_response(request: Request, dir_path: str, files: Optional[List[str]], policy) -> Response:
+    """
+    把目录中的文件实时打包成 ZIP 响应。`policy` 可以是令牌策略，也可以是签名链接中的下载授权。
+
+    列出目录和读取文件信息在线程中进行，大目录不会阻塞事件循环。
+    """
+    entries = await anyio.to_thread.run_sync(file_service.archive_entries, dir_path, files)
+    if entries is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="下载目录不存在")
+
+    archive_name = _archive_name(dir_path)
+    _record(request, access_log.DOWNLOAD_ARCHIVE, policy, details=f"{archive_name} ({len(entries)} 个文件)")
+    return StreamingResponse(
+        stream_zip(
+            entries,
+            throttle=bandwidth_service.throttle(policy, DOWNLOAD),
+            meter=TransferMeter(policy.id, DOWNLOAD),
+        ),
+        media_type="application/zip",
+        headers={"Content-Disposition": content_disposition(archive_name)},
+    )
+
+def _offload_target(full_path: str) -> Optional[str]:
+    """
+    按卸载模式计算交给反向代理的目标；未启用卸载或无法卸载时返回 None。
+    """
+    mode = settings.DOWNLOAD_OFFLOAD_MODE
+    if mode not in OFFLOAD_MODES:
+        return None
+    if mode == OFFLOAD_X_ACCEL_REDIRECT:
+        rel_path = os.path.relpath(full_path, storage_service.base_path).replace(os.sep, "/")
+        return f"{settings.DOWNLOAD_OFFLOAD_PREFIX.rstrip('/')}/{rel_path}"
+    # X-Sendfile 的值是原始路径，HTTP 头部无法表示非 ASCII 字符，这类文件仍由应用发送
+    target = os.path.abspath(full_path)
+    return target if target.isascii() else None
+
+async def _stat_file(full_path: str) -> os.stat_result:
+    """
+    在线程中读取文件信息，不是普通文件时返回 404。
+    """
+    try:
+        stat_result = await anyio.to_thread.run_sync(os.stat, full_path)
+    except OSError:
+        stat_result = None
+    if stat_result is None or not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件未找到")
+    return stat_result
+
+async def _download_response(
+    request: Request,
+    full_path: str,
+    stat_result: os.stat_result,
+    filename: str,
+    policy,
+    cache_control: Optional[str] = None,
+) -> Response:
+    """
+    按下载策略生成文件响应。`stat_result` 是 `_stat_file` 读取的原文件信息。
+
+    `policy` 可以是令牌策略，也可以是签名链接中的下载授权，
+    只使用其中的 `id`、`allow_resumable_download` 和 `download_bandwidth_limit_kbps`。
+    """
+    range_header = request.headers.get("range")
+    # 卸载模式：应用只负责鉴权，由反向代理发送文件（代理自行处理 Range 请求，
+    # 因此令牌不允许断点续传时仍由应用发送）。这部分流量不计入传输指标
+    offload_target = _offload_target(full_path) if policy.allow_resumable_download else None
+    if offload_target is not None:
+        rate_limit = (policy.download_bandwidth_limit_kbps or 0) * 1024
+        response = offload_response(settings.DOWNLOAD_OFFLOAD_MODE, offload_target, filename, rate_limit or None)
+        if cache_control:
+            response.headers["cache-control"] = cache_control
+        return response
+
+    # 完整下载时按 Accept-Encoding 发送预先压缩好的变体。区间请求始终针对原始内容，
+    # 压缩后的响应声明 `Accept-Ranges: none`，避免客户端把两种表示的字节拼接在一起
+    path, content_encoding = full_path, None
+    headers = {"cache-control": cache_control} if cache_control else {}
+    allow_ranges = bool(policy.allow_resumable_download)
+    if variant_cache.is_candidate(full_path, stat_result):
+        headers["vary"] = "Accept-Encoding"
+        if range_header is None or not allow_ranges:
+            variant = await variant_cache.lookup(full_path, stat_result, request.headers.get("accept-encoding"))
+            if variant is not None:
+                path, content_encoding, stat_result = variant.path, variant.encoding, variant.stat_result
+                allow_ranges = False
+    return RangeFileResponse(
+        path=path,
+        filename=filename,
+        allow_ranges=allow_ranges,
+        stat_result=stat_result,
+        headers=headers,
+        throttle=bandwidth_service.throttle(policy, DOWNLOAD),
+        content_encoding=content_encoding,
+        meter=TransferMeter(policy.id, DOWNLOAD),
+    )
+
+@router.post("/download-links", response_model=schemas.DownloadLinksResponse)
+async def create_download_links(
+    body: schemas.DownloadLinkRequest,
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
+):
+    """
+    为下载目录中的文件签发短时有效的下载链接。
+
+    链接本身携带了签名后的授权信息，访问时不需要认证头部，
+    浏览器可以直接用 `<a href>` 下载，支持原生的流式保存和断点续传。
+    """
+    _require_download(token)
+    links = []
+    for filename in body.filenames:
+        if not filename or filename.startswith(".") or "/" in filename or "\\" in filename:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"无效的文件名: {filename}")
+        path = os.path.normpath(os.path.join(token.downloadable_path, filename)).replace(os.sep, "/")
+        url, expires_at = download_link_service.sign(token, path)
+        links.append(schemas.DownloadLink(filename=filename, url=url, expires_at=expires_at))
+    return {"links": links}
+
+@router.get("/dl/{token_id}/{file_path:path}")
+async def download_signed(
+    token_id: int,
+    file_path: str,
+    request: Request,
+    db: AsyncSession = Depends(get_async_db),
+    expires: int = Query(..., alias="e"),
+    version: int = Query(..., alias="v"),
+    resumable: int = Query(..., alias="r"),
+    limit_kbps: int = Query(..., alias="l"),
+    signature: str = Query(..., alias="s"),
+):
+    """
+    通过签名链接下载文件。
+
+    验证链接的签名和有效期，并将其中的策略版本与令牌当前的策略快照比较，不解析会话令牌；
+    策略快照通常来自缓存，不需要查询数据库。
+    响应可以被前端缓存或代理缓存到链接过期为止。
+    """
+    grant = download_link_service.verify(token_id, file_path, expires, version, resumable, limit_kbps, signature)
+    token = await token_service.get_token_policy_by_id(db, token_id)
+    download_link_service.ensure_current(grant, token, SESSION_STATUSES)
+    tag_token(grant.id)
+    full_path = storage_service.get_file_path(file_path)
+    if not os.path.abspath(full_path).startswith(storage_service.base_path + os.sep):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="禁止访问")
+    stat_result = await _stat_file(full_path)
+
+    filename = os.path.basename(file_path)
+    range_header = request.headers.get("range")
+    _record(request, access_log.DOWNLOAD, grant,
+            details=f"{filename} (签名链接, {range_header})" if range_header else f"{filename} (签名链接)")
+    max_age = max(grant.expires - int(time.time()), 0)
+    return await _download_response(
+        request, full_path, stat_result, filename, grant, cache_control=f"public, max-age={max_age}"
+    )
+
 @router.get("/download/{filename}")
 async def download_file(
     filename: str,
-    token: Token = Depends(get_current_guest_token)
+    request: Request,
+    token: schemas.TokenInDB = Depends(get_current_guest_token)
 ):
     """
     下载指定的文件。
-    """
-    if not token.allow_download:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="此令牌不允许下载")
 
+    支持单区间/多区间的 Range 请求以及 If-None-Match、If-Range 等条件请求；
+    令牌策略不允许断点续传时，Range 头部会被忽略并返回完整文件。
+    配置了 `DOWNLOAD_OFFLOAD_MODE` 时，文件内容交给前端反向代理发送。
+    """
     # 现在我们不再检查 JSON 列表，而是检查文件是否在指定的目录中
-    if not token.downloadable_path:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="此令牌未配置下载路径")
+    _require_download(token)
 
     # 安全地构建文件路径，防止路径遍历攻击
     full_path = storage_service.get_file_path(os.path.join(token.downloadable_path, filename))
@@ -150,8 +593,10 @@ async def download_file(
     if not os.path.abspath(full_path).startswith(os.path.abspath(base_dir)):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="禁止访问")
 
-    if not os.path.isfile(full_path):
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="文件未找到")
+    stat_result = await _stat_file(full_path)
 
-    log.info(f"令牌 '{token.token_string}' 正在下载文件: {filename}")
-    return FileResponse(path=full_path, filename=filename, media_type='application/octet-stream')
+    log.info("令牌 '%s' 正在下载文件: %s", token.token_string, filename)
+    range_header = request.headers.get("range")
+    _record(request, access_log.DOWNLOAD, token,
+            details=f"{filename} ({range_header})" if range_header else filename)
+    return await _download_response(request, full_path, stat_result, filename, token)
@@ -0,0 +1,45 @@
+"""
+监控指标 API 端点
+
+以 Prometheus 文本格式导出运行指标，供 Prometheus 等监控系统抓取。
+"""
+import hmac
+from typing import Optional
+import anyio
+from fastapi import APIRouter, Header, HTTPException, status
+from fastapi.responses import PlainTextResponse
+from utils.config import settings
+from utils.metrics import registry
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+router = APIRouter(tags=["Monitoring"])
+
+# 同步端点和文件 I/O 使用的线程池，占用数持续接近上限说明工作线程已经饱和
+registry.callback(
+    "securedrop_threadpool_busy_threads", "线程池中正在使用的线程数。", "gauge",
+    lambda: anyio.to_thread.current_default_thread_limiter().borrowed_tokens,
+)
+registry.callback(
+    "securedrop_threadpool_max_threads", "线程池的线程数上限。", "gauge",
+    lambda: anyio.to_thread.current_default_thread_limiter().total_tokens,
+)
+
+@router.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """
+    导出所有指标，需要 `Authorization: Bearer <METRICS_TOKEN>`。
+    """
+    scheme, _, credentials = (authorization or "").partition(" ")
+    if (
+        not settings.METRICS_TOKEN
+        or scheme.lower() != "bearer"
+        or not hmac.compare_digest(credentials, settings.METRICS_TOKEN)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效的监控令牌",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return PlainTextResponse(registry.render(), media_type=CONTENT_TYPE)
@@ -2,13 +2,22 @@
 FastAPI 应用主入口文件
 """
 import os
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from domain.database import init_db
-from interface import auth, admin, guest
+from domain.database import init_db, async_engine, async_write_engine
+from domain.write_queue import write_queue
+from application.services.access_log_service import access_log_service
+from application.services.quota_service import quota_service
+from application.services.token_sweeper import token_sweeper
+from application.services.storage_gc import storage_gc
+from interface import auth, admin, guest, metrics
+from utils.static_files import (
+    CompressedStaticFiles, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+)
+from utils.config import settings
 from utils.logger import log
+from utils.metrics import MetricsMiddleware
+from utils.tracing import TracingMiddleware
 
 # 创建 FastAPI 应用实例
 app = FastAPI(
@@ -32,39 +41,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 记录每个请求的耗时和状态码（Prometheus 指标）
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+# 记录每个请求各阶段的耗时（Server-Timing 头部、追踪记录和慢请求采样分析）
+if settings.TRACE_ENABLED:
+    app.add_middleware(TracingMiddleware)
+
 @app.on_event("startup")
-def on_startup():
+async def on_startup():
     """
     应用启动时执行的事件。
     """
     log.info("应用开始启动...")
     # 初始化数据库，如果表不存在则创建
     init_db()
+    # 启动数据库写队列和访问日志写入器
+    write_queue.start()
+    access_log_service.start()
+    # 按现有的租约修正上传配额的预留量（旧版本遗留的、没有租约记录的预留）
+    await quota_service.recompute_reserved()
+    # 启动到期和用尽令牌的后台清理任务
+    token_sweeper.start()
+    # 启动存储垃圾回收任务（仅去重存储有需要回收的内容）
+    storage_gc.start()
     log.info("应用启动完成。")
 
+@app.on_event("shutdown")
+async def on_shutdown():
+    """
+    应用关闭时执行的事件：写入剩余的访问日志和写队列中的写操作，并释放异步数据库连接池。
+    """
+    await token_sweeper.stop()
+    await storage_gc.stop()
+    await access_log_service.stop()
+    await write_queue.stop()
+    await async_engine.dispose()
+    await async_write_engine.dispose()
+
 # 包含认证路由
 app.include_router(auth.router)
 # 包含管理员路由
 app.include_router(admin.router)
 # 包含访客路由
 app.include_router(guest.router)
+# 包含监控指标路由（必须设置 METRICS_TOKEN，指标中包含令牌 ID 等信息，不能公开访问）
+if settings.METRICS_ENABLED:
+    if settings.METRICS_TOKEN:
+        app.include_router(metrics.router)
+    else:
+        log.warning("已启用监控指标，但未设置 METRICS_TOKEN，/metrics 端点不会开放。")
 
 # --- 托管前端静态文件 ---
 # 注意：这个路径是相对于后端项目根目录的
 FRONTEND_BUILD_DIR = os.path.join(os.path.dirname(__file__), "..", "secure-drop-frontend", "build")
 
-# 1. 挂载 static 目录
+# 1. 挂载 static 目录（文件名带内容哈希，可以永久缓存）
 if os.path.exists(os.path.join(FRONTEND_BUILD_DIR, "static")):
     app.mount(
         "/static",
-        StaticFiles(directory=os.path.join(FRONTEND_BUILD_DIR, "static")),
+        CompressedStaticFiles(
+            directory=os.path.join(FRONTEND_BUILD_DIR, "static"),
+            cache_control=IMMUTABLE_CACHE_CONTROL,
+        ),
         name="static",
     )
 
 # 2. 根路径和其他静态文件（如 manifest.json, favicon.ico）
 if os.path.exists(FRONTEND_BUILD_DIR):
-    # 创建一个虚拟的 StaticFiles 实例来获取文件路径
-    static_files_app = StaticFiles(directory=FRONTEND_BUILD_DIR)
+    # 创建一个虚拟的 StaticFiles 实例来获取文件路径；这些文件名不带哈希，每次都需要重新验证
+    static_files_app = CompressedStaticFiles(
+        directory=FRONTEND_BUILD_DIR, cache_control=REVALIDATE_CACHE_CONTROL
+    )
     
     @app.get("/{full_path:path}", include_in_schema=False)
     async def serve_react_app(request: Request, full_path: str):
@@ -85,15 +133,13 @@ if os.path.exists(FRONTEND_BUILD_DIR):
             return await static_files_app.get_response(full_path, request.scope)
         
         # 如果找不到文件，则返回 index.html
-        index_path = os.path.join(FRONTEND_BUILD_DIR, "index.html")
-        return FileResponse(index_path)
+        return await static_files_app.get_response("index.html", request.scope)
 
     @app.get("/", include_in_schema=False)
-    async def root():
+    async def root(request: Request):
         """
         根路径，返回 index.html。
         """
-        index_path = os.path.join(FRONTEND_BUILD_DIR, "index.html")
-        return FileResponse(index_path)
+        return await static_files_app.get_response("index.html", request.scope)
 else:
-    log.warning(f"前端构建目录未找到: {FRONTEND_BUILD_DIR}。将只提供 API 服务。")
+    log.warning("前端构建目录未找到: %s。将只提供 API 服务。", FRONTEND_BUILD_DIR)
@@ -0,0 +1,76 @@
+"""
+进程内缓存模块
+
+提供一个有容量上限、带过期时间的 LRU 缓存。
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    有容量上限的 TTL 缓存。
+
+    超过 `max_size` 时淘汰最久未使用的条目；条目在写入 `ttl` 秒后过期。
+    同步端点运行在线程池中，因此所有操作都在锁内完成。
+
+    每次 `invalidate` 或 `clear` 都会递增 `generation`。先读数据库再写缓存的调用方
+    应在查询前记下 `generation` 并传给 `set`：查询期间有条目被作废时放弃写入，
+    避免把查询开始前读到的旧值重新放回缓存。
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.generation = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        获取缓存值，不存在或已过期时返回 None。
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[1] < time.monotonic():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def set(self, key: Hashable, value: Any, generation: Optional[int] = None):
+        """
+        写入缓存值。指定了 `generation` 且此后缓存有条目被作废时不写入。
+        """
+        if self.max_size <= 0 or self.ttl <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key: Hashable):
+        """
+        删除一个条目（不存在时忽略）。
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self.generation += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.generation += 1
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,404 @@
+"""
+内容编码协商与预压缩变体缓存模块
+
+根据请求的 `Accept-Encoding` 选择 gzip、brotli 或 zstd 编码。压缩结果作为变体文件
+缓存在原文件所在目录的 `.encoded` 子目录中（配置了 `COMPRESSION_VARIANT_DIR` 时
+集中保存在该目录下），变体的修改时间与原文件保持一致，原文件被修改后变体自动失效。
+
+变体在后台线程中生成：某个文件第一次被请求时先按原样返回，同时排队生成变体，
+之后的请求直接发送压缩好的文件，不会在请求路径上消耗 CPU。
+已经压缩过的格式（按扩展名或文件头的魔数识别）以及压缩效果不明显的文件会被跳过。
+生成失败（例如目录只读）的文件按原文件的修改时间记录下来，按指数退避重试，
+不会在每次请求时重新排队并重复输出错误日志。
+
+前端构建目录这类部署后不再变化的文件可以在部署时预先生成变体::
+
+    python -m utils.compression ../secure-drop-frontend/build
+
+brotli 和 zstd 分别需要安装 `brotli` 和 `zstandard` 包，未安装时只提供 gzip。
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+import zlib
+from typing import Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+import anyio
+from utils.cache import TTLCache
+from utils.config import settings
+from utils.logger import log
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - 可选依赖
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - 可选依赖
+    zstandard = None
+
+# 变体文件所在的子目录（以点开头，不会出现在文件列表中）
+VARIANT_DIR = ".encoded"
+# 标记文件的后缀：表示该文件不值得压缩
+SKIP_SUFFIX = ".identity"
+# 压缩后至少要小于原文件的这个比例才保留变体
+MIN_RATIO = 0.9
+READ_CHUNK_SIZE = 1024 * 1024
+# 生成失败后第一次重试前等待的秒数，之后每次失败翻倍，最长等待 FAILURE_MAX_BACKOFF 秒
+FAILURE_BACKOFF = 60
+FAILURE_MAX_BACKOFF = 3600
+# 记录生成失败的最大文件数
+MAX_FAILURES = 10000
+
+# 这些格式本身已经压缩，再压缩只会浪费 CPU
+PRECOMPRESSED_EXTENSIONS = frozenset({
+    ".zip", ".gz", ".tgz", ".bz2", ".xz", ".zst", ".7z", ".rar", ".lz4", ".br",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".heic", ".avif",
+    ".mp3", ".aac", ".m4a", ".ogg", ".opus", ".flac",
+    ".mp4", ".m4v", ".mkv", ".mov", ".avi", ".webm",
+    ".pdf", ".docx", ".xlsx", ".pptx", ".odt", ".ods", ".odp", ".epub",
+    ".apk", ".jar", ".whl", ".dmg", ".iso", ".msi",
+    ".woff", ".woff2",
+})
+
+# 常见压缩格式的文件头，用于识别扩展名不可靠的文件
+PRECOMPRESSED_MAGIC = (
+    b"\x1f\x8b",              # gzip
+    b"PK\x03\x04",            # zip 及基于 zip 的格式
+    b"\x28\xb5\x2f\xfd",      # zstd
+    b"\xfd7zXZ\x00",          # xz
+    b"BZh",                   # bzip2
+    b"7z\xbc\xaf\x27\x1c",    # 7z
+    b"Rar!\x1a\x07",          # rar
+    b"\x89PNG",               # png
+    b"\xff\xd8\xff",          # jpeg
+    b"GIF8",                  # gif
+    b"OggS",                  # ogg
+    b"ID3",                   # mp3
+    b"\x1a\x45\xdf\xa3",      # mkv / webm
+    b"%PDF",                  # pdf
+)
+
+
+class Encoder(NamedTuple):
+    # 变体文件的扩展名
+    suffix: str
+    # 创建一个流式压缩器，返回 (compress, flush) 两个函数
+    factory: Callable[[], Tuple[Callable[[bytes], bytes], Callable[[], bytes]]]
+
+
+def _gzip_encoder():
+    compressor = zlib.compressobj(9, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress, compressor.flush
+
+
+def _brotli_encoder():
+    compressor = brotli.Compressor(quality=9)
+    return compressor.process, compressor.finish
+
+
+def _zstd_encoder():
+    compressor = zstandard.ZstdCompressor(level=12).compressobj()
+    return compressor.compress, compressor.flush
+
+
+# 可用的编码，按服务器的偏好顺序排列（客户端权重相同时优先选择靠前的）
+ENCODERS: Dict[str, Encoder] = {}
+if brotli is not None:
+    ENCODERS["br"] = Encoder(".br", _brotli_encoder)
+if zstandard is not None:
+    ENCODERS["zstd"] = Encoder(".zst", _zstd_encoder)
+ENCODERS["gzip"] = Encoder(".gz", _gzip_encoder)
+
+
+def parse_accept_encoding(value: Optional[str]) -> Dict[str, float]:
+    """
+    解析 `Accept-Encoding` 头部，返回 {编码: 权重}。编码名统一转为小写。
+    """
+    weights: Dict[str, float] = {}
+    if not value:
+        return weights
+    for part in value.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[coding] = q
+    return weights
+
+
+def negotiate(accept_encoding: Optional[str], available: List[str]) -> Optional[str]:
+    """
+    从 `available` 中选出客户端最愿意接受的编码；都不可接受时返回 None（使用原始内容）。
+    """
+    weights = parse_accept_encoding(accept_encoding)
+    if not weights:
+        return None
+    wildcard = weights.get("*", 0.0)
+    best, best_q = None, 0.0
+    for coding in available:
+        q = weights.get(coding, weights.get("x-gzip", wildcard) if coding == "gzip" else wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def is_precompressed(path: str) -> bool:
+    """
+    按扩展名和文件头判断文件是否已经是压缩格式。
+    """
+    if os.path.splitext(path)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+        return True
+    try:
+        with open(path, "rb") as f:
+            head = f.read(16)
+    except OSError:
+        return True
+    if head[4:8] == b"ftyp" or (head[:4] == b"RIFF" and head[8:12] == b"WEBP"):
+        return True  # mp4 / mov / heic, webp
+    return head.startswith(PRECOMPRESSED_MAGIC)
+
+
+class Variant(NamedTuple):
+    path: str
+    encoding: str
+    stat_result: os.stat_result
+
+
+class VariantCache:
+    """
+    压缩变体的磁盘缓存和后台生成队列。
+    """
+
+    def __init__(self, enabled: bool, min_size: int, max_size: int, workers: int, variant_dir: str = ""):
+        self.enabled = enabled and bool(ENCODERS)
+        self.min_size = min_size
+        self.max_size = max_size
+        self.workers = workers
+        self.variant_dir = os.path.abspath(variant_dir) if variant_dir else ""
+        self._pending: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # 原文件路径 -> (原文件的修改时间, 下次重试的时间, 连续失败次数)
+        self._failures = TTLCache(max_size=MAX_FAILURES, ttl=FAILURE_MAX_BACKOFF)
+
+    def _variant_base(self, path: str) -> str:
+        """
+        变体文件的路径前缀（再加上编码对应的扩展名）。
+
+        配置了变体目录时按原文件的绝对路径在其下建立同样的层级，否则放在原文件旁边的 `.encoded` 中。
+        """
+        if self.variant_dir:
+            path = os.path.splitdrive(os.path.abspath(path))[1]
+            return os.path.join(self.variant_dir, path.lstrip(os.sep))
+        directory, name = os.path.split(path)
+        return os.path.join(directory, VARIANT_DIR, name)
+
+    def is_candidate(self, path: str, stat_result: os.stat_result) -> bool:
+        """
+        文件的大小和扩展名是否适合压缩（不读取文件内容）。
+        """
+        return (
+            self.enabled
+            and self.min_size <= stat_result.st_size <= self.max_size
+            and os.path.splitext(path)[1].lower() not in PRECOMPRESSED_EXTENSIONS
+        )
+
+    async def lookup(
+        self, path: str, stat_result: os.stat_result, accept_encoding: Optional[str]
+    ) -> Optional[Variant]:
+        """
+        查找与原文件一致、且客户端可以接受的压缩变体。
+
+        读取变体文件信息的系统调用在线程中进行，不阻塞事件循环。
+        没有可用变体且文件值得压缩时，排队在后台生成变体，本次返回 None。
+        """
+        if not self.is_candidate(path, stat_result) or not parse_accept_encoding(accept_encoding):
+            return None
+        variant, incomplete = await anyio.to_thread.run_sync(self._find, path, stat_result, accept_encoding)
+        if incomplete and not self._is_backing_off(path, stat_result):
+            self._schedule(path)
+        return variant
+
+    def _find(
+        self, path: str, stat_result: os.stat_result, accept_encoding: Optional[str]
+    ) -> Tuple[Optional[Variant], bool]:
+        """
+        读取原文件的各个变体的信息（同步执行，应在线程中调用）。
+
+        Returns:
+            Tuple[Optional[Variant], bool]: 客户端可以接受的最优变体（没有时为 None），
+            以及是否还有缺失或过期、需要生成的变体。
+        """
+        base = self._variant_base(path)
+        fresh = {}
+        for coding, encoder in ENCODERS.items():
+            try:
+                st = os.stat(base + encoder.suffix)
+            except OSError:
+                continue
+            if st.st_mtime_ns == stat_result.st_mtime_ns:
+                fresh[coding] = st
+
+        incomplete = len(fresh) < len(ENCODERS) and not self._is_skipped(base, stat_result)
+        coding = negotiate(accept_encoding, list(fresh))
+        if coding is None:
+            return None, incomplete
+        return Variant(base + ENCODERS[coding].suffix, coding, fresh[coding]), incomplete
+
+    @staticmethod
+    def _is_skipped(base: str, stat_result: os.stat_result) -> bool:
+        try:
+            return os.stat(base + SKIP_SUFFIX).st_mtime_ns == stat_result.st_mtime_ns
+        except OSError:
+            return False
+
+    def _is_backing_off(self, path: str, stat_result: os.stat_result) -> bool:
+        failure = self._failures.get(path)
+        # 原文件被修改后立即重试
+        return (
+            failure is not None
+            and failure[0] == stat_result.st_mtime_ns
+            and time.monotonic() < failure[1]
+        )
+
+    def _record_failure(self, path: str, error: Exception):
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return
+        failure = self._failures.get(path)
+        attempts = failure[2] + 1 if failure is not None and failure[0] == mtime_ns else 1
+        delay = min(FAILURE_BACKOFF * 2 ** (attempts - 1), FAILURE_MAX_BACKOFF)
+        self._failures.set(path, (mtime_ns, time.monotonic() + delay, attempts))
+        if attempts == 1:
+            log.warning("生成压缩变体失败，%s 秒后重试: %s (%s)", delay, path, error)
+        else:
+            log.debug("第 %s 次生成压缩变体失败，%s 秒后重试: %s (%s)", attempts, delay, path, error)
+
+    def _schedule(self, path: str):
+        if path in self._pending:
+            return
+        self._pending.add(path)
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.workers)
+        task = asyncio.get_running_loop().create_task(self._generate(path))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _generate(self, path: str):
+        try:
+            async with self._semaphore:
+                await anyio.to_thread.run_sync(self.build_variants, path)
+            self._failures.invalidate(path)
+        except Exception as e:
+            self._record_failure(path, e)
+        finally:
+            self._pending.discard(path)
+
+    def build_variants(self, path: str):
+        """
+        生成文件的所有压缩变体（同步执行，应在线程中调用）。
+        """
+        stat_result = os.stat(path)
+        base = self._variant_base(path)
+        os.makedirs(os.path.dirname(base), exist_ok=True)
+        times = (stat_result.st_atime_ns, stat_result.st_mtime_ns)
+        if is_precompressed(path):
+            self._mark_skipped(base, times)
+            return
+
+        for coding, encoder in ENCODERS.items():
+            target = base + encoder.suffix
+            try:
+                if os.stat(target).st_mtime_ns == stat_result.st_mtime_ns:
+                    continue
+            except OSError:
+                pass
+            temp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+            try:
+                compress, flush = encoder.factory()
+                with open(path, "rb") as src, open(temp_path, "wb") as dst:
+                    while True:
+                        data = src.read(READ_CHUNK_SIZE)
+                        if not data:
+                            break
+                        dst.write(compress(data))
+                    dst.write(flush())
+                if os.path.getsize(temp_path) > stat_result.st_size * MIN_RATIO:
+                    # 压缩效果不明显，其他编码也不会好太多
+                    os.remove(temp_path)
+                    self._mark_skipped(base, times)
+                    return
+                os.utime(temp_path, ns=times)
+                os.replace(temp_path, target)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+        log.info("已生成压缩变体: %s", path)
+
+    @staticmethod
+    def _mark_skipped(base: str, times: Tuple[int, int]):
+        with open(base + SKIP_SUFFIX, "wb"):
+            pass
+        os.utime(base + SKIP_SUFFIX, ns=times)
+
+    def build_directory(self, directory: str) -> Tuple[int, int]:
+        """
+        为目录（递归）中所有适合压缩的文件生成变体，跳过变体目录本身。
+
+        Returns:
+            Tuple[int, int]: 处理的文件数和失败的文件数。
+        """
+        built = failed = 0
+        for root, dirs, files in os.walk(directory):
+            dirs[:] = [d for d in dirs if d != VARIANT_DIR]
+            if self.variant_dir and os.path.abspath(root).startswith(self.variant_dir):
+                continue
+            for name in files:
+                path = os.path.join(root, name)
+                if not self.is_candidate(path, os.stat(path)):
+                    continue
+                try:
+                    self.build_variants(path)
+                    built += 1
+                except OSError as e:
+                    log.error("生成压缩变体失败: %s (%s)", path, e)
+                    failed += 1
+        return built, failed
+
+# 创建一个全局实例
+variant_cache = VariantCache(
+    enabled=settings.COMPRESSION_ENABLED,
+    min_size=settings.COMPRESSION_MIN_SIZE_BYTES,
+    max_size=settings.COMPRESSION_MAX_FILE_MB * 1024 * 1024,
+    workers=settings.COMPRESSION_WORKERS,
+    variant_dir=settings.COMPRESSION_VARIANT_DIR,
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="为目录中的静态文件预先生成压缩变体（例如部署时的前端构建目录）。")
+    parser.add_argument("directories", nargs="+", help="要处理的目录")
+    args = parser.parse_args()
+    if not variant_cache.enabled:
+        parser.error("压缩未启用（COMPRESSION_ENABLED=false）。")
+    failed = 0
+    for directory in args.directories:
+        built, errors = variant_cache.build_directory(directory)
+        failed += errors
+        print(f"{directory}: 处理了 {built} 个文件，失败 {errors} 个。")
+    raise SystemExit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
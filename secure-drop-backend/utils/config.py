@@ -12,17 +12,129 @@ class Settings(BaseSettings):
     """
     # 数据库配置
     DATABASE_URL: str
+    # SQLite 配置档: default（SQLite 默认设置）或 concurrent（WAL 及并发优化）
+    SQLITE_PROFILE: str = "concurrent"
+    # 数据库被锁定时的最长等待时间（毫秒）
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # 每个连接的页缓存大小（KiB）
+    SQLITE_CACHE_SIZE_KB: int = 65536
+    # 内存映射读取的大小（MB，0 表示关闭）
+    SQLITE_MMAP_SIZE_MB: int = 256
+    # 请求会话使用的读连接池大小
+    DB_READER_POOL_SIZE: int = 8
+    # 写队列单个事务最多合并的写操作数
+    DB_WRITE_BATCH_SIZE: int = 128
 
     # JWT 令牌配置
     SECRET_KEY: str
     ALGORITHM: str
     ACCESS_TOKEN_EXPIRE_MINUTES: int
+    # 访客登录后会话令牌的有效期（分钟）
+    GUEST_SESSION_EXPIRE_MINUTES: int = 60
+    # 签名下载链接的有效期（秒）
+    SIGNED_URL_TTL_SECONDS: int = 300
 
     # 文件存储配置
     STORAGE_PATH: str
+    # 存储后端：local（每次上传保存一份独立文件）或 dedup（相同内容只保存一份）
+    STORAGE_BACKEND: str = "local"
+    # 去重存储回收无引用内容的间隔（秒，0 表示关闭）
+    STORAGE_GC_INTERVAL_SECONDS: int = 3600
+    # 未完成的分块上传会话保留时长（小时），过期会话由令牌清理任务回收
+    UPLOAD_SESSION_TTL_HOURS: int = 24
+    # 流式上传预留配额的租约时长（秒）。上传期间自动续约；处理上传的进程退出后，
+    # 遗留的预留在租约到期后由后台清理任务回收
+    QUOTA_RESERVATION_LEASE_SECONDS: int = 600
+
+    # 令牌策略缓存配置
+    # 访客请求使用的令牌策略快照缓存时长（秒，0 表示不缓存）
+    TOKEN_CACHE_TTL_SECONDS: int = 30
+    # 缓存的最大令牌数
+    TOKEN_CACHE_MAX_SIZE: int = 10000
+    # 管理后台令牌列表总数的缓存时长（秒）。创建和删除令牌会立即使其失效，
+    # 按状态筛选时的总数最多滞后这么久
+    TOKEN_COUNT_CACHE_TTL_SECONDS: int = 30
+
+    # 令牌清理任务配置
+    # 检查到期和用尽令牌的间隔（秒，0 表示关闭）
+    TOKEN_SWEEP_INTERVAL_SECONDS: int = 60
+    # 每批处理的最大令牌数
+    TOKEN_SWEEP_BATCH_SIZE: int = 500
+
+    # 文件列表缓存时长（秒）。目录内容变化会立即使缓存失效，
+    # 这里的时长只用于兜底发现原地修改的文件大小
+    FILE_LIST_CACHE_TTL_SECONDS: int = 10
+
+    # 下载卸载配置
+    # 把文件交给前端反向代理发送：x-accel-redirect（nginx）、x-sendfile（Apache、lighttpd），
+    # 留空时由应用自己发送。卸载时令牌的限速按单个连接生效（仅 nginx 支持），
+    # 全局下载带宽上限和压缩变体由代理负责
+    DOWNLOAD_OFFLOAD_MODE: str = ""
+    # x-accel-redirect 模式下映射到 STORAGE_PATH 的 nginx internal location
+    DOWNLOAD_OFFLOAD_PREFIX: str = "/protected-files"
+
+    # 压缩配置
+    # 是否按 Accept-Encoding 发送预先压缩的文件变体
+    COMPRESSION_ENABLED: bool = True
+    # 小于这个大小（字节）的文件不压缩
+    COMPRESSION_MIN_SIZE_BYTES: int = 1024
+    # 大于这个大小（MB）的文件不压缩
+    COMPRESSION_MAX_FILE_MB: int = 1024
+    # 同时在后台生成压缩变体的文件数
+    COMPRESSION_WORKERS: int = 2
+    # 集中保存压缩变体的目录；留空时保存在原文件旁边的 .encoded 子目录中
+    COMPRESSION_VARIANT_DIR: str = ""
+
+    # 带宽配置
+    # 所有下载共享的全局带宽上限（KB/s，0 表示不限制）
+    GLOBAL_DOWNLOAD_BANDWIDTH_LIMIT_KBPS: int = 0
 
     # 日志配置
     LOG_LEVEL: str
+    # 日志格式：text 或 json（每行一个 JSON 对象，包含 request_id 和 token_id）
+    LOG_FORMAT: str = "text"
+    # 除标准错误输出外同时写入的日志文件（留空表示不写文件），按大小轮转
+    LOG_FILE: str = ""
+    # 单个日志文件的最大大小（MB）和保留的旧文件数
+    LOG_FILE_MAX_MB: int = 100
+    LOG_FILE_BACKUP_COUNT: int = 5
+    # 等待后台线程写出的日志的最大条数，队列满时丢弃新的日志
+    LOG_QUEUE_SIZE: int = 10000
+    # 标记了去重的高频日志（如 JWT 解码失败）在这段时间（秒）内只输出一次（0 表示不省略）
+    LOG_DUPLICATE_INTERVAL_SECONDS: int = 60
+
+    # 访问日志配置
+    # 内存队列的最大条目数，队列满时丢弃新的访问日志
+    ACCESS_LOG_QUEUE_SIZE: int = 10000
+    # 单次批量写入的最大条目数
+    ACCESS_LOG_BATCH_SIZE: int = 500
+    # 未写入的访问日志最长等待时间（秒）
+    ACCESS_LOG_FLUSH_INTERVAL_SECONDS: float = 1.0
+
+    # 监控指标配置
+    # 是否提供 Prometheus 格式的 /metrics 端点（还需要设置 METRICS_TOKEN）
+    METRICS_ENABLED: bool = False
+    # 访问 /metrics 需要的 Bearer 令牌；留空时即使启用了监控指标也不开放端点
+    METRICS_TOKEN: str = ""
+    # 按令牌统计传输字节数时最多跟踪的令牌数，超出的令牌合并到 token_id="other"
+    METRICS_MAX_TOKEN_SERIES: int = 1000
+
+    # 请求追踪配置
+    # 是否为每个请求记录各阶段耗时，并添加 Server-Timing 和 X-Request-ID 响应头部
+    TRACE_ENABLED: bool = True
+    # 总耗时超过这个值（毫秒）的请求输出一条 JSON 追踪记录（0 表示全部输出）
+    TRACE_RECORD_THRESHOLD_MS: int = 1000
+
+    # 慢请求采样分析配置（需要同时启用请求追踪）
+    # 是否启用。启用后有请求正在处理时会持续对所有线程的调用栈采样
+    PROFILER_ENABLED: bool = False
+    # 处理时间（到开始发送响应为止）超过这个值（毫秒）的请求保存调用栈样本
+    PROFILER_THRESHOLD_MS: int = 2000
+    # 采样间隔（毫秒）
+    PROFILER_INTERVAL_MS: int = 10
+    # 分析结果的保存目录，以及最多保留的文件数
+    PROFILER_DIR: str = "../profiles"
+    PROFILER_MAX_FILES: int = 100
 
     class Config:
         env_file = ".env"
@@ -0,0 +1,37 @@
+"""
+分页游标工具模块
+
+键集（keyset）分页的游标是上一页最后一条记录的排序键，
+编码为 URL 安全的 base64 JSON，对客户端不透明。
+"""
+import base64
+import json
+from fastapi import HTTPException, status
+
+
+def encode_cursor(key: tuple) -> str:
+    """
+    将排序键编码为游标字符串。
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(key)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, length: int = 2) -> tuple:
+    """
+    解析游标字符串。
+
+    Args:
+        cursor: 客户端传回的游标。
+        length: 排序键的元素个数。
+
+    Raises:
+        HTTPException: 游标格式无效时返回 400。
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        value = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(value, list) or len(value) != length:
+            raise ValueError
+        return tuple(value)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的分页游标")
@@ -0,0 +1,405 @@
+"""
+文件下载响应模块
+
+提供支持 HTTP Range（单区间和多区间）以及条件请求
+（If-None-Match、If-Modified-Since、If-Range）的文件响应。
+
+ASGI 服务器支持 `http.response.pathsend` 或 `http.response.zerocopysend` 扩展时，
+文件内容由服务器通过 sendfile 直接发送，不经过 Python 读取和复制。
+另外提供把文件交给前端反向代理发送的 X-Accel-Redirect / X-Sendfile 响应。
+"""
+import contextlib
+import os
+import stat
+import uuid
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Awaitable, List, Optional, Protocol, Tuple
+from urllib.parse import quote
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+from utils.metrics import TransferMeter
+
+# 每次读取和发送的块大小
+CHUNK_SIZE = 64 * 1024
+# 单个请求允许的最大区间数（合并重叠区间之后），超出时按完整文件响应
+MAX_RANGES = 32
+
+# ASGI 扩展：服务器按路径发送整个文件 / 按文件描述符发送指定区间
+PATHSEND = "http.response.pathsend"
+ZEROCOPYSEND = "http.response.zerocopysend"
+
+# 反向代理卸载模式
+OFFLOAD_X_ACCEL_REDIRECT = "x-accel-redirect"
+OFFLOAD_X_SENDFILE = "x-sendfile"
+OFFLOAD_MODES = (OFFLOAD_X_ACCEL_REDIRECT, OFFLOAD_X_SENDFILE)
+
+
+class Throttle(Protocol):
+    """
+    限速器接口：发送 `amount` 个字节之前调用 `consume`。
+    """
+    def consume(self, amount: int) -> Awaitable[None]: ...
+
+
+def make_etag(stat_result: os.stat_result, content_encoding: Optional[str] = None) -> str:
+    """
+    根据文件大小和纳秒级修改时间生成强 ETag；压缩变体的 ETag 带有编码名。
+
+    只依赖文件元数据，因此在进程重启和多个 worker 之间保持稳定。
+    """
+    suffix = f"-{content_encoding}" if content_encoding else ""
+    return f'"{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}{suffix}"'
+
+
+def content_disposition(filename: str) -> str:
+    """
+    生成以附件形式下载的 `Content-Disposition` 头部，非 ASCII 文件名按 RFC 5987 编码。
+    """
+    quoted_filename = quote(filename)
+    if quoted_filename != filename:
+        return f"attachment; filename*=utf-8''{quoted_filename}"
+    return f'attachment; filename="{filename}"'
+
+
+def offload_response(
+    mode: str,
+    target: str,
+    filename: str,
+    rate_limit: Optional[int] = None,
+    media_type: str = "application/octet-stream",
+) -> Response:
+    """
+    生成把文件交给前端反向代理发送的空响应。
+
+    Args:
+        mode: `x-accel-redirect`（nginx）或 `x-sendfile`（Apache、lighttpd 等）。
+        target: X-Accel-Redirect 的内部 URI，或 X-Sendfile 的文件绝对路径。
+        filename: 下载时显示的文件名。
+        rate_limit: 限速（字节/秒），只有 nginx 支持（`X-Accel-Limit-Rate`）。
+    """
+    headers = {"content-disposition": content_disposition(filename)}
+    if mode == OFFLOAD_X_ACCEL_REDIRECT:
+        headers["x-accel-redirect"] = quote(target)
+        if rate_limit:
+            headers["x-accel-limit-rate"] = str(rate_limit)
+    else:
+        headers["x-sendfile"] = target
+    return Response(media_type=media_type, headers=headers)
+
+
+def _etag_matches(header_value: str, etag: str, weak: bool) -> bool:
+    """
+    判断 If-None-Match / If-Range 中的 ETag 列表是否与当前 ETag 匹配。
+    """
+    if header_value.strip() == "*":
+        return True
+    for candidate in header_value.split(","):
+        candidate = candidate.strip()
+        if weak and candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
+def _parse_http_date(value: str) -> Optional[float]:
+    try:
+        return parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def parse_range_header(value: str, file_size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    解析 `Range` 头部。
+
+    Args:
+        value: Range 头部的值，例如 `bytes=0-99,200-`。
+        file_size: 文件大小。
+
+    Returns:
+        Optional[List[Tuple[int, int]]]: 已排序、合并后的闭区间列表；
+        头部语法无效时返回 None（按规范应忽略该头部），
+        所有区间都无法满足时返回空列表。
+    """
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+
+    ranges = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part:
+            continue
+        start_str, sep, end_str = part.partition("-")
+        start_str, end_str = start_str.strip(), end_str.strip()
+        if not sep or (start_str and not start_str.isdigit()) or (end_str and not end_str.isdigit()):
+            return None
+        if not start_str:
+            # 后缀区间: 最后 N 个字节
+            if not end_str:
+                return None
+            suffix = int(end_str)
+            if suffix == 0:
+                continue
+            ranges.append((max(file_size - suffix, 0), file_size - 1))
+            continue
+        start = int(start_str)
+        if end_str and int(end_str) < start:
+            return None
+        if start >= file_size:
+            continue
+        end = int(end_str) if end_str else file_size - 1
+        ranges.append((start, min(end, file_size - 1)))
+
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class RangeFileResponse(Response):
+    """
+    支持断点续传和条件请求的文件响应。
+
+    - `If-None-Match` / `If-Modified-Since` 命中时返回 304。
+    - 单个区间返回 206 和 `Content-Range`；多个区间返回 `multipart/byteranges`。
+    - `If-Range` 与当前 ETag 或修改时间不一致时，忽略 Range 并返回完整文件。
+    - `allow_ranges=False` 时忽略 Range 头部，并通过 `Accept-Ranges: none` 告知客户端。
+    - 提供 `throttle` 时，每个数据块发送前都会先经过限速器。
+    - 提供 `meter` 时，统计发送的文件数据字节数，发送期间计入进行中的下载。
+    - 提供 `content_encoding` 时，`path` 是原文件的压缩变体，响应带有 `Content-Encoding`。
+    - 服务器支持时使用 pathsend（完整文件且不限速）或 zerocopysend（任意区间）发送文件内容。
+    """
+
+    def __init__(
+        self,
+        path: str,
+        filename: Optional[str] = None,
+        media_type: str = "application/octet-stream",
+        allow_ranges: bool = True,
+        stat_result: Optional[os.stat_result] = None,
+        headers: Optional[dict] = None,
+        throttle: Optional[Throttle] = None,
+        content_encoding: Optional[str] = None,
+        meter: Optional[TransferMeter] = None,
+    ):
+        self.path = path
+        self.throttle = throttle
+        self.meter = meter
+        self.content_encoding = content_encoding
+        self._extensions: dict = {}
+        self.status_code = 200
+        self.media_type = media_type
+        self.background = None
+        self.allow_ranges = allow_ranges
+        self.stat_result = stat_result
+        self.init_headers(headers)
+        self.headers.setdefault("accept-ranges", "bytes" if allow_ranges else "none")
+        if content_encoding is not None:
+            self.headers["content-encoding"] = content_encoding
+        if filename is not None:
+            self.headers.setdefault("content-disposition", content_disposition(filename))
+
+    def _select_ranges(
+        self, request_headers: Headers, etag: str, mtime: float, file_size: int
+    ) -> Optional[List[Tuple[int, int]]]:
+        """
+        决定本次响应要发送的区间；返回 None 表示发送完整文件。
+        """
+        http_range = request_headers.get("range")
+        if not self.allow_ranges or http_range is None:
+            return None
+
+        if_range = request_headers.get("if-range")
+        if if_range is not None:
+            if_range = if_range.strip()
+            if if_range.startswith('"') or if_range.startswith("W/"):
+                # If-Range 要求强比较，弱 ETag 永远不匹配
+                if if_range != etag:
+                    return None
+            else:
+                since = _parse_http_date(if_range)
+                if since is None or int(mtime) != int(since):
+                    return None
+
+        ranges = parse_range_header(http_range, file_size)
+        if ranges is None or len(ranges) > MAX_RANGES:
+            return None
+        return ranges
+
+    def _is_not_modified(self, request_headers: Headers, etag: str, mtime: float) -> bool:
+        if_none_match = request_headers.get("if-none-match")
+        if if_none_match is not None:
+            return _etag_matches(if_none_match, etag, weak=True)
+        if_modified_since = request_headers.get("if-modified-since")
+        if if_modified_since is not None:
+            since = _parse_http_date(if_modified_since)
+            return since is not None and int(mtime) <= int(since)
+        return False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self._extensions = scope.get("extensions") or {}
+        stat_result = self.stat_result
+        if stat_result is None:
+            stat_result = await anyio.to_thread.run_sync(os.stat, self.path)
+        if not stat.S_ISREG(stat_result.st_mode):
+            raise RuntimeError(f"文件 {self.path} 不是普通文件。")
+
+        file_size = stat_result.st_size
+        etag = make_etag(stat_result, self.content_encoding)
+        self.headers.setdefault("etag", etag)
+        self.headers.setdefault("last-modified", formatdate(stat_result.st_mtime, usegmt=True))
+
+        request_headers = Headers(scope=scope)
+        if self._is_not_modified(request_headers, etag, stat_result.st_mtime):
+            self.status_code = 304
+            for header in ("content-type", "content-disposition", "content-length"):
+                if header in self.headers:
+                    del self.headers[header]
+            await send({"type": "http.response.start", "status": 304, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        ranges = self._select_ranges(request_headers, etag, stat_result.st_mtime, file_size)
+        if ranges is not None and not ranges:
+            self.status_code = 416
+            self.headers["content-range"] = f"bytes */{file_size}"
+            self.headers["content-length"] = "0"
+            await send({"type": "http.response.start", "status": 416, "headers": self.raw_headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        meter = self.meter if self.meter is not None else contextlib.nullcontext()
+        with meter:
+            async with anyio.create_task_group() as task_group:
+                async def stream_file():
+                    await self._send_file(send, ranges, file_size)
+                    task_group.cancel_scope.cancel()
+
+                async def listen_for_disconnect():
+                    while True:
+                        message = await receive()
+                        if message["type"] == "http.disconnect":
+                            task_group.cancel_scope.cancel()
+                            break
+
+                task_group.start_soon(stream_file)
+                task_group.start_soon(listen_for_disconnect)
+
+    async def _send_file(
+        self, send: Send, ranges: Optional[List[Tuple[int, int]]], file_size: int
+    ):
+        if ranges is None and self.throttle is None and PATHSEND in self._extensions:
+            # 由服务器直接发送整个文件
+            self.status_code = 200
+            self.headers["content-length"] = str(file_size)
+            await send({"type": "http.response.start", "status": 200, "headers": self.raw_headers})
+            await send({"type": PATHSEND, "path": os.path.abspath(self.path)})
+            if self.meter is not None:
+                self.meter.add(file_size)
+            return
+
+        async with await anyio.open_file(self.path, "rb") as file:
+            if ranges is None:
+                self.status_code = 200
+                self.headers["content-length"] = str(file_size)
+                await send({"type": "http.response.start", "status": 200, "headers": self.raw_headers})
+                await self._send_segment(send, file, 0, file_size - 1, last=True)
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                self.status_code = 206
+                self.headers["content-range"] = f"bytes {start}-{end}/{file_size}"
+                self.headers["content-length"] = str(end - start + 1)
+                await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+                await self._send_segment(send, file, start, end, last=True)
+            else:
+                await self._send_multipart(send, file, ranges, file_size)
+
+    async def _send_multipart(
+        self, send: Send, file, ranges: List[Tuple[int, int]], file_size: int
+    ):
+        boundary = uuid.uuid4().hex
+        content_type = self.media_type
+        part_headers = [
+            (
+                f"--{boundary}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{file_size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        content_length = (
+            sum(len(h) for h in part_headers)
+            + sum(end - start + 1 for start, end in ranges)
+            + 2 * (len(ranges) - 1)  # 各部分之间的 CRLF
+            + len(closing)
+        )
+        self.status_code = 206
+        self.headers["content-type"] = f"multipart/byteranges; boundary={boundary}"
+        self.headers["content-length"] = str(content_length)
+        await send({"type": "http.response.start", "status": 206, "headers": self.raw_headers})
+        for index, ((start, end), header) in enumerate(zip(ranges, part_headers)):
+            prefix = header if index == 0 else b"\r\n" + header
+            await send({"type": "http.response.body", "body": prefix, "more_body": True})
+            await self._send_segment(send, file, start, end, last=False)
+        await send({"type": "http.response.body", "body": closing, "more_body": False})
+
+    async def _send_segment(self, send: Send, file, start: int, end: int, last: bool):
+        """
+        发送文件中 [start, end] 闭区间的内容。
+        """
+        if ZEROCOPYSEND in self._extensions:
+            await self._send_segment_zero_copy(send, file, start, end, last)
+            return
+
+        await file.seek(start)
+        remaining = end - start + 1
+        finished = False
+        while remaining > 0:
+            chunk = await file.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if self.throttle is not None:
+                await self.throttle.consume(len(chunk))
+            remaining -= len(chunk)
+            finished = last and remaining == 0
+            await send({"type": "http.response.body", "body": chunk, "more_body": not finished})
+            if self.meter is not None:
+                self.meter.add(len(chunk))
+        if last and not finished:
+            # 空文件或文件在发送过程中被截断时，也要正确结束响应
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _send_segment_zero_copy(self, send: Send, file, start: int, end: int, last: bool):
+        """
+        通过 zerocopysend 扩展发送区间，由服务器从文件描述符直接发送。
+        限速时按块发送，每块之前先经过限速器。
+        """
+        position = start
+        remaining = end - start + 1
+        if remaining <= 0:
+            if last:
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        while remaining > 0:
+            count = remaining if self.throttle is None else min(CHUNK_SIZE, remaining)
+            if self.throttle is not None:
+                await self.throttle.consume(count)
+            remaining -= count
+            await send({
+                "type": ZEROCOPYSEND,
+                "file": file.wrapped,
+                "offset": position,
+                "count": count,
+                "more_body": not (last and remaining == 0),
+            })
+            position += count
+            if self.meter is not None:
+                self.meter.add(count)
@@ -2,10 +2,193 @@
 日志配置模块
 
 配置全局日志记录器。
+
+记录日志的线程只把日志记录放入内存队列，格式化和写入（标准错误输出，以及配置了
+`LOG_FILE` 时按大小轮转的日志文件）都在一个后台线程中完成，写日志不会阻塞事件循环。
+因此请使用 `log.info("... %s", value)` 的形式传递参数，而不是 f-string：
+参数只在日志真正输出时才被格式化，低于日志级别的日志几乎没有开销。
+
+- `LOG_FORMAT=json` 时每条日志输出为一行 JSON，包含当前请求的 `request_id` 和 `token_id`。
+- 以 `extra={"dedup": True}` 标记的日志（相同的日志器、级别和消息模板）在
+  `LOG_DUPLICATE_INTERVAL_SECONDS` 秒内只输出一次，之后输出时附带被省略的次数，
+  避免 JWT 解码失败之类由客户端触发的日志在被攻击或客户端异常时刷屏。
+  未标记的日志，以及带有异常信息的 ERROR 日志，总是全部输出。
+- 队列已满时丢弃新的日志并计数，不会阻塞调用方。
 """
+import atexit
+import json
 import logging
+import queue
 import sys
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Callable, Dict, Optional, Tuple
 from .config import settings
+from .metrics import registry
+
+TEXT_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 重复日志的记录数超过这个值时，清理已经过了抑制时间的条目
+DUPLICATE_KEYS_PRUNE_SIZE = 1024
+
+# 返回当前请求的 (request_id, token_id)，由 `utils.tracing` 注册；请求之外返回 None
+_context_provider: Optional[Callable[[], Optional[Tuple[str, Optional[int]]]]] = None
+
+
+def set_context_provider(provider: Callable[[], Optional[Tuple[str, Optional[int]]]]):
+    """
+    注册日志上下文的来源。`utils.tracing` 依赖本模块，由它在导入时注册，避免循环导入。
+    """
+    global _context_provider
+    _context_provider = provider
+
+
+class JsonMessage:
+    """
+    结构化的日志消息::
+
+        log.info(JsonMessage({"event": "...", "duration_ms": 12}))
+
+    文本格式下输出为一行 JSON（在后台线程中序列化），JSON 格式下字段直接合并到日志记录中。
+    """
+    __slots__ = ("fields",)
+
+    def __init__(self, fields: dict):
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return json.dumps(self.fields, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """
+    文本格式。附带被省略的重复日志次数。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = super().format(record)
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            text += f" (此前 {settings.LOG_DUPLICATE_INTERVAL_SECONDS} 秒内省略了 {suppressed} 条相同的日志)"
+        return text
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    每条日志输出为一行 JSON。
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "timestamp": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+        }
+        if isinstance(record.msg, JsonMessage) and not record.args:
+            data.update(record.msg.fields)
+        else:
+            data["message"] = record.getMessage()
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            data.setdefault("request_id", request_id)
+            data.setdefault("token_id", getattr(record, "token_id", None))
+        suppressed = getattr(record, "suppressed", 0)
+        if suppressed:
+            data["suppressed"] = suppressed
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        if record.stack_info:
+            data["stack"] = self.formatStack(record.stack_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class DuplicateFilter(logging.Filter):
+    """
+    对标记了 `dedup` 的日志按 (日志器, 级别, 消息模板) 去重：
+    每个 `interval` 秒的窗口内只放行第一条，窗口结束后的第一条附带被省略的次数。
+
+    同一个模板的参数不同也视为重复，因此只应标记那些由客户端触发、内容相近的高频日志；
+    带有异常信息的 ERROR 日志即使被标记也不会省略。
+    """
+
+    def __init__(self, interval: float):
+        super().__init__()
+        self.interval = interval
+        # {键: [放行的时间, 省略的次数]}
+        self._seen: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+        self.suppressed_total = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.interval <= 0 or not getattr(record, "dedup", False):
+            return True
+        if record.exc_info and record.levelno >= logging.ERROR:
+            return True
+        key = (record.name, record.levelno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._seen.get(key)
+            if entry is not None and now - entry[0] < self.interval:
+                entry[1] += 1
+                self.suppressed_total += 1
+                return False
+            if entry is not None and entry[1]:
+                record.suppressed = entry[1]
+            if entry is None and len(self._seen) >= DUPLICATE_KEYS_PRUNE_SIZE:
+                self._prune(now)
+            self._seen[key] = [now, 0]
+        return True
+
+    def _prune(self, now: float):
+        # 过期条目中省略的次数不再报告，避免同一个模板长期占用内存
+        for key in [k for k, v in self._seen.items() if now - v[0] >= self.interval]:
+            del self._seen[key]
+
+
+class AsyncQueueHandler(QueueHandler):
+    """
+    只在调用方线程中记录请求上下文并入队，消息的格式化留给后台线程。
+    """
+
+    def __init__(self, log_queue: queue.Queue, duplicate_interval: float):
+        super().__init__(log_queue)
+        self.duplicates = DuplicateFilter(duplicate_interval)
+        self.addFilter(self.duplicates)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # 请求上下文保存在 contextvar 中，后台线程读取不到，需要在这里取出
+        if _context_provider is not None:
+            context = _context_provider()
+            if context is not None:
+                record.request_id, record.token_id = context
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def _output_handlers() -> list:
+    formatter = JsonFormatter() if settings.LOG_FORMAT.lower() == "json" else TextFormatter(TEXT_FORMAT, DATE_FORMAT)
+    # 创建一个流处理器，将日志输出到标准错误
+    handlers = [logging.StreamHandler(sys.stderr)]
+    if settings.LOG_FILE:
+        handlers.append(RotatingFileHandler(
+            settings.LOG_FILE,
+            maxBytes=settings.LOG_FILE_MAX_MB * 1024 * 1024,
+            backupCount=settings.LOG_FILE_BACKUP_COUNT,
+            encoding="utf-8",
+        ))
+    for handler in handlers:
+        handler.setFormatter(formatter)
+    return handlers
+
 
 def setup_logger():
     """
@@ -22,15 +205,13 @@ def setup_logger():
     log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
     logger.setLevel(log_level)
 
-    # 创建一个流处理器，将日志输出到标准错误
-    handler = logging.StreamHandler(sys.stderr)
-    
-    # 定义日志格式
-    formatter = logging.Formatter(
-        "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-        datefmt="%Y-%m-%d %H:%M:%S"
+    handler = AsyncQueueHandler(
+        queue.Queue(maxsize=settings.LOG_QUEUE_SIZE), settings.LOG_DUPLICATE_INTERVAL_SECONDS
     )
-    handler.setFormatter(formatter)
+    listener = QueueListener(handler.queue, *_output_handlers(), respect_handler_level=True)
+    listener.start()
+    # 进程退出前写出队列中剩余的日志
+    atexit.register(listener.stop)
 
     # 将处理器添加到记录器
     logger.addHandler(handler)
@@ -39,3 +220,13 @@ def setup_logger():
 
 # 创建一个全局可用的日志实例
 log = setup_logger()
+
+_queue_handler = next(h for h in log.handlers if isinstance(h, AsyncQueueHandler))
+registry.callback(
+    "securedrop_log_records_dropped_total", "因日志队列已满而丢弃的日志条数。", "counter",
+    lambda: _queue_handler.dropped,
+)
+registry.callback(
+    "securedrop_log_records_suppressed_total", "作为重复日志被省略的条数。", "counter",
+    lambda: _queue_handler.duplicates.suppressed_total,
+)
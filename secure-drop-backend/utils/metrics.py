@@ -0,0 +1,403 @@
+"""
+运行指标模块
+
+提供计数器、仪表和直方图三种指标，并以 Prometheus 文本格式导出（`GET /metrics`）。
+
+指标更新位于请求和传输的热路径上，因此实现上尽量便宜：
+- 带标签的子指标在第一次使用时创建并缓存，调用方可以预先取出子指标，
+  之后每次更新只是一次属性加法（直方图再加一次二分查找）。
+- 更新不加锁。绝大多数更新发生在事件循环线程中；线程池中的并发更新
+  在极少数情况下可能丢失一次计数，对监控数据可以接受。
+- 缓存命中率、写队列等已有的统计数据不在热路径上重复计数，
+  而是注册为回调，在抓取时读取。
+"""
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from utils.config import settings
+
+# 标签数量超出上限时，新的标签组合合并到这个值下
+OVERFLOW_LABEL = "other"
+
+# HTTP 请求耗时的分桶（秒）。下载请求的耗时包括整个文件的发送时间
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+# 数据库查询耗时的分桶（秒）
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Value:
+    """
+    计数器和仪表的子指标。
+    """
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount: float = 1):
+        self.value += amount
+
+    def dec(self, amount: float = 1):
+        self.value -= amount
+
+    def set(self, value: float):
+        self.value = value
+
+
+class _HistogramValue:
+    """
+    直方图的子指标。各分桶分别计数，导出时再累加成 Prometheus 要求的累计值。
+    """
+    __slots__ = ("bounds", "counts", "sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        # 最后一个元素对应 +Inf
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+
+class _Metric:
+    """
+    一个指标族：名称、说明、标签名和按标签值缓存的子指标。
+    """
+    type_name = ""
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), max_series: int = 0
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # 标签组合数上限（0 表示不限制），用于令牌 ID 这类无界的标签
+        self.max_series = max_series
+        self._children: Dict[Tuple[str, ...], object] = {}
+        if not self.labelnames:
+            self._default = self._children[()] = self._new_child()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values) -> object:
+        """
+        获取一组标签值对应的子指标（不存在时创建）。超出 `max_series` 时，
+        第一个标签取 `other`，其余标签保持不变。
+        """
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            if self.max_series and len(self._children) >= self.max_series:
+                key = (OVERFLOW_LABEL,) + key[1:]
+                child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, child in list(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+    def _render_child(self, key: Tuple[str, ...], child) -> List[str]:
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(child.value)}"]
+
+
+class Counter(_Metric):
+    type_name = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1):
+        self._default.value += amount
+
+
+class Gauge(Counter):
+    type_name = "gauge"
+
+    def dec(self, amount: float = 1):
+        self._default.value -= amount
+
+    def set(self, value: float):
+        self._default.value = value
+
+
+class Histogram(_Metric):
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = HTTP_BUCKETS,
+        max_series: int = 0,
+    ):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, max_series)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def _render_child(self, key: Tuple[str, ...], child: _HistogramValue) -> List[str]:
+        lines = []
+        cumulative = 0
+        counts = list(child.counts)
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else _format_value(bound)
+            le_label = 'le="' + le + '"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le_label)} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(child.sum)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+# 回调返回的样本：(标签值, 数值)
+Sample = Tuple[Tuple[str, ...], float]
+
+
+class _CallbackMetric:
+    """
+    抓取时才读取数值的指标，用于导出其他模块已经维护的统计数据。
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        type_name: str,
+        labelnames: Sequence[str],
+        callback: Callable[[], Iterable[Sample]],
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.type_name = type_name
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_name}"]
+        for key, value in self.callback():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    所有指标的注册表。
+    """
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._caches: Dict[str, object] = {}
+        self.callback(
+            "securedrop_cache_hits_total", "进程内缓存的命中次数。", "counter",
+            lambda: self._cache_samples("hits"), labelnames=("cache",),
+        )
+        self.callback(
+            "securedrop_cache_misses_total", "进程内缓存的未命中次数。", "counter",
+            lambda: self._cache_samples("misses"), labelnames=("cache",),
+        )
+        self.callback(
+            "securedrop_cache_hit_ratio", "进程内缓存自启动以来的命中率。", "gauge",
+            self._cache_ratios, labelnames=("cache",),
+        )
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已存在: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Counter:
+        return self._register(Counter(name, documentation, labelnames, **kwargs))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames, **kwargs))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (), **kwargs) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, **kwargs))
+
+    def callback(
+        self,
+        name: str,
+        documentation: str,
+        type_name: str,
+        callback: Callable[[], Iterable[Sample]],
+        labelnames: Sequence[str] = (),
+    ):
+        """
+        注册一个抓取时通过回调读取数值的指标。不带标签时回调直接返回数值。
+        """
+        if not labelnames:
+            plain = callback
+            callback = lambda: [((), plain())]  # noqa: E731
+        self._register(_CallbackMetric(name, documentation, type_name, labelnames, callback))
+
+    def register_cache(self, name: str, cache):
+        """
+        导出一个 `TTLCache` 的命中、未命中次数和命中率。
+        """
+        self._caches[name] = cache
+
+    def _cache_samples(self, attribute: str) -> List[Sample]:
+        return [((name,), getattr(cache, attribute)) for name, cache in self._caches.items()]
+
+    def _cache_ratios(self) -> List[Sample]:
+        samples = []
+        for name, cache in self._caches.items():
+            total = cache.hits + cache.misses
+            samples.append(((name,), cache.hits / total if total else 0.0))
+        return samples
+
+    def render(self) -> str:
+        """
+        以 Prometheus 文本格式导出所有指标。
+        """
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+# 创建一个全局实例
+registry = MetricsRegistry()
+
+
+# --- HTTP 请求 ---
+http_requests = registry.counter(
+    "securedrop_http_requests_total", "HTTP 请求数。", ("method", "route", "status"),
+)
+http_request_duration = registry.histogram(
+    "securedrop_http_request_duration_seconds",
+    "HTTP 请求从开始到响应发送完毕的耗时（秒）。",
+    ("method", "route"),
+    buckets=HTTP_BUCKETS,
+)
+http_requests_in_flight = registry.gauge(
+    "securedrop_http_requests_in_flight", "正在处理的 HTTP 请求数。",
+)
+
+# --- 文件传输 ---
+transfer_bytes = registry.counter(
+    "securedrop_transfer_bytes_total", "上传和下载的文件数据总字节数。", ("direction",),
+)
+token_transfer_bytes = registry.counter(
+    "securedrop_token_transfer_bytes_total",
+    f"每个令牌上传和下载的文件数据字节数（令牌数超过上限时合并到 token_id=\"{OVERFLOW_LABEL}\"）。",
+    ("token_id", "direction"),
+    max_series=settings.METRICS_MAX_TOKEN_SERIES * 2,
+)
+transfers_in_flight = registry.gauge(
+    "securedrop_transfers_in_flight", "正在进行的上传和下载数。", ("direction",),
+)
+
+# --- 认证 ---
+jwt_decode_failures = registry.counter(
+    "securedrop_jwt_decode_failures_total", "JWT 解码失败的次数。", ("reason",),
+)
+
+# --- 数据库 ---
+db_query_duration = registry.histogram(
+    "securedrop_db_query_duration_seconds",
+    "数据库语句的执行耗时（秒），_count 即执行次数。",
+    ("engine", "statement"),
+    buckets=DB_BUCKETS,
+)
+
+
+class TransferMeter:
+    """
+    统计一次上传或下载传输的字节数，并在传输期间计入进行中的传输数。
+
+    创建时取出对应的子指标，之后每个数据块只需要两次加法::
+
+        with TransferMeter(token.id, "download") as meter:
+            meter.add(len(chunk))
+    """
+    __slots__ = ("_total", "_token", "_in_flight")
+
+    def __init__(self, token_id: int, direction: str):
+        self._total = transfer_bytes.labels(direction)
+        self._token = token_transfer_bytes.labels(token_id, direction)
+        self._in_flight = transfers_in_flight.labels(direction)
+
+    def add(self, amount: int):
+        self._total.value += amount
+        self._token.value += amount
+
+    def __enter__(self) -> "TransferMeter":
+        self._in_flight.value += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._in_flight.value -= 1
+
+
+# 未匹配到路由的请求（404、OPTIONS 预检等）统一使用这个标签，避免任意路径造成标签膨胀
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class MetricsMiddleware:
+    """
+    记录每个请求的耗时和状态码的 ASGI 中间件。
+
+    路由标签使用路由模板（如 `/api/guest/download/{filename}`）而不是实际路径，
+    耗时统计到响应的最后一块数据发送完毕为止。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = 500
+        in_flight = http_requests_in_flight._default
+        in_flight.value += 1
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.value -= 1
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or UNMATCHED_ROUTE
+            method = scope["method"]
+            http_request_duration.labels(method, route_path).observe(time.perf_counter() - start)
+            http_requests.labels(method, route_path, status_code).inc()
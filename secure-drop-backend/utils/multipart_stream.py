@@ -0,0 +1,199 @@
+"""
+流式 multipart 解析模块
+
+增量解析 multipart/form-data 请求体，按块产出目标文件字段的数据，
+而不是像 `UploadFile` 那样先把整个请求体落盘到临时文件。
+"""
+import os
+from typing import AsyncIterator, List, Optional, Tuple
+from fastapi import HTTPException, status
+from starlette.datastructures import Headers
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+    from python_multipart.exceptions import MultipartParseError
+except ModuleNotFoundError:  # 旧版本的包名
+    from multipart.multipart import MultipartParser, parse_options_header
+    from multipart.exceptions import MultipartParseError
+
+# 解析器事件类型
+_PART_START = "start"
+_PART_DATA = "data"
+_PART_END = "end"
+
+
+def sanitize_filename(raw_filename: str) -> str:
+    """
+    取客户端提交的文件名中的最后一段，防止路径造成目录遍历。
+
+    以点开头的名称保留给存储的内部文件和目录（暂存、去重对象、压缩变体等），
+    也不会出现在文件列表中，因此一律拒绝。
+
+    Raises:
+        HTTPException: 文件名为空或以点开头时返回 400。
+    """
+    filename = os.path.basename(raw_filename.replace("\\", "/"))
+    if not filename:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="文件名不能为空。")
+    if filename.startswith("."):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="文件名不能以 '.' 开头。")
+    return filename
+
+
+class MultipartFileStream:
+    """
+    从请求体流中读取单个文件字段。
+
+    用法::
+
+        upload = await MultipartFileStream(request.headers, request.stream()).open()
+        async for chunk in upload:
+            ...
+
+    `open()` 只读取到目标文件字段的头部为止，此时即可得到文件名；
+    文件内容在迭代时才继续从网络读取。
+    """
+
+    def __init__(
+        self,
+        headers: Headers,
+        stream: AsyncIterator[bytes],
+        field_name: str = "file",
+    ):
+        self.field_name = field_name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._stream = stream
+        self._events: List[Tuple[str, Optional[bytes]]] = []
+        self._event_iter = None
+
+        # 当前部分的头部状态
+        self._header_field = b""
+        self._header_value = b""
+        self._part_headers: dict = {}
+        self._in_target = False
+        self._target_seen = False
+
+        content_type, params = parse_options_header(headers.get("content-type"))
+        if content_type != b"multipart/form-data" or b"boundary" not in params:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="请求必须是包含 boundary 的 multipart/form-data。"
+            )
+        self._parser = MultipartParser(params[b"boundary"], {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    # ---------- 解析器回调（同步，只记录事件） ----------
+
+    def _on_part_begin(self):
+        self._part_headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._part_headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        if self._target_seen:
+            return
+        _, options = parse_options_header(self._part_headers.get(b"content-disposition"))
+        name = options.get(b"name", b"").decode("utf-8", errors="replace")
+        if name != self.field_name or b"filename" not in options:
+            return
+        # 原样记录，在 open() 中检查（解析器回调中不能抛出异常）
+        self.filename = options[b"filename"].decode("utf-8", errors="replace")
+        content_type = self._part_headers.get(b"content-type")
+        self.content_type = content_type.decode("latin-1") if content_type else None
+        self._in_target = True
+        self._target_seen = True
+        self._events.append((_PART_START, None))
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        if self._in_target:
+            self._events.append((_PART_DATA, data[start:end]))
+
+    def _on_part_end(self):
+        if self._in_target:
+            self._in_target = False
+            self._events.append((_PART_END, None))
+
+    # ---------- 异步读取 ----------
+
+    async def _iter_events(self) -> AsyncIterator[Tuple[str, Optional[bytes]]]:
+        """
+        从网络读取请求体并驱动解析器，逐个产出解析事件。
+        """
+        try:
+            async for chunk in self._stream:
+                if chunk:
+                    self._parser.write(chunk)
+                else:
+                    self._parser.finalize()
+                events, self._events = self._events, []
+                for event in events:
+                    yield event
+        except MultipartParseError as e:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"multipart 请求体格式错误: {e}"
+            )
+
+    async def open(self) -> "MultipartFileStream":
+        """
+        读取请求体直到目标文件字段开始。
+
+        Returns:
+            MultipartFileStream: 自身，此时 `filename` 已可用。
+
+        Raises:
+            HTTPException: 请求中没有目标文件字段时返回 400。
+        """
+        self._event_iter = self._iter_events()
+        async for kind, _ in self._event_iter:
+            if kind == _PART_START:
+                self.filename = sanitize_filename(self.filename)
+                return self
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"请求中缺少文件字段 '{self.field_name}'。"
+        )
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        """
+        按网络到达的分块产出文件内容。
+
+        Raises:
+            HTTPException: 请求体在文件字段结束之前中断时返回 400，
+                调用方据此丢弃已写入的部分数据。
+        """
+        if self._event_iter is None:
+            raise RuntimeError("必须先调用 open()。")
+        completed = False
+        async for kind, data in self._event_iter:
+            if kind == _PART_DATA:
+                if data:
+                    yield data
+            elif kind == _PART_END:
+                completed = True
+                break
+        if not completed:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="请求体不完整：文件内容在结束边界之前中断。"
+            )
+        # 消费剩余的请求体（通常只剩结束边界），其他字段被忽略
+        async for _ in self._event_iter:
+            pass
@@ -0,0 +1,174 @@
+"""
+慢请求采样分析模块
+
+默认关闭（`PROFILER_ENABLED`）。启用后，只要有请求正在处理，一个后台线程就按
+`PROFILER_INTERVAL_MS` 的间隔对所有线程的调用栈采样，样本保存在一个环形缓冲区中；
+没有请求时采样线程休眠，不产生开销。
+
+请求的处理时间（到开始发送响应为止）超过 `PROFILER_THRESHOLD_MS` 时，
+取出该请求处理期间的样本，按调用栈聚合后写入 `PROFILER_DIR` 下的一个 JSON 文件，
+目录中最多保留 `PROFILER_MAX_FILES` 个文件，超出时删除最旧的。
+
+异步请求共享事件循环线程，样本无法精确归属到单个请求，因此文件中包含的是
+慢请求处理期间整个进程各线程的调用栈，正好也能看出是否有其他请求阻塞了事件循环。
+`stacks` 中每一项的 `stack` 使用 folded 格式（以 `;` 分隔，从外到内），
+可以直接交给 flamegraph.pl 或 speedscope 生成火焰图。
+"""
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter, deque
+from typing import Deque, List, Optional, Tuple
+from utils.config import settings
+from utils.logger import log
+
+# 单个调用栈最多保留的帧数（从最内层算起）
+MAX_STACK_DEPTH = 64
+# 环形缓冲区保留的采样时长（秒），处理时间更长的请求只保留最近这段时间的样本
+BUFFER_SECONDS = 60
+
+# 最内层帧是这些函数时，线程处于空闲等待状态，不记录
+IDLE_FRAMES = frozenset({
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+})
+
+# 调用栈中的一帧：(文件名, 函数名, 行号)
+Frame = Tuple[str, str, int]
+
+
+class SlowRequestProfiler:
+    """
+    只为慢请求保存调用栈样本的采样分析器。
+    """
+
+    def __init__(self, enabled: bool, threshold_ms: float, interval_ms: float, directory: str, max_files: int):
+        self.enabled = enabled
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.directory = os.path.abspath(directory)
+        self.max_files = max_files
+        # 正在处理的请求数，只在事件循环线程中修改
+        self._active = 0
+        # (采样时间, [(线程名, 调用栈)])，只在采样线程中访问
+        self._samples: Deque[Tuple[float, List[Tuple[str, Tuple[Frame, ...]]]]] = deque(
+            maxlen=max(int(BUFFER_SECONDS / max(self.interval, 0.001)), 1)
+        )
+        self._pending: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def request_started(self) -> bool:
+        """
+        登记一个开始处理的请求。返回 False 表示未启用，不需要调用 `request_finished`。
+        """
+        if not self.enabled:
+            return False
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="slow-request-profiler", daemon=True)
+            self._thread.start()
+        self._active += 1
+        self._wake.set()
+        return True
+
+    def request_finished(self, record: dict, start: float, end: float):
+        """
+        登记一个处理完毕的请求；处理时间超过阈值时排队保存 [start, end] 期间的样本。
+
+        Args:
+            record: 请求的追踪记录，原样写入分析文件。
+            start: 请求开始的 `time.perf_counter()` 时间。
+            end: 开始发送响应（或请求结束）的时间。
+        """
+        self._active -= 1
+        if end - start >= self.threshold:
+            self._pending.put((record, start, end))
+            self._wake.set()
+
+    def _run(self):
+        own_ident = threading.get_ident()
+        while True:
+            self._wake.clear()
+            if self._active <= 0 and self._pending.empty():
+                self._wake.wait()
+                continue
+            if self._active > 0:
+                self._sample(own_ident)
+            while not self._pending.empty():
+                record, start, end = self._pending.get()
+                try:
+                    self._dump(record, start, end)
+                except Exception as e:
+                    log.error("保存慢请求分析结果失败: %s", e)
+            time.sleep(self.interval)
+
+    def _sample(self, own_ident: int):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        for ident, frame in sys._current_frames().items():
+            if ident == own_ident:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                stack.append((frame.f_code.co_filename, frame.f_code.co_name, frame.f_lineno))
+                frame = frame.f_back
+            stack.reverse()
+            stacks.append((names.get(ident, str(ident)), tuple(stack)))
+        self._samples.append((time.perf_counter(), stacks))
+
+    def _dump(self, record: dict, start: float, end: float):
+        folded: Counter = Counter()
+        ticks = 0
+        for timestamp, stacks in self._samples:
+            if timestamp < start or timestamp > end:
+                continue
+            ticks += 1
+            for thread_name, stack in stacks:
+                frames = ";".join(
+                    f"{name} ({os.path.basename(filename)}:{lineno})" for filename, name, lineno in stack
+                )
+                folded[f"{thread_name};{frames}"] += 1
+
+        profile = dict(record)
+        profile.update({
+            "interval_ms": self.interval * 1000,
+            "samples": ticks,
+            # 环形缓冲区中最早的样本晚于请求开始时间，说明较早的样本已被覆盖
+            "truncated": bool(self._samples) and self._samples[0][0] > start,
+            "stacks": [{"stack": stack, "count": count} for stack, count in folded.most_common()],
+        })
+        os.makedirs(self.directory, exist_ok=True)
+        filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{record['request_id']}.json"
+        path = os.path.join(self.directory, filename)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(profile, f, ensure_ascii=False)
+        log.info("慢请求分析结果已保存: %s (处理耗时 %s ms)", path, record['app_ms'])
+        self._rotate()
+
+    def _rotate(self):
+        with os.scandir(self.directory) as it:
+            files = [entry for entry in it if entry.is_file() and entry.name.endswith(".json")]
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime_ns)
+        for entry in files[:len(files) - self.max_files]:
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+
+# 创建一个全局实例
+slow_request_profiler = SlowRequestProfiler(
+    enabled=settings.PROFILER_ENABLED,
+    threshold_ms=settings.PROFILER_THRESHOLD_MS,
+    interval_ms=settings.PROFILER_INTERVAL_MS,
+    directory=settings.PROFILER_DIR,
+    max_files=settings.PROFILER_MAX_FILES,
+)
@@ -0,0 +1,86 @@
+"""
+限速工具模块
+
+提供适用于 asyncio 的令牌桶实现，用于带宽整形。
+"""
+import asyncio
+import time
+from typing import List, Optional
+
+# 令牌桶容量（允许的突发量）对应的秒数
+BURST_SECONDS = 0.5
+
+
+class TokenBucket:
+    """
+    基于虚拟时间的令牌桶。
+
+    `consume` 会立即从桶中预扣所需的字节数，桶内余额可以变为负数（欠账），
+    调用方随后精确地睡眠到欠账还清为止。多个协程共享同一个桶时，
+    后来者的欠账叠加在前者之上，因此总吞吐量严格受限于 `rate`，
+    并且不需要锁、也不会忙等。由于欠账被精确记录，
+    睡眠精度的误差不会累积，在高吞吐量下依然准确。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: 速率（字节/秒）。
+            capacity: 桶容量（字节），默认为 `rate * BURST_SECONDS`。
+        """
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity is not None else self.rate * BURST_SECONDS
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def set_rate(self, rate: float):
+        """
+        调整速率（例如管理员修改了令牌策略），已有的欠账保持不变。
+        """
+        self._refill()
+        self.rate = float(rate)
+        self.capacity = self.rate * BURST_SECONDS
+        self._tokens = min(self._tokens, self.capacity)
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self, amount: int) -> float:
+        """
+        预扣 `amount` 个字节的配额。
+
+        Returns:
+            float: 调用方发送这些数据前需要等待的秒数。
+        """
+        self._refill()
+        self._tokens -= amount
+        return -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+    def refund(self, amount: int):
+        """
+        归还预扣但最终没有使用的配额。
+        """
+        self._tokens = min(self.capacity, self._tokens + amount)
+
+    async def consume(self, amount: int):
+        """
+        消耗 `amount` 个字节的配额，必要时异步等待。
+        """
+        await consume_all([self], amount)
+
+
+async def consume_all(buckets: List[TokenBucket], amount: int):
+    """
+    同时从多个令牌桶中消耗配额，等待时间取各桶所需等待时间的最大值。
+    """
+    delay = max(bucket.reserve(amount) for bucket in buckets)
+    if delay > 0:
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            # 连接被取消时数据并未发送，归还预扣的配额
+            for bucket in buckets:
+                bucket.refund(amount)
+            raise
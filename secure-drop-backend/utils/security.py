@@ -5,10 +5,12 @@
 """
 from datetime import datetime, timedelta
 from typing import Optional
-from jose import JWTError, jwt
+from jose import ExpiredSignatureError, JWTError, jwt
 from passlib.context import CryptContext
 from .config import settings
 from .logger import log
+from .metrics import jwt_decode_failures
+from .tracing import PHASE_JWT, span
 
 # 创建一个 CryptContext 实例，用于密码哈希
 # "bcrypt" 是推荐的算法
@@ -71,8 +73,10 @@ def decode_access_token(token: str) -> Optional[dict]:
         Optional[dict]: 如果令牌有效，则返回 payload；否则返回 None。
     """
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        with span(PHASE_JWT):
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
         return payload
     except JWTError as e:
-        log.warning(f"JWT 解码失败: {e}")
+        jwt_decode_failures.labels("expired" if isinstance(e, ExpiredSignatureError) else "invalid").inc()
+        log.warning("JWT 解码失败: %s", e, extra={"dedup": True})
         return None
@@ -0,0 +1,76 @@
+"""
+前端静态文件模块
+
+在 Starlette 的 `StaticFiles` 基础上增加按 `Accept-Encoding` 发送预压缩变体
+和可配置的 `Cache-Control` 头部。
+"""
+import os
+from mimetypes import guess_type
+from typing import Optional
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.staticfiles import PathLike, StaticFiles
+from starlette.types import Receive, Scope, Send
+from utils.compression import variant_cache
+from utils.file_response import RangeFileResponse
+
+# 文件名带内容哈希的构建产物永远不会变化，可以永久缓存
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 入口文件每次使用前都要向服务器确认是否有新版本
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+
+class NegotiatedFileResponse(RangeFileResponse):
+    """
+    发送前按 `Accept-Encoding` 选择压缩变体的文件响应。
+
+    `StaticFiles.file_response` 是同步方法，查找变体需要读取文件信息，
+    推迟到发送响应时进行，系统调用在线程中执行。
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        accept_encoding = Headers(scope=scope).get("accept-encoding")
+        variant = await variant_cache.lookup(self.path, self.stat_result, accept_encoding)
+        if variant is not None:
+            self.path, self.content_encoding, self.stat_result = variant.path, variant.encoding, variant.stat_result
+            self.allow_ranges = False
+            self.headers["accept-ranges"] = "none"
+            self.headers["content-encoding"] = variant.encoding
+        await super().__call__(scope, receive, send)
+
+
+class CompressedStaticFiles(StaticFiles):
+    """
+    支持压缩变体和缓存头部的静态文件应用。
+    """
+
+    def __init__(self, *args, cache_control: Optional[str] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        if status_code != 200:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        full_path = os.fspath(full_path)
+        headers = {}
+        if self.cache_control:
+            headers["cache-control"] = self.cache_control
+        response_class = RangeFileResponse
+        if variant_cache.is_candidate(full_path, stat_result):
+            headers["vary"] = "Accept-Encoding"
+            if Headers(scope=scope).get("range") is None:
+                response_class = NegotiatedFileResponse
+
+        return response_class(
+            path=full_path,
+            media_type=guess_type(full_path)[0] or "text/plain",
+            stat_result=stat_result,
+            headers=headers,
+        )
@@ -0,0 +1,205 @@
+"""
+请求耗时分解模块
+
+为每个请求记录各阶段的耗时：JWT 解码、令牌查询、数据库语句、存储的文件系统操作，
+以及响应数据的发送。结果通过两种方式输出：
+
+- `Server-Timing` 响应头部，浏览器开发者工具可以直接显示。头部随响应开始一起发送，
+  因此只包含开始发送响应之前的阶段（`app` 为到开始发送响应为止的总耗时）。
+- 结构化的追踪记录（一行 JSON，写入 `secure_drop.trace` 日志），包含响应发送阶段；
+  只记录总耗时超过 `TRACE_RECORD_THRESHOLD_MS` 的请求。
+
+当前请求的追踪对象保存在 contextvar 中，依赖项、线程池中的同步代码和响应的子任务
+都能访问到。请求之外（后台任务、命令行脚本）调用 `span` 时不做任何事。
+各阶段的耗时可能互相重叠，例如令牌查询包含其中的数据库语句。
+"""
+import contextlib
+import re
+import time
+import uuid
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from utils.config import settings
+from utils.logger import JsonMessage, log, set_context_provider
+from utils.profiler import slow_request_profiler
+
+# 阶段名称（也是 Server-Timing 中的指标名）
+PHASE_JWT = "jwt"
+PHASE_TOKEN = "token"
+PHASE_DB = "db"
+PHASE_STORAGE = "storage"
+PHASE_STREAM = "stream"
+PHASE_APP = "app"
+
+# 客户端传入的请求 ID 只接受这种格式，其他情况重新生成
+REQUEST_ID_PATTERN = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+trace_log = log.getChild("trace")
+
+
+class Trace:
+    """
+    一个请求的追踪信息。`phases` 为 {阶段名: [累计耗时（秒）, 次数]}。
+    """
+    __slots__ = ("request_id", "token_id", "phases")
+
+    def __init__(self, request_id: str):
+        self.request_id = request_id
+        self.token_id: Optional[int] = None
+        self.phases: Dict[str, List[float]] = {}
+
+    def add(self, name: str, elapsed: float):
+        phase = self.phases.get(name)
+        if phase is None:
+            self.phases[name] = [elapsed, 1]
+        else:
+            phase[0] += elapsed
+            phase[1] += 1
+
+    def server_timing(self, app_elapsed: float) -> str:
+        """
+        生成 `Server-Timing` 头部的值（毫秒）。
+        """
+        parts = [f"{name};dur={phase[0] * 1000:.2f}" for name, phase in self.phases.items()]
+        parts.append(f"{PHASE_APP};dur={app_elapsed * 1000:.2f}")
+        return ", ".join(parts)
+
+    def phase_summary(self) -> Dict[str, dict]:
+        return {
+            name: {"ms": round(phase[0] * 1000, 3), "count": phase[1]}
+            for name, phase in self.phases.items()
+        }
+
+
+_current_trace: ContextVar[Optional[Trace]] = ContextVar("secure_drop_trace", default=None)
+
+_NULL_SPAN = contextlib.nullcontext()
+
+
+class _Span:
+    __slots__ = ("_trace", "_name", "_start")
+
+    def __init__(self, trace: Trace, name: str):
+        self._trace = trace
+        self._name = name
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._trace.add(self._name, time.perf_counter() - self._start)
+
+
+def span(name: str):
+    """
+    计时一个阶段::
+
+        with span(PHASE_STORAGE):
+            os.replace(src, dst)
+
+    不在请求中时返回一个空的上下文管理器。
+    """
+    trace = _current_trace.get()
+    return _NULL_SPAN if trace is None else _Span(trace, name)
+
+
+def add_phase(name: str, elapsed: float):
+    """
+    把一段已经测得的耗时计入当前请求的某个阶段。
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(name, elapsed)
+
+
+def current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+
+def _log_context():
+    trace = _current_trace.get()
+    return (trace.request_id, trace.token_id) if trace is not None else None
+
+
+set_context_provider(_log_context)
+
+
+def tag_token(token_id: int):
+    """
+    在当前请求的追踪信息中记录令牌 ID。
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.token_id = token_id
+
+
+class TracingMiddleware:
+    """
+    为每个请求创建追踪对象的 ASGI 中间件。
+
+    添加 `Server-Timing` 和 `X-Request-ID` 响应头部，请求结束后按阈值输出追踪记录，
+    并把请求交给慢请求采样分析器（未启用时不做任何事）。
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+        self.record_threshold = settings.TRACE_RECORD_THRESHOLD_MS / 1000
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex[:16]
+
+        trace = Trace(request_id)
+        token = _current_trace.set(trace)
+        start = time.perf_counter()
+        response_start = None
+        status_code = 500
+        profile = slow_request_profiler.request_started()
+
+        async def send_wrapper(message: Message):
+            nonlocal response_start, status_code
+            if message["type"] == "http.response.start":
+                response_start = time.perf_counter()
+                status_code = message["status"]
+                headers = MutableHeaders(scope=message)
+                headers.append("server-timing", trace.server_timing(response_start - start))
+                headers.append("x-request-id", request_id)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            end = time.perf_counter()
+            _current_trace.reset(token)
+            if response_start is not None:
+                trace.add(PHASE_STREAM, end - response_start)
+            handler_end = response_start if response_start is not None else end
+            log_record = end - start >= self.record_threshold
+            if log_record or profile:
+                record = {
+                    "request_id": request_id,
+                    "method": scope["method"],
+                    "route": getattr(scope.get("route"), "path", None),
+                    "path": scope["path"],
+                    "status": status_code,
+                    "token_id": trace.token_id,
+                    "duration_ms": round((end - start) * 1000, 3),
+                    PHASE_APP + "_ms": round((handler_end - start) * 1000, 3),
+                    "phases": trace.phase_summary(),
+                }
+                if log_record:
+                    trace_log.info(JsonMessage(record))
+                if profile:
+                    slow_request_profiler.request_finished(record, start, handler_end)
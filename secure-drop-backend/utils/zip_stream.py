@@ -0,0 +1,260 @@
+"""
+ZIP 流式打包模块
+
+边读取文件边生成 ZIP 归档，不使用临时文件，内存占用与文件数量和大小无关
+（只有中央目录按每个条目保存几十个字节）。
+
+- 每个条目的 CRC 和大小在写完数据后通过数据描述符（data descriptor）给出，
+  因此无需预先读一遍文件。
+- 条目大小或偏移量超过 4 GiB、条目数超过 65535 时自动使用 ZIP64 扩展。
+- 已经压缩过的格式（图片、视频、压缩包等）使用 store 方法原样存储，
+  其他文件使用 deflate 压缩；读取和压缩都在线程中执行，不阻塞事件循环。
+"""
+import contextlib
+import os
+import struct
+import time
+import zlib
+from typing import AsyncIterator, Iterable, NamedTuple, Optional, Tuple
+import anyio
+from utils.compression import PRECOMPRESSED_EXTENSIONS
+from utils.file_response import CHUNK_SIZE, Throttle
+from utils.logger import log
+from utils.metrics import TransferMeter
+
+# 压缩方法
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+
+# 通用标志位：bit 3 表示 CRC 和大小写在数据描述符中，bit 11 表示文件名使用 UTF-8
+FLAG_DATA_DESCRIPTOR = 0x08
+FLAG_UTF8 = 0x800
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+# deflate 的输出最多比输入略大，原始大小接近 4 GiB 时就提前使用 ZIP64
+ZIP64_SIZE_THRESHOLD = ZIP64_LIMIT - 16 * 1024 * 1024
+
+VERSION_DEFAULT = 20
+VERSION_ZIP64 = 45
+# 高字节 3 表示 Unix，外部属性中保存的是 Unix 权限
+VERSION_MADE_BY = (3 << 8) | VERSION_ZIP64
+
+DEFLATE_LEVEL = 6
+
+class ZipEntry(NamedTuple):
+    # 归档中的文件名
+    name: str
+    # 文件的物理路径
+    path: str
+
+
+class _CentralRecord(NamedTuple):
+    name: bytes
+    method: int
+    dos_time: int
+    dos_date: int
+    crc: int
+    compressed_size: int
+    uncompressed_size: int
+    offset: int
+    zip64: bool
+
+
+def compression_method(filename: str) -> int:
+    """
+    根据扩展名选择压缩方法：已压缩的格式使用 store，其他使用 deflate。
+    """
+    return ZIP_STORED if os.path.splitext(filename)[1].lower() in PRECOMPRESSED_EXTENSIONS else ZIP_DEFLATED
+
+
+def _dos_datetime(timestamp: float) -> Tuple[int, int]:
+    t = time.localtime(timestamp)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    dos_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+    dos_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+    return dos_time, dos_date
+
+
+def _local_header(name: bytes, method: int, dos_time: int, dos_date: int, zip64: bool) -> bytes:
+    extra = struct.pack("<HHQQ", 0x0001, 16, 0, 0) if zip64 else b""
+    size_placeholder = ZIP64_LIMIT if zip64 else 0
+    return struct.pack(
+        "<IHHHHHIIIHH",
+        0x04034B50,
+        VERSION_ZIP64 if zip64 else VERSION_DEFAULT,
+        FLAG_DATA_DESCRIPTOR | FLAG_UTF8,
+        method,
+        dos_time,
+        dos_date,
+        0,
+        size_placeholder,
+        size_placeholder,
+        len(name),
+        len(extra),
+    ) + name + extra
+
+
+def _data_descriptor(crc: int, compressed_size: int, uncompressed_size: int, zip64: bool) -> bytes:
+    if zip64:
+        return struct.pack("<IIQQ", 0x08074B50, crc, compressed_size, uncompressed_size)
+    return struct.pack("<IIII", 0x08074B50, crc, compressed_size, uncompressed_size)
+
+
+def _central_header(record: _CentralRecord) -> bytes:
+    extra_fields = []
+    uncompressed_size, compressed_size, offset = (
+        record.uncompressed_size, record.compressed_size, record.offset
+    )
+    # ZIP64 扩展字段只包含超出 32 位的值，顺序固定
+    if uncompressed_size >= ZIP64_LIMIT:
+        extra_fields.append(uncompressed_size)
+        uncompressed_size = ZIP64_LIMIT
+    if compressed_size >= ZIP64_LIMIT:
+        extra_fields.append(compressed_size)
+        compressed_size = ZIP64_LIMIT
+    if offset >= ZIP64_LIMIT:
+        extra_fields.append(offset)
+        offset = ZIP64_LIMIT
+    extra = b""
+    if extra_fields:
+        extra = struct.pack(f"<HH{len(extra_fields)}Q", 0x0001, 8 * len(extra_fields), *extra_fields)
+    zip64 = record.zip64 or bool(extra_fields)
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50,
+        VERSION_MADE_BY,
+        VERSION_ZIP64 if zip64 else VERSION_DEFAULT,
+        FLAG_DATA_DESCRIPTOR | FLAG_UTF8,
+        record.method,
+        record.dos_time,
+        record.dos_date,
+        record.crc,
+        compressed_size,
+        uncompressed_size,
+        len(record.name),
+        len(extra),
+        0,
+        0,
+        0,
+        (0o100644 & 0xFFFF) << 16,
+        offset,
+    ) + record.name + extra
+
+
+def _end_records(count: int, cd_size: int, cd_offset: int) -> bytes:
+    records = b""
+    if count >= ZIP64_COUNT_LIMIT or cd_size >= ZIP64_LIMIT or cd_offset >= ZIP64_LIMIT:
+        zip64_end_offset = cd_offset + cd_size
+        records += struct.pack(
+            "<IQHHIIQQQQ",
+            0x06064B50, 44, VERSION_MADE_BY, VERSION_ZIP64, 0, 0, count, count, cd_size, cd_offset,
+        )
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_end_offset, 1)
+    records += struct.pack(
+        "<IHHHHIIH",
+        0x06054B50,
+        0,
+        0,
+        min(count, ZIP64_COUNT_LIMIT),
+        min(count, ZIP64_COUNT_LIMIT),
+        min(cd_size, ZIP64_LIMIT),
+        min(cd_offset, ZIP64_LIMIT),
+        0,
+    )
+    return records
+
+
+def _read_chunk(file, compressor, crc: int, remaining: int) -> Tuple[int, bytes, int, bool]:
+    """
+    读取最多 `remaining` 字节的一块数据并更新 CRC、压缩（在线程中执行）。
+    读到最后一块时一并输出压缩器中剩余的数据，小文件只需要一次线程切换。
+
+    Returns:
+        (读取的字节数, 要输出的数据, 新的 CRC, 是否已读完)
+    """
+    data = file.read(min(CHUNK_SIZE, remaining)) if remaining > 0 else b""
+    crc = zlib.crc32(data, crc)
+    done = not data or len(data) >= remaining
+    if compressor is None:
+        return len(data), data, crc, done
+    output = compressor.compress(data)
+    if done:
+        output += compressor.flush()
+    return len(data), output, crc, done
+
+
+async def stream_zip(
+    entries: Iterable[ZipEntry],
+    throttle: Optional[Throttle] = None,
+    meter: Optional[TransferMeter] = None,
+) -> AsyncIterator[bytes]:
+    """
+    逐块生成包含给定文件的 ZIP 归档。
+
+    每个文件只打包打开时的大小，打包过程中被追加的内容不会写入；
+    打包过程中消失或无法读取的文件会被跳过。提供 `throttle` 时，
+    每块输出数据在交给调用方之前先经过限速器；提供 `meter` 时统计输出的字节数。
+    """
+    with meter if meter is not None else contextlib.nullcontext():
+        async for data in _stream_zip(entries):
+            if throttle is not None:
+                await throttle.consume(len(data))
+            if meter is not None:
+                meter.add(len(data))
+            yield data
+
+
+async def _stream_zip(entries: Iterable[ZipEntry]) -> AsyncIterator[bytes]:
+    offset = 0
+    records = []
+
+    for entry in entries:
+        try:
+            file = await anyio.to_thread.run_sync(open, entry.path, "rb")
+        except OSError as e:
+            log.warning("打包时无法读取文件，已跳过: %s (%s)", entry.path, e)
+            continue
+        try:
+            st = os.fstat(file.fileno())
+            name = entry.name.encode("utf-8")
+            method = compression_method(entry.name)
+            zip64 = st.st_size >= ZIP64_SIZE_THRESHOLD or offset >= ZIP64_LIMIT
+            dos_time, dos_date = _dos_datetime(st.st_mtime)
+            compressor = (
+                zlib.compressobj(DEFLATE_LEVEL, zlib.DEFLATED, -zlib.MAX_WBITS)
+                if method == ZIP_DEFLATED else None
+            )
+
+            header = _local_header(name, method, dos_time, dos_date, zip64)
+            entry_offset = offset
+            offset += len(header)
+            yield header
+
+            crc = 0
+            uncompressed_size = 0
+            compressed_size = 0
+            while True:
+                nread, output, crc, done = await anyio.to_thread.run_sync(
+                    _read_chunk, file, compressor, crc, st.st_size - uncompressed_size
+                )
+                uncompressed_size += nread
+                if output:
+                    compressed_size += len(output)
+                    yield output
+                if done:
+                    break
+        finally:
+            file.close()
+
+        descriptor = _data_descriptor(crc, compressed_size, uncompressed_size, zip64)
+        offset += compressed_size + len(descriptor)
+        yield descriptor
+        records.append(_CentralRecord(
+            name, method, dos_time, dos_date, crc, compressed_size, uncompressed_size, entry_offset, zip64
+        ))
+
+    cd_offset = offset
+    central_directory = b"".join(_central_header(record) for record in records)
+    yield central_directory + _end_records(len(records), len(central_directory), cd_offset)
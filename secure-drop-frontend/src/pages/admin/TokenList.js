@@ -1,28 +1,43 @@
 import React, { useState, useEffect, useCallback } from 'react';
-import { Table, Button, Space, Popconfirm, message, Tag } from 'antd';
+import { Table, Button, Space, Popconfirm, message, Tag, Select, Input } from 'antd';
 import { PlusOutlined, EditOutlined, DeleteOutlined, StopOutlined } from '@ant-design/icons';
 import apiClient from '../../api';
 import TokenForm from './TokenForm'; // 稍后创建
 
+const STATUS_OPTIONS = ['unused', 'active', 'exhausted', 'expired', 'revoked'].map(value => ({
+  label: value.toUpperCase(),
+  value,
+}));
+
 const TokenList = () => {
   const [tokens, setTokens] = useState([]);
   const [loading, setLoading] = useState(false);
-  const [pagination, setPagination] = useState({
-    current: 1,
-    pageSize: 10,
-    total: 0,
-  });
+  const [total, setTotal] = useState(0);
+  const [pageSize, setPageSize] = useState(10);
+  // cursors[i] 是第 i + 1 页的游标，第一页没有游标
+  const [cursors, setCursors] = useState([null]);
+  const [pageIndex, setPageIndex] = useState(0);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [filters, setFilters] = useState({ status: [], q: '' });
   const [isModalVisible, setIsModalVisible] = useState(false);
   const [editingToken, setEditingToken] = useState(null);
 
-  // fetchTokens 现在是一个纯粹的工具函数，不依赖任何组件状态
-  const fetchTokens = useCallback(async (page, pageSize) => {
+  // 使用键集分页：每页携带上一页返回的游标，翻页代价与页码无关
+  const fetchTokens = useCallback(async (cursor, limit, currentFilters) => {
     setLoading(true);
     try {
-      const response = await apiClient.get(`/admin/tokens?page=${page}&limit=${pageSize}`);
+      const params = { limit };
+      if (cursor) params.cursor = cursor;
+      if (currentFilters.status.length) params.status = currentFilters.status;
+      if (currentFilters.q) params.q = currentFilters.q;
+      const response = await apiClient.get('/admin/tokens', {
+        params,
+        // 数组参数序列化为 status=a&status=b
+        paramsSerializer: { indexes: null },
+      });
       setTokens(response.data.items);
-      // 直接使用返回的总数更新分页状态
-      setPagination(prev => ({ ...prev, total: response.data.total, current: page, pageSize: pageSize }));
+      setTotal(response.data.total);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
       message.error('获取令牌列表失败');
     } finally {
@@ -30,18 +45,37 @@ const TokenList = () => {
     }
   }, []); // 依赖项为空，此函数只创建一次
 
-  // useEffect 只在分页的 current 或 pageSize 变化时触发
+  const currentCursor = cursors[pageIndex];
+
   useEffect(() => {
-    fetchTokens(pagination.current, pagination.pageSize);
-  }, [pagination.current, pagination.pageSize, fetchTokens]);
-
-  // handleTableChange 只负责更新分页状态，useEffect 会自动响应变化
-  const handleTableChange = (newPagination) => {
-    setPagination(prev => ({
-      ...prev,
-      current: newPagination.current,
-      pageSize: newPagination.pageSize,
-    }));
+    fetchTokens(currentCursor, pageSize, filters);
+  }, [currentCursor, pageSize, filters, fetchTokens]);
+
+  const refresh = () => fetchTokens(currentCursor, pageSize, filters);
+
+  // 筛选条件或每页数量变化时回到第一页
+  const resetPaging = () => {
+    setCursors([null]);
+    setPageIndex(0);
+  };
+
+  const handleFilterChange = (changes) => {
+    resetPaging();
+    setFilters(prev => ({ ...prev, ...changes }));
+  };
+
+  const handlePageSizeChange = (value) => {
+    resetPaging();
+    setPageSize(value);
+  };
+
+  const handleNextPage = () => {
+    setCursors(prev => [...prev.slice(0, pageIndex + 1), nextCursor]);
+    setPageIndex(pageIndex + 1);
+  };
+
+  const handlePrevPage = () => {
+    setPageIndex(pageIndex - 1);
   };
 
   const handleDelete = async (tokenId) => {
@@ -49,7 +83,7 @@ const TokenList = () => {
       await apiClient.delete(`/admin/tokens/${tokenId}`);
       message.success('令牌删除成功');
       // 操作成功后，重新获取当前页的数据
-      fetchTokens(pagination.current, pagination.pageSize);
+      refresh();
     } catch (error) {
       message.error('删除失败');
     }
@@ -70,7 +104,7 @@ const TokenList = () => {
       await apiClient.post(`/admin/tokens/${tokenId}/revoke`);
       message.success('令牌撤销成功');
       // 操作成功后，重新获取当前页的数据
-      fetchTokens(pagination.current, pagination.pageSize);
+      refresh();
     } catch (error) {
       message.error('撤销失败');
     }
@@ -114,22 +148,48 @@ const TokenList = () => {
 
   return (
     <>
-      <Button
-        type="primary"
-        icon={<PlusOutlined />}
-        style={{ marginBottom: 16 }}
-        onClick={() => handleCreate()}
-      >
-        创建新令牌
-      </Button>
+      <Space style={{ marginBottom: 16 }} wrap>
+        <Button
+          type="primary"
+          icon={<PlusOutlined />}
+          onClick={() => handleCreate()}
+        >
+          创建新令牌
+        </Button>
+        <Select
+          mode="multiple"
+          allowClear
+          placeholder="按状态筛选"
+          style={{ minWidth: 200 }}
+          options={STATUS_OPTIONS}
+          value={filters.status}
+          onChange={(value) => handleFilterChange({ status: value })}
+        />
+        <Input.Search
+          allowClear
+          placeholder="搜索备注或令牌字符串"
+          style={{ width: 260 }}
+          onSearch={(value) => handleFilterChange({ q: value.trim() })}
+        />
+      </Space>
       <Table
         columns={columns}
         dataSource={tokens}
         rowKey="id"
         loading={loading}
-        pagination={pagination}
-        onChange={handleTableChange}
+        pagination={false}
       />
+      <Space style={{ marginTop: 16, display: 'flex', justifyContent: 'flex-end' }}>
+        <span>共 {total} 个令牌</span>
+        <Select
+          value={pageSize}
+          onChange={handlePageSizeChange}
+          options={[10, 20, 50, 100].map(value => ({ label: `${value} 条/页`, value }))}
+        />
+        <Button onClick={handlePrevPage} disabled={pageIndex === 0 || loading}>上一页</Button>
+        <span>第 {pageIndex + 1} 页</span>
+        <Button onClick={handleNextPage} disabled={!nextCursor || loading}>下一页</Button>
+      </Space>
       <TokenForm
         visible={isModalVisible}
         onCancel={() => {
@@ -140,7 +200,7 @@ const TokenList = () => {
           setIsModalVisible(false);
           setEditingToken(null);
           // 操作成功后，重新获取当前页的数据
-          fetchTokens(pagination.current, pagination.pageSize);
+          refresh();
         }}
         token={editingToken}
       />
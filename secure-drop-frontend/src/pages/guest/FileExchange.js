@@ -1,4 +1,4 @@
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useCallback } from 'react';
 import { useNavigate } from 'react-router-dom';
 import {
   Layout,
@@ -25,8 +25,26 @@ const FileExchange = () => {
   const navigate = useNavigate();
   const [policy, setPolicy] = useState(null);
   const [downloadableFiles, setDownloadableFiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [loadingFiles, setLoadingFiles] = useState(false);
   const [uploading, setUploading] = useState(false);
 
+  const fetchFiles = useCallback(async (cursor) => {
+    setLoadingFiles(true);
+    try {
+      const response = await apiClient.get('/guest/files', {
+        params: cursor ? { cursor } : {},
+      });
+      const { items, next_cursor } = response.data;
+      setDownloadableFiles(prev => (cursor ? [...prev, ...items] : items));
+      setNextCursor(next_cursor);
+    } catch (error) {
+      message.error('获取可下载文件列表失败。');
+    } finally {
+      setLoadingFiles(false);
+    }
+  }, []);
+
   useEffect(() => {
     const storedPolicy = localStorage.getItem('guest_policy');
     if (!storedPolicy) {
@@ -38,17 +56,20 @@ const FileExchange = () => {
     setPolicy(parsedPolicy);
 
     if (parsedPolicy.allow_download) {
-      const fetchFiles = async () => {
-        try {
-          const response = await apiClient.get('/guest/files');
-          setDownloadableFiles(response.data);
-        } catch (error) {
-          message.error('获取可下载文件列表失败。');
-        }
-      };
-      fetchFiles();
+      fetchFiles(null);
     }
-  }, [navigate]);
+  }, [navigate, fetchFiles]);
+
+  const formatSize = (bytes) => {
+    const units = ['B', 'KB', 'MB', 'GB', 'TB'];
+    let size = bytes;
+    let unit = 0;
+    while (size >= 1024 && unit < units.length - 1) {
+      size /= 1024;
+      unit += 1;
+    }
+    return `${unit === 0 ? size : size.toFixed(1)} ${units[unit]}`;
+  };
 
   const draggerProps = useMemo(() => {
     if (!policy) return {};
@@ -58,7 +79,8 @@ const FileExchange = () => {
     return {
       name: 'file',
       multiple: true,
-      action: `${apiClient.defaults.baseURL}/guest/upload`,
+      // 预先声明文件名，让服务器在接收文件内容之前完成类型检查
+      action: (file) => `${apiClient.defaults.baseURL}/guest/upload?filename=${encodeURIComponent(file.name)}`,
       headers: {
         Authorization: `Bearer ${localStorage.getItem('guest_session_token')}`,
       },
@@ -85,29 +107,34 @@ const FileExchange = () => {
     };
   }, [policy]);
 
-  const handleDownload = (filename) => {
-    // apiClient.defaults.baseURL 已经是 /api，所以我们拼接 guest/download/...
-    const url = `/api/guest/download/${filename}`;
-    const token = localStorage.getItem('guest_session_token');
-    
-    fetch(url, {
-      headers: { 'Authorization': `Bearer ${token}` }
-    })
-    .then(res => {
-      if (!res.ok) throw new Error('下载失败');
-      return res.blob();
-    })
-    .then(blob => {
-      const href = window.URL.createObjectURL(blob);
-      const link = document.createElement('a');
-      link.href = href;
-      link.setAttribute('download', filename);
-      document.body.appendChild(link);
-      link.click();
-      document.body.removeChild(link);
-      window.URL.revokeObjectURL(href);
-    })
-    .catch(err => message.error(err.message));
+  const openLink = (url, filename) => {
+    const link = document.createElement('a');
+    link.href = url;
+    link.setAttribute('download', filename);
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+  };
+
+  const handleDownload = async (filename) => {
+    // 申请一个签名下载链接，由浏览器直接下载：边下载边保存，支持暂停和续传，
+    // 不需要先把整个文件读进内存
+    try {
+      const response = await apiClient.post('/guest/download-links', { filenames: [filename] });
+      openLink(response.data.links[0].url, filename);
+    } catch (error) {
+      message.error(error.response?.data?.detail || '下载失败');
+    }
+  };
+
+  const handleDownloadAll = async () => {
+    // 服务器把整个下载目录实时打包成一个 ZIP；同样通过签名链接交给浏览器直接保存到磁盘
+    try {
+      const response = await apiClient.post('/guest/download-archive-link');
+      openLink(response.data.url, response.data.filename);
+    } catch (error) {
+      message.error(error.response?.data?.detail || '下载失败');
+    }
   };
 
   if (!policy) {
@@ -136,14 +163,28 @@ const FileExchange = () => {
           )}
           {policy.allow_download && (
             <Col xs={24} md={policy.allow_upload ? 12 : 24}>
-              <Card title="下载文件">
+              <Card
+                title="下载文件"
+                extra={downloadableFiles.length > 0 && (
+                  <Button icon={<DownloadOutlined />} onClick={handleDownloadAll}>全部打包下载</Button>
+                )}
+              >
                 <List
                   dataSource={downloadableFiles}
+                  loading={loadingFiles}
+                  loadMore={nextCursor && (
+                    <div style={{ textAlign: 'center', marginTop: 12 }}>
+                      <Button onClick={() => fetchFiles(nextCursor)} disabled={loadingFiles}>加载更多</Button>
+                    </div>
+                  )}
                   renderItem={(item) => (
                     <List.Item
-                      actions={[<Button icon={<DownloadOutlined />} onClick={() => handleDownload(item)}>下载</Button>]}
+                      actions={[<Button icon={<DownloadOutlined />} onClick={() => handleDownload(item.name)}>下载</Button>]}
                     >
-                      <List.Item.Meta title={item} />
+                      <List.Item.Meta
+                        title={item.name}
+                        description={`${formatSize(item.size)} · ${new Date(item.modified_at).toLocaleString()}`}
+                      />
                     </List.Item>
                   )}
                 />